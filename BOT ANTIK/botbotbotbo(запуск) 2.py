@@ -1,4 +1,10 @@
+import time
+
+_PROCESS_STARTED_AT = time.perf_counter()
+
 import os
+import sys
+import argparse
 import random
 import string
 import logging
@@ -7,15 +13,14 @@ import json
 import shutil
 import zipfile
 import math
-import io
+import hashlib
 import copy
 import statistics
 from pathlib import Path
 from dataclasses import dataclass, field
 from enum import Enum, auto
 from sqlite3 import IntegrityError
-from typing import Dict, Any, List, Optional, Set, Tuple, Union, Sequence
-from PIL import Image, ImageOps
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple, Union, Sequence
 from telegram import (
     Update,
     ReplyKeyboardMarkup,
@@ -37,28 +42,25 @@ from telegram.ext import (
     filters,
     CallbackContext,
     ConversationHandler,
-    CallbackQueryHandler
+    CallbackQueryHandler,
+    TypeHandler,
 )
 from telegram.error import RetryAfter, TimedOut, NetworkError, TelegramError
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from calendar import monthrange
-from docx import Document
-from docx.shared import Inches
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
-import time
+import sqlite3
+import tempfile
 import asyncio
 import nest_asyncio
 import aiosqlite
-from openpyxl import Workbook, load_workbook
-import matplotlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from gettext import gettext as _
 
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
 from logging.handlers import RotatingFileHandler
 
+import chart_render
+
 # Применяем nest_asyncio для возможности вложенного запуска цикла событий
 nest_asyncio.apply()
 
@@ -87,8 +89,10 @@ ARCHIVE_INDEX_FILE = ARCHIVE_DIR / "index.json"
 ADMIN_FILE = Path("config") / "admins.json"
 DATABASE_FILE = Path("user_data.db")
 EXCEL_FILE = Path("conclusions.xlsx")
+EXCEL_BACKFILL_MARKER = Path("completions_excel_backfill.json")
 LOG_DIR = Path("logs")
 LOG_FILE = LOG_DIR / "bot.log"
+LOG_BACKUP_COUNT: int = 5
 BACKUP_ROOT = Path("backups")
 MAX_PHOTOS: int = 30
 MAX_PHOTO_SIZE_MB: int = 5
@@ -108,7 +112,10 @@ PROGRESS_STEPS: Dict[str, int] = {
 }
 # вычисляем верхнюю границу для отображения прогресса
 TOTAL_STEPS: int = max(PROGRESS_STEPS.values())
-PREVIEW_MAX_ITEMS: int = 2
+PREVIEW_MEDIA_GROUP_SIZE: int = 10
+PREVIEW_THUMB_SIZE: int = 320
+# Поля предпросмотра живут только в черновике и не попадают в completions и архив
+PREVIEW_ITEM_FIELDS = ("thumb", "thumb_file_id")
 NETWORK_RECOVERY_INTERVAL: float = 45.0
 MAX_PENDING_RESENDS: int = 20
 MENU_BUTTON_LABEL = "/menu 📋"
@@ -123,6 +130,8 @@ PROGRESS_BAR_SEGMENTS = 5
 PROGRESS_SYMBOL_FILLED = "●"
 PROGRESS_SYMBOL_EMPTY = "○"
 VOID_CALLBACK_PREFIX = "void:"
+VOID_CONFIRM_PREFIX = "voidok:"
+VOID_BATCH_KEY = "void_batch"
 CONFIRM_CALLBACK_PREFIX = "confirm:"
 MODE_CALLBACK_PREFIX = "mode:"
 ADD_PHOTO_PREFIX = "photo:"
@@ -587,7 +596,7 @@ def setup_logging(level: int = logging.INFO) -> None:
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
 
-    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=2_000_000, backupCount=5, encoding="utf-8")
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=2_000_000, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
     file_handler.setFormatter(formatter)
 
     root_logger.addHandler(console_handler)
@@ -601,6 +610,8 @@ logger = logging.getLogger(__name__)
 db_lock = asyncio.Lock()
 excel_lock = asyncio.Lock()
 archive_lock = asyncio.Lock()
+# Одна резервная копия за раз: снимок, упаковка и отметка отправленных чанков
+backup_lock = asyncio.Lock()
 admin_ids: Set[int] = set()
 network_recovery_lock = asyncio.Lock()
 network_recovery_pending: Dict[int, Dict[str, Any]] = {}
@@ -721,9 +732,43 @@ async def error_handler(update: object, context: CallbackContext) -> None:
     logger.error("Ошибка при обработке обновления:", exc_info=err)
 
 # -------------------- Работа с базой данных (aiosqlite) --------------------
+# Вторичные индексы completions: офлайн-импорт из CLI снимает их на время загрузки.
+COMPLETIONS_INDEXES: Dict[str, str] = {
+    "idx_completions_user_date": "CREATE INDEX IF NOT EXISTS idx_completions_user_date ON completions(user_id, completed_at)",
+    "idx_completions_completed_at": "CREATE INDEX IF NOT EXISTS idx_completions_completed_at ON completions(completed_at)",
+    # Поиск по билету: точное совпадение и префикс по ticket_number, суффикс — по
+    # перевёрнутой строке ticket_reversed. Оба индекса частичные и содержат только живые записи.
+    "idx_completions_ticket_live": (
+        "CREATE INDEX IF NOT EXISTS idx_completions_ticket_live "
+        "ON completions(ticket_number) WHERE is_deleted = 0"
+    ),
+    "idx_completions_ticket_reversed": (
+        "CREATE INDEX IF NOT EXISTS idx_completions_ticket_reversed "
+        "ON completions(ticket_reversed) WHERE is_deleted = 0"
+    ),
+    "idx_completions_issue": "CREATE INDEX IF NOT EXISTS idx_completions_issue ON completions(issue_number)",
+    "idx_completions_live_history": (
+        "CREATE INDEX IF NOT EXISTS idx_completions_live_history "
+        "ON completions(completed_at, id) WHERE is_deleted = 0"
+    ),
+    "idx_completions_group_message": (
+        "CREATE INDEX IF NOT EXISTS idx_completions_group_message "
+        "ON completions(group_chat_id, group_message_id)"
+    ),
+    "idx_completions_date_region": (
+        "CREATE INDEX IF NOT EXISTS idx_completions_date_region "
+        "ON completions(date_iso, region, is_deleted, item_count, total_evaluation)"
+    ),
+}
+
 db: aiosqlite.Connection = None
 
 
+def _reverse_ticket(ticket_number: Any) -> Optional[str]:
+    text = str(ticket_number).strip() if ticket_number is not None else ""
+    return text[::-1] or None
+
+
 def _is_db_ready() -> bool:
     if db is None:
         logger.error("База данных не инициализирована. Вызов init_db() ещё не выполнен.")
@@ -786,6 +831,12 @@ async def init_db() -> None:
         updated_at TEXT NOT NULL,
         metrics TEXT
     )''')
+    await db.execute('''CREATE TABLE IF NOT EXISTS draft_photos (
+        user_id INTEGER NOT NULL,
+        idx INTEGER NOT NULL,
+        item TEXT NOT NULL,
+        PRIMARY KEY (user_id, idx)
+    )''')
     await db.execute('''CREATE TABLE IF NOT EXISTS user_flags (
         user_id INTEGER PRIMARY KEY,
         is_blocked INTEGER DEFAULT 0,
@@ -810,11 +861,28 @@ async def init_db() -> None:
         "deleted_at": "TEXT",
         "deleted_by": "INTEGER",
         "deletion_note": "TEXT",
+        "date_iso": "TEXT",
+        "ticket_reversed": "TEXT",
     })
-    await db.execute('CREATE INDEX IF NOT EXISTS idx_completions_user_date ON completions(user_id, completed_at)')
-    await db.execute('CREATE INDEX IF NOT EXISTS idx_completions_completed_at ON completions(completed_at)')
-    await db.execute('CREATE INDEX IF NOT EXISTS idx_completions_ticket ON completions(ticket_number)')
-    await db.execute('CREATE INDEX IF NOT EXISTS idx_completions_issue ON completions(issue_number)')
+    await db.execute("UPDATE completions SET is_deleted = 0 WHERE is_deleted IS NULL")
+    async with db.execute(
+        "SELECT id, ticket_number FROM completions WHERE ticket_reversed IS NULL AND ticket_number IS NOT NULL"
+    ) as cursor:
+        pending_tickets = await cursor.fetchall()
+    if pending_tickets:
+        await db.executemany(
+            "UPDATE completions SET ticket_reversed = ? WHERE id = ?",
+            [(_reverse_ticket(ticket), completion_id) for completion_id, ticket in pending_tickets],
+        )
+    await db.execute("DROP INDEX IF EXISTS idx_completions_ticket")
+    # Регион хранится без пробелов по краям, чтобы фильтр region = ? шёл по индексу
+    await db.execute("UPDATE completions SET region = TRIM(region) WHERE region <> TRIM(region)")
+    await db.execute(
+        "UPDATE completions SET date_iso = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2) "
+        "WHERE date_iso IS NULL AND date GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]'"
+    )
+    for index_ddl in COMPLETIONS_INDEXES.values():
+        await db.execute(index_ddl)
     await _ensure_table_columns("user_meta", {
         "recent_departments": "TEXT",
         "recent_regions": "TEXT",
@@ -825,11 +893,13 @@ async def init_db() -> None:
         "region": "TEXT",
     })
     await db.commit()
+    await load_user_flags_cache()
 
-async def close_db() -> None:
+async def close_db(_application: Optional[Application] = None) -> None:
     """Корректно закрывает соединение с БД при остановке бота."""
     global db
     if db:
+        await flush_all_drafts()
         await db.close()
         db = None
         logger.info("Соединение с базой данных закрыто.")
@@ -968,7 +1038,20 @@ def _conclusion_from_payload(payload: Dict[str, Any]) -> ConclusionData:
     )
 
 
+USER_META_CACHE_LIMIT: int = 2048
+user_meta_cache: Dict[int, Dict[str, Any]] = {}
+
+
+def _remember_user_meta(user_id: int, meta: Dict[str, Any]) -> None:
+    if user_id not in user_meta_cache and len(user_meta_cache) >= USER_META_CACHE_LIMIT:
+        user_meta_cache.pop(next(iter(user_meta_cache)))
+    user_meta_cache[user_id] = meta
+
+
 async def load_user_meta(user_id: int) -> Dict[str, Any]:
+    cached = user_meta_cache.get(user_id)
+    if cached is not None:
+        return copy.deepcopy(cached)
     if not _is_db_ready():
         return {}
     async with db_lock:
@@ -984,6 +1067,7 @@ async def load_user_meta(user_id: int) -> Dict[str, Any]:
             return {}
 
     if not row:
+        _remember_user_meta(user_id, {})
         return {}
 
     def _loads(blob: Optional[str]) -> List[Any]:
@@ -994,7 +1078,7 @@ async def load_user_meta(user_id: int) -> Dict[str, Any]:
         except json.JSONDecodeError:
             return []
 
-    return {
+    meta = {
         "department_number": row[0] or "",
         "region": row[1] or "",
         "issue_sequence": _safe_int(row[2]),
@@ -1003,6 +1087,8 @@ async def load_user_meta(user_id: int) -> Dict[str, Any]:
         "recent_regions": _loads(row[5]),
         "recent_pairs": _loads(row[6]),
     }
+    _remember_user_meta(user_id, meta)
+    return copy.deepcopy(meta)
 
 
 async def upsert_user_meta(user_id: int, **fields: Any) -> None:
@@ -1019,13 +1105,19 @@ async def upsert_user_meta(user_id: int, **fields: Any) -> None:
         "recent_pairs",
     }
     payload: Dict[str, Any] = {}
+    cached_fields: Dict[str, Any] = {}
     for key, value in fields.items():
         if key not in allowed or value is None:
             continue
         if key.startswith("recent_"):
             payload[key] = json.dumps(value, ensure_ascii=False)
+            cached_fields[key] = copy.deepcopy(value)
+        elif key == "issue_sequence":
+            payload[key] = value
+            cached_fields[key] = _safe_int(value)
         else:
             payload[key] = value
+            cached_fields[key] = value
 
     if not payload:
         return
@@ -1045,6 +1137,11 @@ async def upsert_user_meta(user_id: int, **fields: Any) -> None:
             await db.commit()
         except Exception as error:
             logger.error(f"Не удалось обновить user_meta для {user_id}: {error}")
+            user_meta_cache.pop(user_id, None)
+            return
+        cached = user_meta_cache.get(user_id)
+        if cached is not None:
+            cached.update(cached_fields)
 
 
 def _merge_recent(entries: List[str], new_value: str, limit: int = 5) -> List[str]:
@@ -1202,79 +1299,136 @@ def validate_conclusion_data(data: ConclusionData) -> List[str]:
     return errors
 
 
+DRAFT_SAVE_DELAY_SECONDS: float = 1.5
+_pending_draft_saves: Dict[int, Dict[str, Any]] = {}
+_draft_save_tasks: Dict[int, asyncio.Task] = {}
+_draft_written_digest: Dict[int, Tuple[Any, ...]] = {}
+_draft_written_photos: Dict[int, List[str]] = {}
+# Поколение черновика: clear_draft увеличивает его, и запись, начатая до
+# удаления, сверяет поколение под db_lock и не воскрешает удалённый черновик.
+_draft_generation: Dict[int, int] = {}
+
+
+def _forget_draft_digest(user_id: int) -> None:
+    _draft_written_digest.pop(user_id, None)
+    _draft_written_photos.pop(user_id, None)
+
+
 async def save_draft_snapshot(
     user_id: int,
     data: ConclusionData,
     next_state: Optional[DialogState],
     title: Optional[str] = None,
     metrics: Optional[Dict[str, Any]] = None,
+    generation: Optional[int] = None,
 ) -> None:
-    """Сохраняет промежуточные данные пользователя как черновик."""
+    """Сохраняет промежуточные данные пользователя как черновик.
+
+    Поля заключения хранятся в drafts, а каждый предмет — отдельной строкой
+    draft_photos, поэтому перезаписываются только изменившиеся предметы.
+    Если задан generation и черновик с тех пор удалён, запись пропускается.
+    """
     if not _is_db_ready():
         return
     if not isinstance(data, ConclusionData):
         return
 
     payload = data.to_dict()
+    photos = [
+        json.dumps(item, ensure_ascii=False, sort_keys=True)
+        for item in payload.pop("photo_desc", [])
+    ]
     state_value: Optional[str] = None
     if isinstance(next_state, DialogState):
         state_value = next_state.name
     elif isinstance(next_state, str):
         state_value = next_state
 
-    timestamp = _now_iso()
+    data_blob = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    metrics_blob = json.dumps(metrics, ensure_ascii=False, sort_keys=True) if metrics else None
+    # Метрики меняются на каждом шаге, поэтому в отпечаток не входят
+    digest = (data_blob, state_value, title, tuple(photos))
+    if _draft_written_digest.get(user_id) == digest:
+        return
 
-    metrics_blob = json.dumps(metrics, ensure_ascii=False) if metrics else None
+    previous_photos = _draft_written_photos.get(user_id)
+    if previous_photos is None:
+        changed_photos = list(enumerate(photos))
+    else:
+        changed_photos = [
+            (idx, item)
+            for idx, item in enumerate(photos)
+            if idx >= len(previous_photos) or previous_photos[idx] != item
+        ]
+    trim_photos = previous_photos is None or len(previous_photos) > len(photos)
 
+    timestamp = _now_iso()
     async with db_lock:
-        existing_row = None
-        try:
-            async with db.execute(
-                "SELECT created_at, title FROM drafts WHERE user_id = ?",
-                (user_id,),
-            ) as cursor:
-                existing_row = await cursor.fetchone()
-        except Exception as db_error:
-            logger.error(f"Не удалось прочитать черновик пользователя {user_id}: {db_error}")
+        if generation is not None and _draft_generation.get(user_id, 0) != generation:
             return
-
         try:
-            if existing_row:
-                created_at, existing_title = existing_row
-                title_to_save = title if title is not None else existing_title
-                await db.execute(
-                    "UPDATE drafts SET data = ?, state = ?, title = ?, updated_at = ?, metrics = ? WHERE user_id = ?",
-                    (
-                        json.dumps(payload, ensure_ascii=False),
-                        state_value,
-                        title_to_save,
-                        timestamp,
-                        metrics_blob,
-                        user_id,
-                    ),
+            await db.execute(
+                "INSERT INTO drafts (user_id, data, state, title, created_at, updated_at, metrics) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, state = excluded.state, "
+                "title = COALESCE(excluded.title, drafts.title), updated_at = excluded.updated_at, "
+                "metrics = excluded.metrics",
+                (user_id, data_blob, state_value, title, timestamp, timestamp, metrics_blob),
+            )
+            if changed_photos:
+                await db.executemany(
+                    "INSERT INTO draft_photos (user_id, idx, item) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id, idx) DO UPDATE SET item = excluded.item",
+                    [(user_id, idx, item) for idx, item in changed_photos],
                 )
-            else:
+            if trim_photos:
                 await db.execute(
-                    "INSERT INTO drafts (user_id, data, state, title, created_at, updated_at, metrics) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (
-                        user_id,
-                        json.dumps(payload, ensure_ascii=False),
-                        state_value,
-                        title,
-                        timestamp,
-                        timestamp,
-                        metrics_blob,
-                    ),
+                    "DELETE FROM draft_photos WHERE user_id = ? AND idx >= ?",
+                    (user_id, len(photos)),
                 )
             await db.commit()
         except Exception as db_error:
             logger.error(f"Не удалось сохранить черновик пользователя {user_id}: {db_error}")
+            _forget_draft_digest(user_id)
+            return
+
+    _draft_written_digest[user_id] = digest
+    _draft_written_photos[user_id] = photos
+
+
+async def flush_draft(user_id: int) -> None:
+    """Немедленно записывает отложенный черновик пользователя, если он есть."""
+    task = _draft_save_tasks.pop(user_id, None)
+    if task and task is not asyncio.current_task():
+        task.cancel()
+    pending = _pending_draft_saves.pop(user_id, None)
+    if pending:
+        generation = _draft_generation.get(user_id, 0)
+        await save_draft_snapshot(user_id, **pending, generation=generation)
+
+
+async def flush_all_drafts() -> None:
+    for user_id in list(_pending_draft_saves):
+        await flush_draft(user_id)
+
+
+async def _delayed_draft_save(user_id: int) -> None:
+    try:
+        await asyncio.sleep(DRAFT_SAVE_DELAY_SECONDS)
+    except asyncio.CancelledError:
+        return
+    _draft_save_tasks.pop(user_id, None)
+    try:
+        await flush_draft(user_id)
+    except Exception as error:
+        logger.error(f"Не удалось записать отложенный черновик пользователя {user_id}: {error}")
 
 
 async def fetch_draft(user_id: int) -> Optional[Dict[str, Any]]:
     """Возвращает сохранённый черновик пользователя."""
     if not _is_db_ready():
         return None
+    await flush_draft(user_id)
     async with db_lock:
         try:
             async with db.execute(
@@ -1282,6 +1436,13 @@ async def fetch_draft(user_id: int) -> Optional[Dict[str, Any]]:
                 (user_id,),
             ) as cursor:
                 row = await cursor.fetchone()
+            photo_rows = []
+            if row:
+                async with db.execute(
+                    "SELECT item FROM draft_photos WHERE user_id = ? ORDER BY idx",
+                    (user_id,),
+                ) as cursor:
+                    photo_rows = await cursor.fetchall()
         except Exception as db_error:
             logger.error(f"Не удалось получить черновик пользователя {user_id}: {db_error}")
             return None
@@ -1294,6 +1455,14 @@ async def fetch_draft(user_id: int) -> Optional[Dict[str, Any]]:
         payload = json.loads(data_blob) if data_blob else {}
     except json.JSONDecodeError:
         payload = {}
+    if "photo_desc" not in payload:
+        photo_desc: List[Dict[str, Any]] = []
+        for (item_blob,) in photo_rows:
+            try:
+                photo_desc.append(json.loads(item_blob))
+            except (TypeError, json.JSONDecodeError):
+                continue
+        payload["photo_desc"] = photo_desc
     metrics_payload = None
     if metrics_blob:
         try:
@@ -1314,14 +1483,21 @@ async def fetch_draft(user_id: int) -> Optional[Dict[str, Any]]:
 
 async def clear_draft(user_id: int) -> None:
     """Удаляет черновик пользователя."""
+    task = _draft_save_tasks.pop(user_id, None)
+    if task:
+        task.cancel()
+    _pending_draft_saves.pop(user_id, None)
+    _draft_generation[user_id] = _draft_generation.get(user_id, 0) + 1
     if not _is_db_ready():
         return
     async with db_lock:
         try:
             await db.execute("DELETE FROM drafts WHERE user_id = ?", (user_id,))
+            await db.execute("DELETE FROM draft_photos WHERE user_id = ?", (user_id,))
             await db.commit()
         except Exception as db_error:
             logger.error(f"Не удалось удалить черновик пользователя {user_id}: {db_error}")
+        _forget_draft_digest(user_id)
 
 
 async def persist_draft(
@@ -1331,8 +1507,61 @@ async def persist_draft(
     next_state: Optional[DialogState],
     title: Optional[str] = None,
 ) -> None:
-    metrics = metrics_snapshot(context)
-    await save_draft_snapshot(user_id, data, next_state, title=title, metrics=metrics)
+    """Откладывает запись черновика: серия быстрых шагов сохраняется одной записью."""
+    if not isinstance(data, ConclusionData):
+        return
+    previous = _pending_draft_saves.get(user_id)
+    if title is None and previous:
+        title = previous.get("title")
+    _pending_draft_saves[user_id] = {
+        "data": copy.deepcopy(data),
+        "next_state": next_state,
+        "title": title,
+        "metrics": metrics_snapshot(context),
+    }
+    if user_id not in _draft_save_tasks:
+        _draft_save_tasks[user_id] = asyncio.create_task(_delayed_draft_save(user_id))
+
+
+# Таблица user_flags маленькая (только отмеченные администраторами пользователи),
+# поэтому она целиком держится в памяти и обновляется при каждой записи.
+user_flags_cache: Dict[int, Dict[str, Any]] = {}
+blocked_user_ids: Set[int] = set()
+user_flags_loaded: bool = False
+
+
+def _cache_user_flags(user_id: int, is_blocked: bool, notes: str, created_at: Optional[str], updated_at: Optional[str]) -> None:
+    previous = user_flags_cache.get(user_id)
+    user_flags_cache[user_id] = {
+        "is_blocked": bool(is_blocked),
+        "notes": notes or "",
+        "created_at": (previous or {}).get("created_at") or created_at,
+        "updated_at": updated_at,
+    }
+    if is_blocked:
+        blocked_user_ids.add(user_id)
+    else:
+        blocked_user_ids.discard(user_id)
+
+
+async def load_user_flags_cache() -> None:
+    """Загружает все флаги пользователей в память при старте."""
+    global user_flags_loaded
+    if not _is_db_ready():
+        return
+    async with db_lock:
+        try:
+            async with db.execute("SELECT user_id, is_blocked, notes, created_at, updated_at FROM user_flags") as cursor:
+                rows = await cursor.fetchall()
+        except Exception as error:
+            logger.error(f"Не удалось загрузить флаги пользователей: {error}")
+            return
+    user_flags_cache.clear()
+    blocked_user_ids.clear()
+    for user_id, is_blocked, notes, created_at, updated_at in rows:
+        _cache_user_flags(user_id, bool(is_blocked), notes or "", created_at, updated_at)
+    user_flags_loaded = True
+    logger.info(f"Флаги пользователей загружены: {len(rows)}, заблокировано: {len(blocked_user_ids)}.")
 
 
 async def get_user_flags(user_id: int) -> Dict[str, Any]:
@@ -1343,6 +1572,9 @@ async def get_user_flags(user_id: int) -> Dict[str, Any]:
         "created_at": None,
         "updated_at": None,
     }
+    if user_flags_loaded:
+        default.update(user_flags_cache.get(user_id, {}))
+        return default
     if not _is_db_ready():
         return default
     async with db_lock:
@@ -1395,6 +1627,8 @@ async def set_user_block_status(user_id: int, blocked: bool, notes: Optional[str
             await db.commit()
         except Exception as error:
             logger.error(f"Не удалось обновить статус блокировки пользователя {user_id}: {error}")
+            return
+        _cache_user_flags(user_id, blocked, notes_value, timestamp, timestamp)
 
 
 async def update_user_notes(user_id: int, notes: str) -> None:
@@ -1417,9 +1651,14 @@ async def update_user_notes(user_id: int, notes: str) -> None:
             await db.commit()
         except Exception as error:
             logger.error(f"Не удалось обновить заметку пользователя {user_id}: {error}")
+            return
+        is_blocked = user_flags_cache.get(user_id, {}).get("is_blocked", False)
+        _cache_user_flags(user_id, is_blocked, notes, timestamp, timestamp)
 
 
 async def is_user_blocked(user_id: int) -> bool:
+    if user_flags_loaded:
+        return user_id in blocked_user_ids
     flags = await get_user_flags(user_id)
     return flags.get("is_blocked", False)
 
@@ -1453,9 +1692,9 @@ async def fetch_recent_users(limit: int = 10) -> List[Dict[str, Any]]:
     async with db_lock:
         async with db.execute(
             "SELECT user_id, MAX(username) as username, MAX(completed_at) as last_completed"
-            " FROM completions WHERE is_deleted IS NULL OR is_deleted = 0"
+            " FROM completions WHERE (is_deleted IS NULL OR is_deleted = 0) AND user_id != ?"
             " GROUP BY user_id ORDER BY last_completed DESC LIMIT ?",
-            (limit,),
+            (IMPORTED_USER_ID, limit),
         ) as cursor:
             rows = await cursor.fetchall()
 
@@ -1614,15 +1853,17 @@ async def record_completion_entry(
     month_label = _format_month_label(month_key)
     day_label = completed_at.strftime("%d.%m.%Y")
 
-    region = data_dict.get("region")
+    region = (data_dict.get("region") or "").strip() or None
     ticket_number = data_dict.get("ticket_number")
     issue_number = data_dict.get("issue_number")
     department_number = data_dict.get("department_number")
     conclusion_date = data_dict.get("date")
+    parsed_conclusion_date = parse_date_str(conclusion_date)
+    conclusion_date_iso = parsed_conclusion_date.date().isoformat() if parsed_conclusion_date else None
 
     item_count, total_evaluation = _collect_completion_metrics(data_dict)
     completion_xp = calculate_completion_xp(item_count, total_evaluation)
-    items_json = json.dumps(data_dict.get("photo_desc", []) or [])
+    items_json = json.dumps(_strip_preview_fields(data_dict.get("photo_desc", [])))
     archive_path_str = str(archive_path) if archive_path else None
     chat_id_to_store = group_chat_id or MAIN_GROUP_CHAT_ID
     processing_value = float(processing_time or 0.0)
@@ -1674,9 +1915,9 @@ async def record_completion_entry(
                 user_id, username, completed_at, item_count, total_evaluation, region,
                 ticket_number, issue_number, department_number, date,
                 group_chat_id, group_message_id, thread_id, archive_path, items_json, xp_value,
-                processing_time_seconds, step_metrics
+                processing_time_seconds, step_metrics, date_iso, ticket_reversed
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 user_id,
@@ -1697,6 +1938,8 @@ async def record_completion_entry(
                 completion_xp,
                 processing_value,
                 metrics_json,
+                conclusion_date_iso,
+                _reverse_ticket(ticket_number),
             ),
         )
         completion_id = cursor.lastrowid or 0
@@ -1711,6 +1954,7 @@ async def record_completion_entry(
         if previous_day_count == 0 and current_streak > 0:
             previous_streak = current_streak - 1
         await db.commit()
+    bump_completions_version()
 
     current_items_total = previous_items_total + item_count
     current_value_total = previous_value_total + total_evaluation
@@ -1780,11 +2024,12 @@ async def fetch_leaderboard(period: str, limit: int = LEADERBOARD_SIZE) -> Tuple
                 MAX(completed_at) AS last_completed_at
             FROM completions
             WHERE completed_at >= ? AND completed_at < ? AND (is_deleted IS NULL OR is_deleted = 0)
+                AND user_id != ?
             GROUP BY user_id
             ORDER BY completions_count DESC, last_completed_at ASC
             LIMIT ?
             """,
-            (start_iso, end_iso, limit),
+            (start_iso, end_iso, IMPORTED_USER_ID, limit),
         ) as cursor:
             rows = await cursor.fetchall()
 
@@ -1861,6 +2106,51 @@ async def _register_achievement(user_id: int, achievement_key: str) -> bool:
             return True
 
 
+def _required_achievement_keys(
+    total_count: int,
+    items_total: int,
+    value_total: float,
+    xp_total: int,
+    monthly_counts: Dict[str, int],
+    daily_counts: Dict[str, int],
+    current_streak: int,
+) -> Set[str]:
+    """Возвращает ключи ачивок, которые положены при указанных итогах пользователя."""
+    required_keys: Set[str] = set()
+
+    for tier in ACHIEVEMENT_TIERS.get("total", []):
+        if total_count >= tier["threshold"]:
+            required_keys.add(tier["code"])
+
+    for tier in ACHIEVEMENT_TIERS.get("items_total", []):
+        if items_total >= tier["threshold"]:
+            required_keys.add(tier["code"])
+
+    for tier in ACHIEVEMENT_TIERS.get("value_total", []):
+        if value_total >= tier["threshold"]:
+            required_keys.add(tier["code"])
+
+    for tier in ACHIEVEMENT_TIERS.get("level", []):
+        if xp_total >= tier["threshold"]:
+            required_keys.add(tier["code"])
+
+    for month_key, count in monthly_counts.items():
+        for tier in ACHIEVEMENT_TIERS.get("monthly", []):
+            if count >= tier["threshold"]:
+                required_keys.add(f"{tier['code']}:{month_key}")
+
+    for day_key, count in daily_counts.items():
+        for tier in ACHIEVEMENT_TIERS.get("daily", []):
+            if count >= tier["threshold"]:
+                required_keys.add(f"{tier['code']}:{day_key}")
+
+    for tier in ACHIEVEMENT_TIERS.get("streak", []):
+        if current_streak >= tier["threshold"]:
+            required_keys.add(tier["code"])
+
+    return required_keys
+
+
 async def refresh_achievements_for_user(user_id: int) -> None:
     if not _is_db_ready():
         return
@@ -1905,37 +2195,15 @@ async def refresh_achievements_for_user(user_id: int) -> None:
         xp_total = int((totals_row[2] if totals_row else 0) or 0)
 
         existing_keys = {row[0] for row in existing_rows}
-        required_keys: Set[str] = set()
-
-        for tier in ACHIEVEMENT_TIERS.get("total", []):
-            if total_count >= tier["threshold"]:
-                required_keys.add(tier["code"])
-
-        for tier in ACHIEVEMENT_TIERS.get("items_total", []):
-            if items_total >= tier["threshold"]:
-                required_keys.add(tier["code"])
-
-        for tier in ACHIEVEMENT_TIERS.get("value_total", []):
-            if value_total >= tier["threshold"]:
-                required_keys.add(tier["code"])
-
-        for tier in ACHIEVEMENT_TIERS.get("level", []):
-            if xp_total >= tier["threshold"]:
-                required_keys.add(tier["code"])
-
-        for month_key, count in monthly_counts.items():
-            for tier in ACHIEVEMENT_TIERS.get("monthly", []):
-                if count >= tier["threshold"]:
-                    required_keys.add(f"{tier['code']}:{month_key}")
-
-        for day_key, count in daily_counts.items():
-            for tier in ACHIEVEMENT_TIERS.get("daily", []):
-                if count >= tier["threshold"]:
-                    required_keys.add(f"{tier['code']}:{day_key}")
-
-        for tier in ACHIEVEMENT_TIERS.get("streak", []):
-            if current_streak >= tier["threshold"]:
-                required_keys.add(tier["code"])
+        required_keys = _required_achievement_keys(
+            total_count,
+            items_total,
+            value_total,
+            xp_total,
+            monthly_counts,
+            daily_counts,
+            current_streak,
+        )
 
         keys_to_remove = existing_keys - required_keys
         if keys_to_remove:
@@ -2435,6 +2703,80 @@ async def fetch_user_stats(user_id: int) -> Dict[str, Any]:
     }
 
 
+COMPLETION_RECORD_COLUMNS = (
+    "id, user_id, username, completed_at, item_count, total_evaluation, region, "
+    "ticket_number, issue_number, department_number, date, archive_path, items_json, group_chat_id, group_message_id, thread_id, "
+    "is_deleted, deleted_at, deleted_by, deletion_note"
+)
+SQL_IN_CHUNK_SIZE: int = 500
+
+
+def _completion_from_row(row: Sequence[Any]) -> Dict[str, Any]:
+    """Преобразует строку выборки COMPLETION_RECORD_COLUMNS в словарь заключения."""
+    keys = (
+        "id", "user_id", "username", "completed_at", "item_count", "total_evaluation", "region",
+        "ticket_number", "issue_number", "department_number", "date", "archive_path", "items_json",
+        "group_chat_id", "group_message_id", "thread_id", "is_deleted", "deleted_at", "deleted_by", "deletion_note",
+    )
+    record = dict(zip(keys, row))
+    record["is_deleted"] = bool(record["is_deleted"])
+    return record
+
+
+def _chunked(values: Sequence[Any], size: int = SQL_IN_CHUNK_SIZE) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+async def fetch_completions_by_messages(
+    chat_id: int,
+    message_ids: Sequence[int],
+    thread_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Находит активные заключения для набора сообщений группы одним запросом на пачку id."""
+    if not _is_db_ready() or not message_ids:
+        return []
+
+    unique_ids = list(dict.fromkeys(message_ids))
+    records: List[Dict[str, Any]] = []
+    async with db_lock:
+        for chunk in _chunked(unique_ids):
+            placeholders = ", ".join("?" for _ in chunk)
+            query = (
+                f"SELECT {COMPLETION_RECORD_COLUMNS} FROM completions "
+                f"WHERE group_chat_id = ? AND group_message_id IN ({placeholders}) "
+                "AND (is_deleted IS NULL OR is_deleted = 0)"
+            )
+            params: List[Any] = [chat_id, *chunk]
+            if thread_id is not None:
+                query += " AND (thread_id = ? OR thread_id IS NULL)"
+                params.append(thread_id)
+            async with db.execute(query, tuple(params)) as cursor:
+                rows = await cursor.fetchall()
+            records.extend(_completion_from_row(row) for row in rows)
+    return records
+
+
+async def fetch_completions_by_tickets(ticket_numbers: Sequence[str]) -> List[Dict[str, Any]]:
+    """Находит активные заключения для списка номеров билетов одним запросом на пачку."""
+    if not _is_db_ready() or not ticket_numbers:
+        return []
+
+    unique_tickets = list(dict.fromkeys(ticket_numbers))
+    records: List[Dict[str, Any]] = []
+    async with db_lock:
+        for chunk in _chunked(unique_tickets):
+            placeholders = ", ".join("?" for _ in chunk)
+            query = (
+                f"SELECT {COMPLETION_RECORD_COLUMNS} FROM completions "
+                f"WHERE ticket_number IN ({placeholders}) AND is_deleted = 0"
+            )
+            async with db.execute(query, tuple(chunk)) as cursor:
+                rows = await cursor.fetchall()
+            records.extend(_completion_from_row(row) for row in rows)
+    return records
+
+
 async def fetch_completion_by_id(completion_id: int) -> Optional[Dict[str, Any]]:
     if not _is_db_ready():
         return None
@@ -2503,88 +2845,66 @@ async def fetch_completion_by_message(
     message_id: int,
     thread_id: Optional[int] = None,
 ) -> Optional[Dict[str, Any]]:
-    if not _is_db_ready():
-        return None
+    records = await fetch_completions_by_messages(chat_id, [message_id], thread_id=thread_id)
+    return records[0] if records else None
 
-    query = (
-        "SELECT id, user_id, username, completed_at, item_count, total_evaluation, region, "
-        "ticket_number, issue_number, department_number, date, archive_path, items_json, group_chat_id, group_message_id, thread_id, "
-        "is_deleted, deleted_at, deleted_by, deletion_note "
-        "FROM completions WHERE group_chat_id = ? AND group_message_id = ? AND (is_deleted IS NULL OR is_deleted = 0)"
-    )
-    params: List[Any] = [chat_id, message_id]
-    if thread_id is not None:
-        query += " AND (thread_id = ? OR thread_id IS NULL)"
-        params.append(thread_id)
 
-    async with db_lock:
-        async with db.execute(query, tuple(params)) as cursor:
-            row = await cursor.fetchone()
+TICKET_SEARCH_LIMIT: int = 20
+# Короче этого фрагменты билета не ищем: по 2–3 цифрам совпадает слишком много чужих билетов.
+TICKET_FRAGMENT_MIN_DIGITS: int = 6
 
-    if not row:
-        return None
 
-    (
-        completion_id,
-        user_id,
-        username,
-        completed_at,
-        item_count,
-        total_evaluation,
-        region,
-        ticket_val,
-        issue_val,
-        department_val,
-        date_val,
-        archive_path,
-        items_json,
-        group_chat_id,
-        group_message_id,
-        stored_thread_id,
-        is_deleted,
-        deleted_at,
-        deleted_by,
-        deletion_note,
-    ) = row
-    return {
-        "id": completion_id,
-        "user_id": user_id,
-        "username": username,
-        "completed_at": completed_at,
-        "item_count": item_count,
-        "total_evaluation": total_evaluation,
-        "region": region,
-        "ticket_number": ticket_val,
-        "issue_number": issue_val,
-        "department_number": department_val,
-        "date": date_val,
-        "archive_path": archive_path,
-        "items_json": items_json,
-        "group_chat_id": group_chat_id,
-        "group_message_id": group_message_id,
-        "thread_id": stored_thread_id,
-        "is_deleted": bool(is_deleted),
-        "deleted_at": deleted_at,
-        "deleted_by": deleted_by,
-        "deletion_note": deletion_note,
-    }
+def _prefix_upper_bound(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def parse_ticket_pattern(text: str) -> Tuple[str, str]:
+    """Разбирает ввод билета: «123456*» — префикс, короткий номер — последние цифры, иначе точное совпадение.
+
+    Фрагмент короче TICKET_FRAGMENT_MIN_DIGITS возвращается с видом "short" и не ищется.
+    """
+    value = text.strip()
+    if value.endswith("*"):
+        value, match = value.rstrip("*"), "prefix"
+    elif value.startswith("*"):
+        value, match = value.lstrip("*"), "suffix"
+    elif value.isdigit() and len(value) < MIN_TICKET_DIGITS:
+        match = "suffix"
+    else:
+        return value, "exact"
+    if len(value) < TICKET_FRAGMENT_MIN_DIGITS:
+        return value, "short"
+    return value, match
 
 
 async def fetch_completions_by_ticket(
     ticket_number: str,
     date_text: Optional[str] = None,
     issue_number: Optional[str] = None,
+    match: str = "exact",
 ) -> List[Dict[str, Any]]:
-    if not _is_db_ready():
+    """Ищет живые заключения по билету через частичные индексы.
+
+    match: "exact" — точное совпадение, "prefix" — билет начинается с ticket_number,
+    "suffix" — заканчивается на него (диапазон по перевёрнутой строке ticket_reversed).
+    Для префикса и суффикса возвращается не больше TICKET_SEARCH_LIMIT записей.
+    """
+    if not _is_db_ready() or not ticket_number:
         return []
 
-    query = (
-        "SELECT id, user_id, username, completed_at, item_count, total_evaluation, region, "
-        "ticket_number, issue_number, department_number, date, archive_path, items_json, group_chat_id, group_message_id, thread_id, "
-        "is_deleted, deleted_at, deleted_by, deletion_note "
-        "FROM completions WHERE ticket_number = ? AND (is_deleted IS NULL OR is_deleted = 0)"
-    )
-    params: List[Any] = [ticket_number]
+    query = f"SELECT {COMPLETION_RECORD_COLUMNS} FROM completions WHERE "
+    params: List[Any] = []
+    if match == "prefix":
+        query += "ticket_number >= ? AND ticket_number < ?"
+        params.extend([ticket_number, _prefix_upper_bound(ticket_number)])
+    elif match == "suffix":
+        reversed_part = ticket_number[::-1]
+        query += "ticket_reversed >= ? AND ticket_reversed < ?"
+        params.extend([reversed_part, _prefix_upper_bound(reversed_part)])
+    else:
+        query += "ticket_number = ?"
+        params.append(ticket_number)
+    query += " AND is_deleted = 0"
     if date_text:
         query += " AND date = ?"
         params.append(date_text)
@@ -2592,62 +2912,13 @@ async def fetch_completions_by_ticket(
         query += " AND issue_number = ?"
         params.append(issue_number)
     query += " ORDER BY completed_at DESC"
+    if match != "exact":
+        query += f" LIMIT {TICKET_SEARCH_LIMIT}"
 
     async with db_lock:
         async with db.execute(query, tuple(params)) as cursor:
             rows = await cursor.fetchall()
-
-    records: List[Dict[str, Any]] = []
-    for row in rows:
-        (
-            completion_id,
-            user_id,
-            username,
-            completed_at,
-            item_count,
-            total_evaluation,
-            region,
-            ticket_val,
-            issue_val,
-            department_val,
-            date_val,
-            archive_path,
-            items_json,
-            group_chat_id,
-            group_message_id,
-            thread_id,
-            is_deleted,
-            deleted_at,
-            deleted_by,
-            deletion_note,
-        ) = row
-        if is_deleted:
-            continue
-        records.append(
-            {
-                "id": completion_id,
-                "user_id": user_id,
-                "username": username,
-                "completed_at": completed_at,
-                "item_count": item_count,
-                "total_evaluation": total_evaluation,
-                "region": region,
-                "ticket_number": ticket_val,
-                "issue_number": issue_val,
-                "department_number": department_val,
-                "date": date_val,
-                "archive_path": archive_path,
-                "items_json": items_json,
-                "group_chat_id": group_chat_id,
-                "group_message_id": group_message_id,
-                "thread_id": thread_id,
-                "is_deleted": bool(is_deleted),
-                "deleted_at": deleted_at,
-                "deleted_by": deleted_by,
-                "deletion_note": deletion_note,
-            }
-        )
-    return records
+    return [_completion_from_row(row) for row in rows]
 
 
 async def build_personal_stats_message(user_id: int) -> Optional[str]:
@@ -2710,6 +2981,9 @@ async def soft_delete_completion_record(
         archive_info = await set_archive_entry_status(archive_path, deleted=True, initiator_id=initiator_id, note=note)
         result["archive_marked"] = archive_info.get("updated", False)
 
+    if result["db_marked"]:
+        bump_completions_version()
+
     user_id = conclusion.get("user_id")
     if result["db_marked"] and user_id:
         await refresh_achievements_for_user(user_id)
@@ -2717,6 +2991,53 @@ async def soft_delete_completion_record(
     return result
 
 
+async def soft_delete_completion_records(
+    conclusions: Sequence[Dict[str, Any]],
+    initiator_id: Optional[int] = None,
+    note: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Помечает несколько заключений удалёнными одной транзакцией.
+
+    Возвращает только те записи, которые были активны и действительно
+    помечены; ачивки пересчитываются один раз на каждого затронутого пользователя.
+    """
+    by_id = {conclusion["id"]: conclusion for conclusion in conclusions if conclusion.get("id")}
+    if not by_id or not _is_db_ready():
+        return []
+
+    timestamp = _now_iso()
+    marked_ids: Set[int] = set()
+    async with db_lock:
+        try:
+            for chunk in _chunked(list(by_id)):
+                placeholders = ", ".join("?" for _ in chunk)
+                live_filter = f"id IN ({placeholders}) AND (is_deleted IS NULL OR is_deleted = 0)"
+                async with db.execute(f"SELECT id FROM completions WHERE {live_filter}", tuple(chunk)) as cursor:
+                    chunk_live = {row[0] for row in await cursor.fetchall()}
+                await db.execute(
+                    f"UPDATE completions SET is_deleted = 1, deleted_at = ?, deleted_by = ?, deletion_note = ? WHERE {live_filter}",
+                    (timestamp, initiator_id, note, *chunk),
+                )
+                marked_ids.update(chunk_live)
+            await db.commit()
+        except Exception as error:
+            logger.error(f"Не удалось пометить записи {sorted(by_id)} как удалённые: {error}")
+            await db.rollback()
+            return []
+
+    marked = [by_id[completion_id] for completion_id in by_id if completion_id in marked_ids]
+    if not marked:
+        return []
+
+    bump_completions_version()
+    await remove_archived_documents(marked, initiator_id=initiator_id, note=note)
+
+    for user_id in dict.fromkeys(record.get("user_id") for record in marked):
+        if user_id:
+            await refresh_achievements_for_user(user_id)
+    return marked
+
+
 async def restore_completion_record(completion_id: int, restorer_id: Optional[int] = None) -> Dict[str, Any]:
     result = {
         "restored": False,
@@ -2747,6 +3068,7 @@ async def restore_completion_record(completion_id: int, restorer_id: Optional[in
                 return result
 
     if result["restored"]:
+        bump_completions_version()
         record = await fetch_completion_by_id(completion_id) or record
         result["record"] = record
 
@@ -2766,32 +3088,343 @@ async def send_personal_stats(bot, user_id: int) -> None:
         return
     await safe_bot_send_message(bot, user_id, message, skip_notice_on_retry=True)
 
-# -------------------- Утилиты --------------------
-def generate_unique_filename() -> str:
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=16)) + ".jpg"
+# -------------------- Пакетный импорт заключений --------------------
+INGEST_CHUNK_SIZE: int = 5000
+# Служебный пользователь импортированных заключений: исключается из рейтинга,
+# списка недавних пользователей и пересчёта ачивок.
+IMPORTED_USER_ID: int = 0
+IMPORTED_USERNAME: str = "импорт"
 
-def sanitize_filename(filename: str) -> str:
-    """Очищает имя файла от запрещённых символов, имён и ограничивает длину."""
-    cleaned = re.sub(r'[\/:*?"<>|]', '_', filename)
-    reserved_names = {"CON", "PRN", "AUX", "NUL", "COM1", "COM2", "COM3", "COM4", "COM5", "COM6", "COM7", "COM8", "COM9", "LPT1", "LPT2", "LPT3", "LPT4", "LPT5", "LPT6", "LPT7", "LPT8", "LPT9"}
-    if cleaned.upper() in reserved_names:
-        cleaned = f"_{cleaned}_"
-    return cleaned[:150]
 
+def _ingest_text(value: Any) -> str:
+    if value is None:
+        return ""
+    return str(value).strip()
 
-def format_number(value: Any) -> str:
-    try:
-        numeric = float(value)
-    except (TypeError, ValueError):
-        numeric = 0.0
-    if numeric.is_integer():
-        numeric = int(numeric)
-    else:
-        numeric = int(round(numeric))
-    return f"{numeric:,}".replace(",", " ")
 
+# Заглушки, которыми журнал Excel заполняет пустые поля; в БД там NULL или пустая строка
+IMPORT_EMPTY_MARKERS: Set[str] = {"не указано", "не указан", "не указана"}
 
-def format_filesize(size_bytes: Optional[int]) -> str:
+
+def _import_key_part(value: Any) -> str:
+    text = _ingest_text(value)
+    return "" if text.casefold() in IMPORT_EMPTY_MARKERS else text
+
+
+def _completion_import_key(ticket: Any, issue: Any, department: Any, date_text: Any) -> Tuple[str, str, str, str]:
+    return (_import_key_part(ticket), _import_key_part(issue), _import_key_part(department), _import_key_part(date_text))
+
+
+def iter_archive_index_payloads() -> Iterator[Dict[str, Any]]:
+    """Выдаёт заключения из индекса архива в формате для bulk_ingest_completions."""
+    for entry in _read_archive_index():
+        yield {
+            "ticket_number": entry.get("ticket_number"),
+            "issue_number": entry.get("issue_number"),
+            "department_number": entry.get("department_number"),
+            "date": entry.get("date"),
+            "region": entry.get("region"),
+            "photo_desc": entry.get("items") or [],
+            "archive_path": entry.get("archive_path"),
+            "completed_at": entry.get("created_at"),
+            "is_deleted": entry.get("is_deleted"),
+            "deleted_at": entry.get("deleted_at"),
+            "deleted_by": entry.get("deleted_by"),
+            "deletion_note": entry.get("deletion_note"),
+        }
+
+
+def iter_excel_payloads(path: Path = EXCEL_FILE) -> Iterator[Dict[str, Any]]:
+    """Собирает строки журнала Excel обратно в заключения (строки одного заключения идут подряд)."""
+    if not path.exists():
+        return
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        ws = wb.active
+        current: Optional[Dict[str, Any]] = None
+        current_key: Optional[Tuple[Any, ...]] = None
+        for row in ws.iter_rows(min_row=2, values_only=True):
+            if not row or all(value is None for value in row):
+                continue
+            row = list(row) + [None] * (len(EXCEL_HEADERS) - len(row))
+            key = tuple(_ingest_text(value) for value in row[:5])
+            if current is None or key != current_key or _ingest_text(row[5]) == "1":
+                if current is not None:
+                    yield current
+                current_key = key
+                current = {
+                    "ticket_number": key[0],
+                    "issue_number": key[1],
+                    "department_number": key[2],
+                    "date": key[3],
+                    "region": key[4],
+                    "photo_desc": [],
+                }
+            current["photo_desc"].append({"description": row[6], "evaluation": row[7]})
+        if current is not None:
+            yield current
+    finally:
+        wb.close()
+
+
+def _completion_row_from_payload(payload: Dict[str, Any]) -> Tuple[Any, ...]:
+    items = payload.get("photo_desc") or []
+    item_count, total_evaluation = _collect_completion_metrics({"photo_desc": items})
+    date_text = payload.get("date")
+    parsed_date = parse_date_str(date_text)
+    completed_at = payload.get("completed_at") or (parsed_date.isoformat() if parsed_date else _now_iso())
+    return (
+        payload.get("user_id", IMPORTED_USER_ID),
+        payload.get("username") or IMPORTED_USERNAME,
+        completed_at,
+        item_count,
+        total_evaluation,
+        _ingest_text(payload.get("region")) or None,
+        payload.get("ticket_number"),
+        payload.get("issue_number"),
+        payload.get("department_number"),
+        date_text,
+        parsed_date.date().isoformat() if parsed_date else None,
+        payload.get("archive_path"),
+        json.dumps(items, ensure_ascii=False),
+        calculate_completion_xp(item_count, total_evaluation),
+        1 if payload.get("is_deleted") else 0,
+        payload.get("deleted_at"),
+        payload.get("deleted_by"),
+        payload.get("deletion_note"),
+        _reverse_ticket(payload.get("ticket_number")),
+    )
+
+
+def rebuild_all_achievements(
+    connection: sqlite3.Connection,
+    user_ids: Optional[Set[int]] = None,
+) -> Dict[str, int]:
+    """Пересчитывает achievement_log за один проход по completions.
+
+    user_ids ограничивает пересчёт этими пользователями; остальных он не
+    трогает (серии считаются от сегодняшнего дня, и полный пересчёт снял бы
+    честно полученные ачивки за прошлые серии).
+    """
+    totals: Dict[int, Tuple[int, int, float, int]] = {}
+    for user_id, count, items_total, value_total, xp_total in connection.execute(
+        "SELECT user_id, COUNT(*), COALESCE(SUM(item_count), 0), COALESCE(SUM(total_evaluation), 0), "
+        "COALESCE(SUM(xp_value), 0) FROM completions GROUP BY user_id"
+    ):
+        totals[user_id] = (int(count or 0), int(items_total or 0), float(value_total or 0.0), int(xp_total or 0))
+
+    monthly: Dict[int, Dict[str, int]] = {}
+    for user_id, month_key, count in connection.execute(
+        "SELECT user_id, substr(completed_at, 1, 7) AS month_key, COUNT(*) FROM completions GROUP BY user_id, month_key"
+    ):
+        if month_key:
+            monthly.setdefault(user_id, {})[month_key] = count
+
+    daily: Dict[int, Dict[str, int]] = {}
+    for user_id, day_key, count in connection.execute(
+        "SELECT user_id, substr(completed_at, 1, 10) AS day_key, COUNT(*) FROM completions GROUP BY user_id, day_key"
+    ):
+        if day_key:
+            daily.setdefault(user_id, {})[day_key] = count
+
+    existing: Dict[int, Set[str]] = {}
+    for user_id, achievement_key in connection.execute("SELECT user_id, achievement_key FROM achievement_log"):
+        existing.setdefault(user_id, set()).add(achievement_key)
+
+    to_add: List[Tuple[int, str, str]] = []
+    to_remove: List[Tuple[int, str]] = []
+    timestamp = _now_iso()
+    for user_id in set(totals) | set(existing):
+        if user_id == IMPORTED_USER_ID or (user_ids is not None and user_id not in user_ids):
+            continue
+        total_count, items_total, value_total, xp_total = totals.get(user_id, (0, 0, 0.0, 0))
+        daily_counts = daily.get(user_id, {})
+        current_streak = _calculate_streak_from_days(sorted(daily_counts, reverse=True))
+        required_keys = _required_achievement_keys(
+            total_count,
+            items_total,
+            value_total,
+            xp_total,
+            monthly.get(user_id, {}),
+            daily_counts,
+            current_streak,
+        )
+        user_existing = existing.get(user_id, set())
+        to_add.extend((user_id, key, timestamp) for key in required_keys - user_existing)
+        to_remove.extend((user_id, key) for key in user_existing - required_keys)
+
+    connection.executemany(
+        "INSERT OR IGNORE INTO achievement_log (user_id, achievement_key, achieved_at) VALUES (?, ?, ?)",
+        to_add,
+    )
+    connection.executemany(
+        "DELETE FROM achievement_log WHERE user_id = ? AND achievement_key = ?",
+        to_remove,
+    )
+    connection.commit()
+    return {"added": len(to_add), "removed": len(to_remove)}
+
+
+def bulk_ingest_completions(
+    payloads: Iterable[Dict[str, Any]],
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    database_path: Path = DATABASE_FILE,
+    rebuild_indexes: bool = False,
+    rebuild_achievements: bool = True,
+) -> Dict[str, Any]:
+    """Загружает заключения пачками через executemany, минуя record_completion_entry.
+
+    С rebuild_indexes=True вторичные индексы снимаются на время загрузки и
+    строятся заново в конце — только для офлайн-импорта из CLI, пока бот не
+    обслуживает запросы. При работающем боте индексы остаются на месте.
+    Ачивки пересчитываются одним проходом и только для пользователей, чьи
+    заключения добавлены; rebuild_achievements=False отключает пересчёт
+    совсем. Заключения, уже присутствующие в
+    completions (по архивному пути или по билету, номеру, подразделению и дате),
+    пропускаются, поэтому импорт можно повторять.
+    """
+    started = time.perf_counter()
+    inserted = 0
+    skipped = 0
+    inserted_users: Set[int] = set()
+    connection = sqlite3.connect(database_path)
+    try:
+        seen_keys: Set[Tuple[str, str, str, str]] = set()
+        seen_paths: Set[str] = set()
+        for ticket, issue, department, date_text, archive_path in connection.execute(
+            "SELECT ticket_number, issue_number, department_number, date, archive_path FROM completions"
+        ):
+            seen_keys.add(_completion_import_key(ticket, issue, department, date_text))
+            if archive_path:
+                seen_paths.add(archive_path)
+
+        if rebuild_indexes:
+            for index_name in COMPLETIONS_INDEXES:
+                connection.execute(f"DROP INDEX IF EXISTS {index_name}")
+            connection.commit()
+
+        insert_sql = (
+            "INSERT INTO completions (user_id, username, completed_at, item_count, total_evaluation, region, "
+            "ticket_number, issue_number, department_number, date, date_iso, archive_path, items_json, xp_value, "
+            "is_deleted, deleted_at, deleted_by, deletion_note, ticket_reversed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        chunk: List[Tuple[Any, ...]] = []
+        try:
+            for payload in payloads:
+                key = _completion_import_key(
+                    payload.get("ticket_number"),
+                    payload.get("issue_number"),
+                    payload.get("department_number"),
+                    payload.get("date"),
+                )
+                archive_path = payload.get("archive_path")
+                if key in seen_keys or (archive_path and archive_path in seen_paths):
+                    skipped += 1
+                    continue
+                seen_keys.add(key)
+                if archive_path:
+                    seen_paths.add(archive_path)
+                row = _completion_row_from_payload(payload)
+                inserted_users.add(row[0])
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    connection.executemany(insert_sql, chunk)
+                    connection.commit()
+                    inserted += len(chunk)
+                    chunk = []
+            if chunk:
+                connection.executemany(insert_sql, chunk)
+                connection.commit()
+                inserted += len(chunk)
+        finally:
+            if rebuild_indexes:
+                for index_ddl in COMPLETIONS_INDEXES.values():
+                    connection.execute(index_ddl)
+                connection.commit()
+
+        inserted_users.discard(IMPORTED_USER_ID)
+        if rebuild_achievements and inserted_users:
+            achievements = rebuild_all_achievements(connection, inserted_users)
+        else:
+            achievements = {"added": 0, "removed": 0}
+    finally:
+        connection.close()
+
+    if inserted:
+        bump_completions_version()
+    elapsed = time.perf_counter() - started
+    report = {
+        "inserted": inserted,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "rows_per_second": inserted / elapsed if elapsed > 0 else 0.0,
+        "achievements_added": achievements["added"],
+        "achievements_removed": achievements["removed"],
+    }
+    logger.info(
+        f"Пакетный импорт: добавлено {inserted}, пропущено {skipped} за {elapsed:.2f} с "
+        f"({report['rows_per_second']:.0f} строк/с)."
+    )
+    return report
+
+
+async def backfill_completions_from_excel() -> None:
+    """Однократно переносит в completions заключения, которые есть только в журнале Excel.
+
+    Отчёты за период считаются по completions, поэтому история до появления БД
+    должна попасть туда до первого отчёта. Уже известные заключения импорт
+    пропускает; по завершении пишется отметка EXCEL_BACKFILL_MARKER.
+    """
+    if EXCEL_BACKFILL_MARKER.exists():
+        return
+    report: Dict[str, Any] = {"inserted": 0, "skipped": 0}
+    if EXCEL_FILE.exists():
+        async with excel_lock:
+            report = await asyncio.to_thread(
+                lambda: bulk_ingest_completions(
+                    iter_excel_payloads(EXCEL_FILE),
+                    database_path=DATABASE_FILE,
+                    rebuild_achievements=False,
+                )
+            )
+        logger.info(
+            f"Журнал Excel перенесён в БД: добавлено {report['inserted']}, уже было {report['skipped']}."
+        )
+    EXCEL_BACKFILL_MARKER.write_text(
+        json.dumps({**report, "finished_at": _now_iso()}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+
+
+# -------------------- Утилиты --------------------
+def generate_unique_filename() -> str:
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=16)) + ".jpg"
+
+def sanitize_filename(filename: str) -> str:
+    """Очищает имя файла от запрещённых символов, имён и ограничивает длину."""
+    cleaned = re.sub(r'[\/:*?"<>|]', '_', filename)
+    reserved_names = {"CON", "PRN", "AUX", "NUL", "COM1", "COM2", "COM3", "COM4", "COM5", "COM6", "COM7", "COM8", "COM9", "LPT1", "LPT2", "LPT3", "LPT4", "LPT5", "LPT6", "LPT7", "LPT8", "LPT9"}
+    if cleaned.upper() in reserved_names:
+        cleaned = f"_{cleaned}_"
+    return cleaned[:150]
+
+
+def format_number(value: Any) -> str:
+    try:
+        numeric = float(value)
+    except (TypeError, ValueError):
+        numeric = 0.0
+    if numeric.is_integer():
+        numeric = int(numeric)
+    else:
+        numeric = int(round(numeric))
+    return f"{numeric:,}".replace(",", " ")
+
+
+def format_filesize(size_bytes: Optional[int]) -> str:
     try:
         size = float(size_bytes or 0)
     except (TypeError, ValueError):
@@ -2894,6 +3527,9 @@ def get_month_bounds(month_text: str) -> Optional[tuple[datetime, datetime]]:
 
 
 async def filter_records(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, region: Optional[str] = None) -> List[List[Any]]:
+    mirrored = await read_history_mirror(start_date, end_date, region)
+    if mirrored is not None:
+        return mirrored
     records = await read_excel_data()
     if not records:
         return []
@@ -2910,18 +3546,100 @@ async def filter_records(start_date: Optional[datetime] = None, end_date: Option
         filtered.append(row)
     return filtered
 
+async def aggregate_period_by_region(
+    start_date: datetime,
+    end_date: datetime,
+    region: Optional[str] = None,
+) -> Optional[Dict[str, Dict[str, float]]]:
+    """Считает предметы и сумму оценок по регионам через индекс completions(date_iso, region).
+
+    Возвращает None, если БД недоступна, чтобы вызывающий код мог перейти на Excel.
+    """
+    if not _is_db_ready():
+        return None
+
+    query = (
+        "SELECT COALESCE(NULLIF(region, ''), 'Не указано') AS region_name, "
+        "COALESCE(SUM(item_count), 0), COALESCE(SUM(total_evaluation), 0) "
+        "FROM completions WHERE date_iso BETWEEN ? AND ? AND (is_deleted IS NULL OR is_deleted = 0)"
+    )
+    params: List[Any] = [start_date.date().isoformat(), end_date.date().isoformat()]
+    if region:
+        query += " AND region = ?"
+        params.append(region.strip())
+    query += " GROUP BY region_name"
+
+    try:
+        async with db_lock:
+            async with db.execute(query, tuple(params)) as cursor:
+                rows = await cursor.fetchall()
+    except Exception as error:
+        logger.error(f"Не удалось агрегировать заключения за период: {error}")
+        return None
+
+    return {
+        region_name: {"count": int(count or 0), "total": float(total or 0.0)}
+        for region_name, count, total in rows
+        if count
+    }
+
+
+async def _aggregate_period_from_excel(
+    start_date: datetime,
+    end_date: datetime,
+    region: Optional[str] = None,
+) -> Dict[str, Dict[str, float]]:
+    filtered = await filter_records(start_date=start_date, end_date=end_date, region=region)
+    totals: Dict[str, Dict[str, float]] = {}
+    for row in filtered:
+        region_name = row[4] or "Не указано"
+        entry = totals.setdefault(region_name, {"count": 0, "total": 0.0})
+        entry["count"] += 1
+        try:
+            entry["total"] += float(row[7] or 0)
+        except (TypeError, ValueError):
+            continue
+    return totals
+
+
+async def load_period_totals(
+    start_date: datetime,
+    end_date: datetime,
+    region: Optional[str] = None,
+) -> Dict[str, Dict[str, float]]:
+    totals = await aggregate_period_by_region(start_date, end_date, region)
+    if totals is None:
+        totals = await _aggregate_period_from_excel(start_date, end_date, region)
+    return totals
+
 def is_image_too_large(image_path: Path, max_size_mb: int = 5) -> bool:
     file_size_mb = image_path.stat().st_size / (1024 * 1024)
     return file_size_mb > max_size_mb
 
 def compress_image(input_path: Path, output_path: Path, quality: int = 70) -> None:
     """Надёжно сжимает изображение, исправляя ориентацию и конвертируя в RGB."""
+    from PIL import Image, ImageOps
+
     with Image.open(input_path) as img:
         img = ImageOps.exif_transpose(img)
         if img.mode in ("RGBA", "LA", "P"):
             img = img.convert("RGB")
         img.save(output_path, "JPEG", quality=quality, optimize=True)
 
+
+def create_thumbnail(input_path: Path, output_path: Path, size: int = PREVIEW_THUMB_SIZE) -> None:
+    """Создаёт маленькую JPEG-миниатюру для превью на шаге подтверждения."""
+    from PIL import Image
+
+    with Image.open(input_path) as img:
+        img.thumbnail((size, size))
+        img.save(output_path, "JPEG", quality=70, optimize=True)
+
+
+def prepare_photo_files(original_path: Path, compressed_path: Path, thumb_path: Path) -> None:
+    compress_image(original_path, compressed_path)
+    create_thumbnail(compressed_path, thumb_path)
+
 def clean_temp_files(max_age_seconds: int = 3600) -> None:
     """Удаляет устаревшие временные файлы."""
     if TEMP_PHOTOS_DIR.exists():
@@ -2950,6 +3668,12 @@ def cleanup_user_photos(data: Union[ConclusionData, Dict[str, Any]]) -> None:
         photos = data.get('photo_desc', []) if data else []
 
     for item in photos:
+        thumb_path = Path(item.get('thumb') or "")
+        if thumb_path.is_file():
+            try:
+                thumb_path.unlink()
+            except OSError as e:
+                logger.warning(f"Не удалось удалить миниатюру {thumb_path}: {e}")
         photo_path = Path(item.get('photo', ""))
         if photo_path.is_file():
             try:
@@ -3312,72 +4036,57 @@ def truncate_text(value: Any, limit: int = 60) -> str:
     return text[: max(0, limit - 1)].rstrip() + "…"
 
 
-def _paginate(items: Sequence[Any], page: int, page_size: int) -> Tuple[List[Any], int, int]:
-    total_items = len(items)
-    if total_items == 0:
-        return [], 1, 1
-    total_pages = max(1, math.ceil(total_items / page_size))
-    current_page = max(1, min(page, total_pages))
-    start = (current_page - 1) * page_size
-    end = start + page_size
-    return list(items[start:end]), current_page, total_pages
+HISTORY_PAGE_SIZE: int = 6
+
 
+def _history_nav_data(direction: str, page: int, record: Dict[str, Any]) -> str:
+    """Кодирует ключ keyset-пагинации (completed_at, id) в callback_data (до 64 байт)."""
+    return f"{HISTORY_CALLBACK_PREFIX}{direction}:{page}:{record['id']}:{record['completed_at']}"
 
-def build_history_page(records: List[List[Any]], page: int, page_size: int) -> Tuple[str, InlineKeyboardMarkup, int]:
-    entries, current_page, total_pages = _paginate(records, page, page_size)
+
+def build_history_page(
+    records: List[Dict[str, Any]],
+    page: int,
+    has_prev: bool,
+    has_next: bool,
+) -> Tuple[str, InlineKeyboardMarkup]:
     if not records:
         return (
             "📜 История заключений пуста.",
             InlineKeyboardMarkup([[InlineKeyboardButton("Закрыть", callback_data=f"{HISTORY_CALLBACK_PREFIX}close")]]),
-            current_page,
         )
 
     lines = [
-        f"📜 История заключений — страница {current_page}/{total_pages}",
-        f"Всего записей: {len(records)}",
+        f"📜 История заключений — страница {page}",
         "",
     ]
-    if not entries:
-        lines.append("Записей на этой странице нет.")
-    else:
-        for row in entries:
-            ticket = (row[0] or "—") if len(row) > 0 else "—"
-            issue_number = (row[1] or "—") if len(row) > 1 else "—"
-            department = (row[2] or "—") if len(row) > 2 else "—"
-            date_label = (row[3] or "—") if len(row) > 3 else "—"
-            region = (row[4] or "—") if len(row) > 4 else "—"
-            item_number = row[5] if len(row) > 5 else ""
-            description = truncate_text(row[6] if len(row) > 6 else "Без описания", 70)
-            evaluation = row[7] if len(row) > 7 else ""
-            try:
-                evaluation_value = format_number(evaluation)
-            except Exception:
-                evaluation_value = str(evaluation or "0")
-            item_label = f"предмет {int(item_number)}" if isinstance(item_number, (int, float)) else "предмет"
-            lines.append(
-                f"• {date_label} • {region} • {item_label}\n  "
-                f"Подразделение {department}, билет {ticket}, № {issue_number}\n  "
-                f"Оценка: {evaluation_value} руб.\n  {description}"
-            )
-            lines.append("")
+    for record in records:
+        items = record.get("items") or []
+        first_description = items[0].get("description") if items and isinstance(items[0], dict) else None
+        description = truncate_text(first_description or "Без описания", 70)
+        lines.append(
+            f"• {record.get('date') or '—'} • {record.get('region') or '—'} • предметов: {record.get('item_count', 0)}\n  "
+            f"Подразделение {record.get('department_number') or '—'}, билет {record.get('ticket_number') or '—'}, "
+            f"№ {record.get('issue_number') or '—'}\n  "
+            f"Оценка: {format_number(record.get('total_evaluation', 0))} руб.\n  {description}"
+        )
+        lines.append("")
 
     nav_buttons: List[InlineKeyboardButton] = []
-    if current_page > 1:
+    if has_prev:
         nav_buttons.append(
-            InlineKeyboardButton("⬅️ Назад", callback_data=f"{HISTORY_CALLBACK_PREFIX}{current_page - 1}")
+            InlineKeyboardButton("⬅️ Назад", callback_data=_history_nav_data("p", page - 1, records[0]))
         )
-    nav_buttons.append(
-        InlineKeyboardButton(f"{current_page}/{total_pages}", callback_data=f"{HISTORY_CALLBACK_PREFIX}{current_page}")
-    )
-    if current_page < total_pages:
+    nav_buttons.append(InlineKeyboardButton(f"{page}", callback_data=f"{HISTORY_CALLBACK_PREFIX}noop"))
+    if has_next:
         nav_buttons.append(
-            InlineKeyboardButton("Вперёд ➡️", callback_data=f"{HISTORY_CALLBACK_PREFIX}{current_page + 1}")
+            InlineKeyboardButton("Вперёд ➡️", callback_data=_history_nav_data("n", page + 1, records[-1]))
         )
 
-    keyboard_rows = [nav_buttons] if nav_buttons else []
+    keyboard_rows = [nav_buttons]
     keyboard_rows.append([InlineKeyboardButton("Закрыть", callback_data=f"{HISTORY_CALLBACK_PREFIX}close")])
-    keyboard = InlineKeyboardMarkup(keyboard_rows)
-    return "\n".join(lines).strip(), keyboard, current_page
+    return "\n".join(lines).strip(), InlineKeyboardMarkup(keyboard_rows)
+
 
 
 def _metrics_container(context: CallbackContext) -> Dict[str, Any]:
@@ -3618,59 +4327,106 @@ def build_mode_keyboard() -> InlineKeyboardMarkup:
 async def send_preview_photos(
     update: Optional[Update],
     data: Union[ConclusionData, Dict[str, Any]],
-    max_items: int = PREVIEW_MAX_ITEMS,
+    max_items: Optional[int] = None,
     bot=None,
     chat_id: Optional[int] = None,
     thread_id: Optional[int] = None,
-) -> None:
-    """Отправляет медиагруппу с последними фотографиями для визуального подтверждения."""
+) -> bool:
+    """Отправляет превью предметов медиагруппами по 10 штук.
+
+    Используются миниатюры, созданные при приёме фото; после первой отправки
+    их file_id сохраняется в записи предмета, и повторные превью уходят без
+    загрузки файлов. Возвращает True, если появились новые file_id и данные
+    стоит сохранить.
+    """
     if isinstance(data, ConclusionData):
         photos = data.photo_desc
     else:
         photos = data.get('photo_desc', []) if data else []
-    available = []
+    available: List[Dict[str, Any]] = []
     for item in photos:
-        photo_path = Path(item.get('photo', ""))
-        if photo_path.is_file():
-            available.append((photo_path, item))
+        if item.get('thumb_file_id') or Path(item.get('thumb') or "").is_file() or Path(item.get('photo', "")).is_file():
+            available.append(item)
+    if max_items:
+        available = available[-max_items:]
     if not available:
-        return
-    selected = available[-max_items:]
+        return False
+
+    target_bot = bot or (update.get_bot() if update else None)
+    if update and update.message:
+        target_chat_id = update.message.chat_id
+        target_thread_id = getattr(update.message, "message_thread_id", None)
+    else:
+        target_chat_id = chat_id
+        target_thread_id = thread_id
+    if target_bot is None or target_chat_id is None:
+        return False
+
+    updated = False
+    for start in range(0, len(available), PREVIEW_MEDIA_GROUP_SIZE):
+        page = available[start:start + PREVIEW_MEDIA_GROUP_SIZE]
+        messages = await _send_preview_page(target_bot, target_chat_id, target_thread_id, page, use_file_ids=True)
+        if messages is None and any(item.get('thumb_file_id') for item in page):
+            for item in page:
+                item.pop('thumb_file_id', None)
+            messages = await _send_preview_page(target_bot, target_chat_id, target_thread_id, page, use_file_ids=False)
+        if not messages:
+            continue
+        for item, sent in zip(page, messages):
+            sent_photos = getattr(sent, "photo", None)
+            if sent_photos and item.get('thumb_file_id') != sent_photos[-1].file_id:
+                item['thumb_file_id'] = sent_photos[-1].file_id
+                updated = True
+    return updated
+
+
+async def _send_preview_page(
+    bot,
+    chat_id: int,
+    thread_id: Optional[int],
+    items: List[Dict[str, Any]],
+    use_file_ids: bool,
+) -> Optional[List[Any]]:
     media_items: List[InputMediaPhoto] = []
     opened_files = []
-    for path, item in selected:
-        try:
-            file = path.open("rb")
-        except OSError as err:
-            logger.warning(f"Не удалось открыть файл для превью {path}: {err}")
-            continue
-        opened_files.append(file)
-        caption_lines = [
-            item.get('description', 'Без описания'),
-            f"💰 {item.get('evaluation', 'Нет оценки')} руб."
-        ]
-        caption = "\n".join(line for line in caption_lines if line)
-        media_items.append(InputMediaPhoto(file, caption=caption or None))
-    if not media_items:
-        for file in opened_files:
-            try:
-                file.close()
-            except Exception:
-                pass
-        return
     try:
-        if update and update.message:
-            await update.message.reply_media_group(media_items)
-        else:
-            target_bot = bot or (update.get_bot() if update else None)
-            if target_bot and chat_id is not None:
-                await target_bot.send_media_group(
-                    chat_id=chat_id,
-                    media=media_items,
-                    message_thread_id=thread_id,
-                )
+        for item in items:
+            caption_lines = [
+                item.get('description', 'Без описания'),
+                f"💰 {item.get('evaluation', 'Нет оценки')} руб."
+            ]
+            caption = "\n".join(line for line in caption_lines if line) or None
+            file_id = item.get('thumb_file_id') if use_file_ids else None
+            if file_id:
+                media_items.append(InputMediaPhoto(file_id, caption=caption))
+                continue
+            thumb_path = Path(item.get('thumb') or "")
+            path = thumb_path if thumb_path.is_file() else Path(item.get('photo', ""))
+            try:
+                file = path.open("rb")
+            except OSError as err:
+                logger.warning(f"Не удалось открыть файл для превью {path}: {err}")
+                return []
+            opened_files.append(file)
+            media_items.append(InputMediaPhoto(file, caption=caption))
+
+        if len(media_items) == 1:
+            single = media_items[0]
+            message = await bot.send_photo(
+                chat_id=chat_id,
+                photo=single.media,
+                caption=single.caption,
+                message_thread_id=thread_id,
+            )
+            return [message]
+        return list(await bot.send_media_group(
+            chat_id=chat_id,
+            media=media_items,
+            message_thread_id=thread_id,
+        ))
     except TelegramError as e:
         logger.warning(f"Не удалось отправить превью фотографий: {e}")
+        return None
     finally:
         for file in opened_files:
             try:
@@ -3679,26 +4435,95 @@ async def send_preview_photos(
                 pass
 
 
-async def create_excel_snapshot(rows: List[List[Any]], filename_prefix: str) -> Path:
+
+EXCEL_STREAM_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def _write_excel_rows(target: Any, rows: Iterable[Sequence[Any]]) -> int:
+    """Пишет строки в write-only книгу: память не растёт с числом строк."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(EXCEL_HEADERS)
+    written = 0
+    for row in rows:
+        ws.append(list(row))
+        written += 1
+    wb.save(target)
+    return written
+
+
+def build_excel_stream(rows: Iterable[Sequence[Any]]) -> Tuple[Any, int]:
+    """Собирает xlsx во временный файл в памяти (с выгрузкой на диск) для отправки без копии в DOCS_DIR."""
+    handle = tempfile.SpooledTemporaryFile(max_size=EXCEL_STREAM_SPOOL_BYTES)
+    try:
+        written = _write_excel_rows(handle, rows)
+    except Exception:
+        handle.close()
+        raise
+    handle.seek(0)
+    return handle, written
+
+
+async def create_excel_snapshot(rows: Iterable[Sequence[Any]], filename_prefix: str) -> Path:
     """Создаёт временный Excel-файл с переданными строками и возвращает путь."""
     DOCS_DIR.mkdir(parents=True, exist_ok=True)
     timestamp = datetime.now().strftime("%d.%m.%Y_%H-%M-%S")
 
     def _write_snapshot() -> Path:
-        wb = Workbook()
-        ws = wb.active
-        ws.append(EXCEL_HEADERS)
-        for row in rows:
-            ws.append(row)
         raw_name = f"{filename_prefix}_{timestamp}.xlsx"
         filepath = DOCS_DIR / sanitize_filename(raw_name)
-        wb.save(filepath)
-        wb.close()
+        _write_excel_rows(filepath, rows)
         return filepath
 
     return await asyncio.to_thread(_write_snapshot)
 
 
+def iter_completion_item_rows(
+    start_date: datetime,
+    end_date: datetime,
+    region: Optional[str] = None,
+) -> Iterator[List[Any]]:
+    """Построчно выдаёт предметы заключений за период в формате журнала Excel.
+
+    Читает через отдельное read-only соединение, поэтому генератор можно
+    выполнять в потоке, не удерживая db_lock на время выгрузки.
+    """
+    if not DATABASE_FILE.exists():
+        return
+    query = (
+        "SELECT ticket_number, issue_number, department_number, date, region, items_json "
+        "FROM completions WHERE date_iso BETWEEN ? AND ? AND (is_deleted IS NULL OR is_deleted = 0)"
+    )
+    params: List[Any] = [start_date.date().isoformat(), end_date.date().isoformat()]
+    if region:
+        query += " AND region = ?"
+        params.append(region.strip())
+    query += " ORDER BY date_iso, id"
+
+    connection = sqlite3.connect(f"file:{DATABASE_FILE.resolve()}?mode=ro", uri=True)
+    try:
+        for ticket, issue, department, date_text, region_name, items_json in connection.execute(query, params):
+            try:
+                items = json.loads(items_json) if items_json else []
+            except (TypeError, json.JSONDecodeError):
+                items = []
+            for idx, item in enumerate(items, 1):
+                yield [
+                    ticket or "Не указано",
+                    issue or "Не указано",
+                    department or "Не указано",
+                    date_text or "Не указано",
+                    region_name or "Не указано",
+                    idx,
+                    item.get("description", "Нет описания"),
+                    item.get("evaluation", "Нет данных"),
+                ]
+    finally:
+        connection.close()
+
+
 def _read_archive_index() -> List[Dict[str, Any]]:
     if not ARCHIVE_INDEX_FILE.exists():
         return []
@@ -3711,32 +4536,60 @@ def _read_archive_index() -> List[Dict[str, Any]]:
 
 
 def _write_archive_index(entries: List[Dict[str, Any]]) -> None:
+    """Записывает индекс во временный файл и атомарно подменяет им основной."""
     ARCHIVE_INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with ARCHIVE_INDEX_FILE.open("w", encoding="utf-8") as f:
+    tmp_path = ARCHIVE_INDEX_FILE.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
         json.dump(entries, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, ARCHIVE_INDEX_FILE)
 
 
-async def set_archive_entry_status(
-    rel_path: str,
+async def set_archive_entries_status(
+    rel_paths: Sequence[str],
     *,
     deleted: bool,
     initiator_id: Optional[int] = None,
     note: Optional[str] = None,
 ) -> Dict[str, Any]:
+    """Меняет статус нескольких записей индекса архива за одно чтение и одну запись файла."""
+    targets = set(rel_paths)
+    updated_paths: Set[str] = set()
+    if not targets:
+        return {"updated": updated_paths}
     async with archive_lock:
         entries = await asyncio.to_thread(_read_archive_index)
-        updated = False
+        timestamp = _now_iso()
         for entry in entries:
-            if entry.get("archive_path") == rel_path:
+            rel_path = entry.get("archive_path")
+            if rel_path in targets and rel_path not in updated_paths:
                 entry["is_deleted"] = bool(deleted)
-                entry["deleted_at"] = _now_iso() if deleted else None
+                entry["deleted_at"] = timestamp if deleted else None
                 entry["deleted_by"] = initiator_id if deleted else None
                 entry["deletion_note"] = note if deleted else None
-                updated = True
-                break
-        if updated:
+                updated_paths.add(rel_path)
+        if updated_paths:
             await asyncio.to_thread(_write_archive_index, entries)
-    return {"updated": updated}
+    return {"updated": updated_paths}
+
+
+async def set_archive_entry_status(
+    rel_path: str,
+    *,
+    deleted: bool,
+    initiator_id: Optional[int] = None,
+    note: Optional[str] = None,
+) -> Dict[str, Any]:
+    result = await set_archive_entries_status([rel_path], deleted=deleted, initiator_id=initiator_id, note=note)
+    return {"updated": bool(result["updated"])}
+
+
+def _strip_preview_fields(items: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    return [
+        {key: value for key, value in item.items() if key not in PREVIEW_ITEM_FIELDS}
+        for item in items or []
+    ]
 
 
 async def archive_document(filepath: Path, data: Union[ConclusionData, Dict[str, Any]]) -> Optional[Path]:
@@ -3753,7 +4606,7 @@ async def archive_document(filepath: Path, data: Union[ConclusionData, Dict[str,
     subdir_name = dt.strftime("%Y-%m") if dt else "undated"
     month_dir = ARCHIVE_DIR / subdir_name
 
-    description = data_dict.get('photo_desc', [])
+    description = _strip_preview_fields(data_dict.get('photo_desc', []))
 
     def _copy_and_index() -> Optional[Path]:
         month_dir.mkdir(parents=True, exist_ok=True)
@@ -3801,21 +4654,34 @@ def _cleanup_archive_dirs(start_path: Path) -> None:
         logger.debug(f"Не удалось удалить пустую директорию архива {current}: {error}")
 
 
+async def remove_archived_documents(
+    conclusions: Sequence[Dict[str, Any]],
+    initiator_id: Optional[int] = None,
+    note: Optional[str] = None,
+) -> Set[str]:
+    """Помечает архивные файлы пачки заключений удалёнными одной записью индекса."""
+    rel_paths = [conclusion["archive_path"] for conclusion in conclusions if conclusion.get("archive_path")]
+    result = await set_archive_entries_status(rel_paths, deleted=True, initiator_id=initiator_id, note=note)
+    return result["updated"]
+
+
+async def restore_archived_documents(rel_paths: Sequence[Optional[str]], restorer_id: Optional[int] = None) -> Set[str]:
+    targets = [rel_path for rel_path in rel_paths if rel_path]
+    result = await set_archive_entries_status(targets, deleted=False, initiator_id=restorer_id, note=None)
+    return result["updated"]
+
+
 async def remove_archived_document(conclusion: Dict[str, Any], initiator_id: Optional[int] = None, note: Optional[str] = None) -> Dict[str, bool]:
     """Помечает архивный файл как удалённый (soft delete)."""
-    rel_path = conclusion.get("archive_path")
-    if not rel_path:
+    if not conclusion.get("archive_path"):
         return {"file_removed": False, "index_removed": False}
 
-    result = await set_archive_entry_status(rel_path, deleted=True, initiator_id=initiator_id, note=note)
-    return {"file_removed": False, "index_removed": result.get("updated", False)}
+    updated = await remove_archived_documents([conclusion], initiator_id=initiator_id, note=note)
+    return {"file_removed": False, "index_removed": bool(updated)}
 
 
 async def restore_archived_document(rel_path: Optional[str], restorer_id: Optional[int] = None) -> bool:
-    if not rel_path:
-        return False
-    result = await set_archive_entry_status(rel_path, deleted=False, initiator_id=restorer_id, note=None)
-    return result.get("updated", False)
+    return bool(await restore_archived_documents([rel_path], restorer_id))
 
 
 async def get_archive_paths(start_date: datetime, end_date: datetime, region: Optional[str]) -> List[Path]:
@@ -4072,6 +4938,8 @@ async def configure_bot_commands(bot) -> None:
         BotCommand("stats_period", "📈 Статистика за период"),
         BotCommand("search_archive", "🔎 Поиск в архиве"),
         BotCommand("backup", "💾 Резервная копия"),
+        BotCommand("logs", "📜 Логи с фильтром"),
+        BotCommand("void_tickets", "♻️ Обнулить несколько билетов"),
         BotCommand("add_admin", "👥 Добавить администратора"),
         BotCommand("help_admin", "🔧 Справка администратора"),
     ]
@@ -4178,7 +5046,7 @@ async def safe_chat_action(bot, chat_id: int, action: ChatAction, *, message_thr
 
 
 # -------------------- Работа с документами и Excel --------------------
-def replace_placeholders_in_document(doc: Document, placeholders: Dict[str, str]) -> None:
+def replace_placeholders_in_document(doc: Any, placeholders: Dict[str, str]) -> None:
     """Заменяет маркеры в документе на значения из словаря."""
     def _replace_in_runs(runs):
         for run in runs:
@@ -4199,6 +5067,9 @@ def replace_placeholders_in_document(doc: Document, placeholders: Dict[str, str]
 
 def add_borders_to_table(table: Any) -> None:
     """Добавляет границы ко всем ячейкам таблицы."""
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
     for row in table.rows:
         for cell in row.cells:
             tc = cell._element
@@ -4213,8 +5084,10 @@ def add_borders_to_table(table: Any) -> None:
                 borders.append(border_element)
             tcPr.append(borders)
 
-def populate_table_with_data(doc: Document, data: ConclusionData) -> None:
+def populate_table_with_data(doc: Any, data: ConclusionData) -> None:
     """Заполняет первую таблицу документа данными о фотографиях."""
+    from docx.shared import Inches
+
     if not doc.tables:
         logger.error("В документе отсутствуют таблицы.")
         return
@@ -4291,6 +5164,8 @@ async def create_document(user_id: int, username: str = "") -> Path:
         safe_filename_str = candidate_name
 
     def _build_document():
+        from docx import Document
+
         try:
             doc = Document(TEMPLATE_PATH)
             if doc.paragraphs:
@@ -4319,6 +5194,8 @@ async def update_excel(data: Union[ConclusionData, Dict[str, Any]]) -> None:
         else:
             payload = data or {}
 
+        from openpyxl import Workbook, load_workbook
+
         if not EXCEL_FILE.exists():
             wb = Workbook()
             ws = wb.active
@@ -4328,6 +5205,7 @@ async def update_excel(data: Union[ConclusionData, Dict[str, Any]]) -> None:
             ws = wb.active
 
         items = payload.get("photo_desc", [])
+        new_rows = []
         for idx, item in enumerate(items, 1):
             row = [
                 payload.get("ticket_number", "Не указано"),
@@ -4340,76 +5218,87 @@ async def update_excel(data: Union[ConclusionData, Dict[str, Any]]) -> None:
                 item.get("evaluation", "Нет данных")
             ]
             ws.append(row)
+            new_rows.append(row)
         wb.save(EXCEL_FILE)
         wb.close()
+        append_history_mirror(new_rows)
 
     async with excel_lock:
         await asyncio.to_thread(_write_excel)
         logger.info("Excel-файл успешно обновлен.")
 
 
-def _remove_conclusion_from_excel_sync(conclusion: Dict[str, Any]) -> int:
-    if not EXCEL_FILE.exists():
-        return 0
-    try:
-        wb = load_workbook(EXCEL_FILE)
-    except Exception as error:
-        logger.error(f"Не удалось открыть Excel для удаления записи: {error}")
-        return 0
+# -------------------- Колоночное зеркало журнала (Parquet) --------------------
+# Копия conclusions.xlsx в Parquet, разбитая на каталоги month=ГГГГ-ММ/region=<регион>.
+# Отчёты читают из неё только нужные месяцы и регион, не разбирая весь Excel.
+# Зеркало используется, только если установлен pyarrow и оно собрано командой
+#   python "botbotbotbo(запуск) 2.py" mirror-rebuild [--from-excel PATH]
+# (файл-маркер _READY); при сбое дозаписи маркер снимается и отчёты
+# возвращаются к Excel до следующей пересборки. Реализация общая с modern_bot
+# (modern_bot/services/history_mirror.py, там же слияние мелких файлов дозаписи)
+# и импортируется лениво, только если зеркало собрано: без него бот запускается
+# и вне репозитория.
+HISTORY_MIRROR_DIR = Path("history_parquet")
+HISTORY_MIRROR_MARKER = HISTORY_MIRROR_DIR / "_READY"
+_history_mirror: Any = None
+
+
+def _get_history_mirror() -> Optional[Any]:
+    """HistoryMirror для HISTORY_MIRROR_DIR или None, если модуль modern_bot недоступен."""
+    global _history_mirror
+    if _history_mirror is None:
+        repo_root = str(Path(__file__).resolve().parent.parent)
+        if repo_root not in sys.path:
+            sys.path.append(repo_root)
+        try:
+            from modern_bot.services.history_mirror import HistoryMirror
+        except ImportError as error:
+            logger.warning(f"Модуль зеркала журнала недоступен, отчёты читают Excel: {error}")
+            _history_mirror = False
+        else:
+            _history_mirror = HistoryMirror(HISTORY_MIRROR_DIR)
+    return _history_mirror or None
 
-    ws = wb.active
-    rows = list(ws.iter_rows(values_only=True))
-    if not rows:
-        wb.close()
-        return 0
 
-    header = rows[0]
-    data_rows = rows[1:]
+def is_history_mirror_ready() -> bool:
+    if not HISTORY_MIRROR_MARKER.exists():
+        return False
+    mirror = _get_history_mirror()
+    return mirror is not None and mirror.is_ready()
+
 
-    def normalize(value: Any) -> str:
-        if value is None:
-            return ""
-        return str(value).strip()
+def append_history_mirror(rows: Sequence[Sequence[Any]]) -> None:
+    """Дописывает строки журнала в зеркало; вызывается под excel_lock вместе с записью Excel."""
+    if rows and is_history_mirror_ready():
+        _get_history_mirror().append(rows)
 
-    ticket_value = normalize(conclusion.get("ticket_number") or "Не указано")
-    issue_value = normalize(conclusion.get("issue_number") or "Не указано")
-    department_value = normalize(conclusion.get("department_number") or "Не указано")
-    date_value = normalize(conclusion.get("date") or "Не указано")
 
-    filtered: List[List[Any]] = []
-    removed = 0
-    for row in data_rows:
-        if not row:
-            continue
-        row_ticket = normalize(row[0])
-        row_issue = normalize(row[1])
-        row_department = normalize(row[2])
-        row_date = normalize(row[3])
-        if (
-            row_ticket == ticket_value
-            and row_issue == issue_value
-            and row_department == department_value
-            and row_date == date_value
-        ):
-            removed += 1
-            continue
-        filtered.append(list(row))
+def rebuild_history_mirror(excel_path: Path = EXCEL_FILE) -> Dict[str, Any]:
+    """Пересобирает зеркало из Excel в соседнем каталоге и подменяет им текущее."""
+    mirror = _get_history_mirror()
+    if mirror is None:
+        raise RuntimeError("Для зеркала журнала нужен modern_bot/services/history_mirror.py из репозитория.")
+    return mirror.rebuild(excel_path)
 
-    if removed:
-        new_wb = Workbook()
-        new_ws = new_wb.active
-        new_ws.append(list(header))
-        for row in filtered:
-            new_ws.append(list(row))
-        new_wb.save(EXCEL_FILE)
-        new_wb.close()
-    wb.close()
-    return removed
 
+async def read_history_mirror(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    region: Optional[str] = None,
+) -> Optional[List[List[Any]]]:
+    """Читает строки журнала из зеркала с фильтрами по месяцу, дате и региону.
 
-async def remove_conclusion_from_excel(conclusion: Dict[str, Any]) -> int:
-    async with excel_lock:
-        return await asyncio.to_thread(_remove_conclusion_from_excel_sync, conclusion)
+    Возвращает None, если зеркало не собрано или чтение не удалось, чтобы
+    вызывающий код перешёл на Excel.
+    """
+    if not is_history_mirror_ready():
+        return None
+    try:
+        async with excel_lock:
+            return await asyncio.to_thread(_get_history_mirror().read, start_date, end_date, region)
+    except Exception as error:
+        logger.warning(f"Не удалось прочитать зеркало журнала: {error}")
+        return None
 
 def build_summary(data: ConclusionData) -> str:
     """Формирует расширенную сводку введенных данных для подтверждения."""
@@ -4446,19 +5335,21 @@ def build_summary(data: ConclusionData) -> str:
 async def show_summary(target: Any, context: CallbackContext, data: ConclusionData) -> None:
     clear_pending_items(context)
     metrics_enter_state(context, DialogState.CONFIRMATION)
-    message, chat_id, thread_id, _ = _resolve_chat_context(target)
+    message, chat_id, thread_id, user_id = _resolve_chat_context(target)
     if chat_id is None:
         return
     if isinstance(target, Update):
-        await send_preview_photos(target, data)
+        previews_updated = await send_preview_photos(target, data)
     else:
-        await send_preview_photos(
+        previews_updated = await send_preview_photos(
             None,
             data,
             bot=context.bot,
             chat_id=chat_id,
             thread_id=thread_id,
         )
+    if previews_updated and user_id:
+        await save_user_data_to_db(user_id, data)
     summary_text = build_summary(data)
     keyboard = build_confirmation_keyboard(data, include_back=has_previous_state(context))
     summary_message = await _send_via_target(
@@ -4635,7 +5526,9 @@ async def read_excel_data() -> List[List[str]]:
     def _read_excel():
         if not EXCEL_FILE.exists():
             return []
-        wb = load_workbook(EXCEL_FILE)
+        from openpyxl import load_workbook
+
+        wb = load_workbook(EXCEL_FILE, read_only=True)
         ws = wb.active
         rows = [list(row) for row in ws.iter_rows(min_row=2, values_only=True)]
         wb.close()
@@ -4644,28 +5537,87 @@ async def read_excel_data() -> List[List[str]]:
     async with excel_lock:
         return await asyncio.to_thread(_read_excel)
 
+async def fetch_history_page(
+    anchor: Optional[Tuple[str, int]] = None,
+    direction: str = "n",
+    page_size: int = HISTORY_PAGE_SIZE,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Возвращает страницу истории (новые сверху) одним диапазонным запросом по индексу.
+
+    anchor — ключ (completed_at, id) крайней записи соседней страницы; direction
+    "n" листает к более старым записям, "p" — к более новым. Второе значение
+    показывает, есть ли ещё записи в направлении листания.
+    """
+    if not _is_db_ready():
+        return [], False
+
+    query = (
+        "SELECT id, completed_at, ticket_number, issue_number, department_number, date, region, "
+        "item_count, total_evaluation, items_json FROM completions WHERE is_deleted = 0"
+    )
+    params: List[Any] = []
+    if anchor and direction == "p":
+        query += " AND (completed_at, id) > (?, ?) ORDER BY completed_at ASC, id ASC"
+        params.extend(anchor)
+    elif anchor:
+        query += " AND (completed_at, id) < (?, ?) ORDER BY completed_at DESC, id DESC"
+        params.extend(anchor)
+    else:
+        query += " ORDER BY completed_at DESC, id DESC"
+    query += " LIMIT ?"
+    params.append(page_size + 1)
+
+    async with db_lock:
+        try:
+            async with db.execute(query, tuple(params)) as cursor:
+                rows = await cursor.fetchall()
+        except Exception as error:
+            logger.error(f"Не удалось получить страницу истории: {error}")
+            return [], False
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if anchor and direction == "p":
+        rows.reverse()
+
+    records: List[Dict[str, Any]] = []
+    for row in rows:
+        try:
+            items = json.loads(row[9]) if row[9] else []
+        except (TypeError, json.JSONDecodeError):
+            items = []
+        records.append(
+            {
+                "id": row[0],
+                "completed_at": row[1],
+                "ticket_number": row[2],
+                "issue_number": row[3],
+                "department_number": row[4],
+                "date": row[5],
+                "region": row[6],
+                "item_count": int(row[7] or 0),
+                "total_evaluation": float(row[8] or 0.0),
+                "items": items,
+            }
+        )
+    return records, has_more
+
+
 async def history_handler(update: Update, context: CallbackContext) -> None:
     if not is_admin(update.message.from_user.id):
         await safe_reply(update, "Недостаточно прав для доступа к истории.")
         return
-    records = await read_excel_data()
+    records, has_next = await fetch_history_page()
     if not records:
         await safe_reply(update, "История заключений пуста.")
         return
-    recent_records = list(reversed(records[-200:])) if len(records) > 200 else list(reversed(records))
-    context.user_data["history_cache"] = {
-        "records": recent_records,
-        "page_size": 6,
-        "page": 1,
-    }
-    text, keyboard, current_page = build_history_page(recent_records, 1, 6)
+    text, keyboard = build_history_page(records, 1, False, has_next)
     message = await safe_reply(update, text, reply_markup=keyboard)
     if message:
         context.user_data["history_message"] = {
             "chat_id": message.chat_id,
             "message_id": message.message_id,
         }
-        context.user_data["history_cache"]["page"] = current_page
 
 
 async def search_archive_handler(update: Update, context: CallbackContext) -> None:
@@ -4796,7 +5748,9 @@ async def stats_handler(update: Update, context: CallbackContext) -> None:
     if not is_admin(update.message.from_user.id):
         await safe_reply(update, "Недостаточно прав для доступа к статистике.")
         return
-    records = await read_excel_data()
+    records = await read_history_mirror()
+    if records is None:
+        records = await read_excel_data()
     if not records:
         await safe_reply(update, "Нет данных для статистики.")
         return
@@ -4949,13 +5903,62 @@ def build_analytics_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
-def generate_trend_chart(records: List[Dict[str, Any]], days: int) -> Optional[io.BytesIO]:
+# -------------------- Графики аналитики --------------------
+CHART_CACHE_LIMIT: int = 16
+chart_executor: Optional[ProcessPoolExecutor] = None
+completions_data_version: int = 0
+chart_cache: Dict[Tuple[str, int, str], Dict[str, Any]] = {}
+
+
+def bump_completions_version() -> None:
+    """Помечает закэшированные графики устаревшими после изменения заключений."""
+    global completions_data_version
+    completions_data_version += 1
+    chart_cache.clear()
+
+
+def _get_chart_executor() -> ProcessPoolExecutor:
+    global chart_executor
+    if chart_executor is None:
+        chart_executor = ProcessPoolExecutor(max_workers=1, initializer=chart_render.init_worker)
+    return chart_executor
+
+
+def warm_chart_worker() -> None:
+    """Запускает процесс отрисовки заранее, чтобы импорт matplotlib не попадал на первый запрос."""
+    try:
+        _get_chart_executor().submit(chart_render.ping)
+    except Exception as error:
+        logger.warning(f"Не удалось запустить процесс отрисовки графиков: {error}")
+
+
+def shutdown_chart_worker() -> None:
+    global chart_executor
+    if chart_executor is not None:
+        chart_executor.shutdown(wait=False, cancel_futures=True)
+        chart_executor = None
+
+
+async def _render_chart(func: Callable[..., Optional[bytes]], *args: Any) -> Optional[bytes]:
+    global chart_executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_chart_executor(), func, *args)
+    except BrokenProcessPool as error:
+        logger.error(f"Процесс отрисовки графиков завершился аварийно: {error}")
+        chart_executor = None
+    except Exception as error:
+        logger.error(f"Ошибка построения графика: {error}")
+    return None
+
+
+def build_trend_series(records: List[Dict[str, Any]], days: int) -> Tuple[List[date], List[int]]:
     if not records:
-        return None
+        return [], []
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=days - 1)
     day_cursor = start_date
-    counts: Dict[datetime.date, int] = {}
+    counts: Dict[date, int] = {}
     while day_cursor <= end_date:
         counts[day_cursor] = 0
         day_cursor += timedelta(days=1)
@@ -4965,27 +5968,10 @@ def generate_trend_chart(records: List[Dict[str, Any]], days: int) -> Optional[i
             counts[day] = counts.get(day, 0) + 1
 
     dates = sorted(counts.keys())
-    values = [counts[day] for day in dates]
-    if not any(values):
-        return None
+    return dates, [counts[day] for day in dates]
+
 
-    fig, ax = plt.subplots(figsize=(8, 4))
-    ax.plot(dates, values, marker="o", linewidth=2)
-    ax.set_title(f"Заключения за {days} дней")
-    ax.set_ylabel("Количество")
-    ax.set_xlabel("Дата")
-    ax.grid(True, linestyle="--", alpha=0.4)
-    ax.xaxis.set_major_formatter(DateFormatter("%d.%m"))
-    fig.autofmt_xdate()
-    buf = io.BytesIO()
-    fig.tight_layout()
-    fig.savefig(buf, format="png")
-    plt.close(fig)
-    buf.seek(0)
-    return buf
-
-
-def generate_step_duration_chart(records: List[Dict[str, Any]]) -> Optional[io.BytesIO]:
+def build_step_duration_series(records: List[Dict[str, Any]]) -> Tuple[List[str], List[float]]:
     durations_map: Dict[str, List[float]] = {}
     for rec in records:
         metrics = rec.get("step_metrics") or {}
@@ -4997,9 +5983,6 @@ def generate_step_duration_chart(records: List[Dict[str, Any]]) -> Optional[io.B
                 continue
             durations_map.setdefault(state_name, []).append(seconds_val)
 
-    if not durations_map:
-        return None
-
     averages = [
         (state_name, statistics.mean(values))
         for state_name, values in durations_map.items()
@@ -5009,19 +5992,64 @@ def generate_step_duration_chart(records: List[Dict[str, Any]]) -> Optional[io.B
     top_entries = averages[:7]
     labels = [get_state_label(name) for name, _ in top_entries]
     values = [duration for _, duration in top_entries]
-
-    fig, ax = plt.subplots(figsize=(8, 4))
-    ax.bar(labels, values, color="#4c8bf5")
-    ax.set_title("Средняя длительность этапов (с)")
-    ax.set_ylabel("Секунды")
-    ax.set_xticklabels(labels, rotation=20, ha="right")
-    ax.grid(True, axis="y", linestyle="--", alpha=0.3)
-    buf = io.BytesIO()
-    fig.tight_layout()
-    fig.savefig(buf, format="png")
-    plt.close(fig)
-    buf.seek(0)
-    return buf
+    return labels, values
+
+
+async def get_analytics_chart(chart_key: str) -> Dict[str, Any]:
+    """Возвращает график из кэша или строит его в отдельном процессе.
+
+    Запись кэша содержит PNG и file_id Telegram после первой отправки; ключ
+    включает версию данных заключений и текущую дату, поэтому новые, удалённые
+    и восстановленные заключения сразу приводят к перестроению.
+    """
+    version = completions_data_version
+    cache_key = (chart_key, version, datetime.now().date().isoformat())
+    entry = chart_cache.get(cache_key)
+    if entry is not None:
+        return entry
+
+    png: Optional[bytes] = None
+    has_data = False
+    if chart_key.startswith("trend:"):
+        days = int(chart_key.split(":", 1)[1])
+        records = await fetch_completion_stats(days)
+        dates, values = build_trend_series(records, days)
+        if dates and any(values):
+            has_data = True
+            png = await _render_chart(chart_render.render_trend_chart, dates, values, days)
+    elif chart_key == "steps":
+        records = await fetch_completion_stats(60)
+        labels, values = build_step_duration_series(records)
+        if labels:
+            has_data = True
+            png = await _render_chart(chart_render.render_step_duration_chart, labels, values)
+
+    entry = {"png": png, "file_id": None}
+    # Сбой отрисовки не кэшируем: иначе до смены версии данных или даты
+    # пользователь видел бы «Недостаточно данных» вместо графика.
+    if has_data and png is None:
+        return entry
+    if version == completions_data_version:
+        if len(chart_cache) >= CHART_CACHE_LIMIT:
+            chart_cache.pop(next(iter(chart_cache)))
+        chart_cache[cache_key] = entry
+    return entry
+
+
+async def send_analytics_chart(bot, chat_id: int, entry: Dict[str, Any], caption: str) -> None:
+    """Отправляет график, повторно используя file_id вместо новой загрузки PNG."""
+    file_id = entry.get("file_id")
+    if file_id:
+        try:
+            await bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption)
+            return
+        except TelegramError as error:
+            logger.debug(f"Не удалось отправить график по file_id: {error}")
+            entry["file_id"] = None
+    message = await bot.send_photo(chat_id=chat_id, photo=entry["png"], caption=caption)
+    photos = getattr(message, "photo", None)
+    if photos:
+        entry["file_id"] = photos[-1].file_id
 
 
 async def analytics_handler(update: Update, context: CallbackContext) -> None:
@@ -5090,27 +6118,25 @@ async def analytics_callback_handler(update: Update, context: CallbackContext) -
         except (ValueError, IndexError):
             await query.answer("Неизвестный параметр периода.", show_alert=True)
             return
-        records = await fetch_completion_stats(days)
-        chart = generate_trend_chart(records, days)
-        if not chart:
+        chart = await get_analytics_chart(f"trend:{days}")
+        if not chart["png"]:
             await query.answer("Недостаточно данных для графика.", show_alert=True)
             return
         if chat_id is not None:
             await safe_chat_action(context.bot, chat_id, ChatAction.UPLOAD_PHOTO, message_thread_id=thread_id)
             caption = f"📈 Заключения за {days} дней"
-            await context.bot.send_photo(chat_id=chat_id, photo=chart, caption=caption)
+            await send_analytics_chart(context.bot, chat_id, chart, caption)
         await query.answer("График отправлен.")
         return
 
     if action == "steps":
-        records = await fetch_completion_stats(60)
-        chart = generate_step_duration_chart(records)
-        if not chart:
+        chart = await get_analytics_chart("steps")
+        if not chart["png"]:
             await query.answer("Недостаточно данных по длительностям.", show_alert=True)
             return
         if chat_id is not None:
             await safe_chat_action(context.bot, chat_id, ChatAction.UPLOAD_PHOTO, message_thread_id=thread_id)
-            await context.bot.send_photo(chat_id=chat_id, photo=chart, caption="⏱ Средняя длительность этапов")
+            await send_analytics_chart(context.bot, chat_id, chart, "⏱ Средняя длительность этапов")
         await query.answer("Диаграмма отправлена.")
         return
 
@@ -5123,18 +6149,8 @@ async def backup_handler(update: Update, context: CallbackContext) -> None:
         await safe_reply(update, "Команда доступна только администраторам.")
         return
     await safe_chat_action(context.bot, update.effective_chat.id, ChatAction.UPLOAD_DOCUMENT)
-    backup_path = await create_backup_archive()
-    if not backup_path:
-        await safe_reply(update, "Не удалось сформировать резервную копию.")
-        return
-    try:
-        await send_document_from_path(context.bot, chat_id=update.effective_chat.id, path=backup_path, caption="📦 Резервная копия")
-    finally:
-        try:
-            if backup_path.exists():
-                backup_path.unlink()
-        except OSError:
-            pass
+    if not await send_backup_archive(context.bot, update.effective_chat.id):
+        await safe_reply(update, "Не удалось сформировать или отправить резервную копию.")
 
 
 def build_admin_main_text() -> str:
@@ -5167,73 +6183,482 @@ def format_user_entry(user: Dict[str, Any]) -> str:
     return "\n".join(lines)
 
 
-def build_deleted_entry_text(entry: Dict[str, Any]) -> str:
-    deleted_at = entry.get("deleted_at") or "—"
-    return (
-        f"{entry['id']} • {entry.get('username') or '—'}\n"
-        f"  Билет {entry.get('ticket_number') or '—'}, № {entry.get('issue_number') or '—'}\n"
-        f"  Дата {entry.get('date') or '—'}, {entry.get('region') or '—'}\n"
-        f"  Удалено: {deleted_at}"
+def build_deleted_entry_text(entry: Dict[str, Any]) -> str:
+    deleted_at = entry.get("deleted_at") or "—"
+    return (
+        f"{entry['id']} • {entry.get('username') or '—'}\n"
+        f"  Билет {entry.get('ticket_number') or '—'}, № {entry.get('issue_number') or '—'}\n"
+        f"  Дата {entry.get('date') or '—'}, {entry.get('region') or '—'}\n"
+        f"  Удалено: {deleted_at}"
+    )
+
+
+LOG_TAIL_BLOCK_SIZE: int = 64 * 1024
+LOG_TAIL_MAX_CHARS: int = 3500
+LOG_LEVEL_FILTERS: Tuple[str, ...] = ("ERROR", "WARNING", "INFO")
+LOG_RECORD_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - .*? - (?P<level>[A-Z]+) - ")
+
+
+def _log_files_newest_first() -> List[Path]:
+    files = [LOG_FILE]
+    files.extend(LOG_FILE.with_name(f"{LOG_FILE.name}.{index}") for index in range(1, LOG_BACKUP_COUNT + 1))
+    return [path for path in files if path.exists()]
+
+
+def _iter_file_lines_reversed(path: Path) -> Iterator[str]:
+    """Читает файл блоками с конца и выдаёт строки от последней к первой."""
+    with path.open("rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        position = fh.tell()
+        remainder = b""
+        while position > 0:
+            read_size = min(LOG_TAIL_BLOCK_SIZE, position)
+            position -= read_size
+            fh.seek(position)
+            chunk = fh.read(read_size) + remainder
+            lines = chunk.split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode("utf-8", errors="ignore").rstrip("\r")
+        if remainder:
+            yield remainder.decode("utf-8", errors="ignore").rstrip("\r")
+
+
+def _iter_log_records_reversed() -> Iterator[Tuple[Optional[str], List[str]]]:
+    """Выдаёт записи лога (с многострочными трейсбеками) от новых к старым, включая ротированные файлы."""
+    pending: List[str] = []
+    for path in _log_files_newest_first():
+        try:
+            for line in _iter_file_lines_reversed(path):
+                pending.append(line)
+                match = LOG_RECORD_PATTERN.match(line)
+                if match:
+                    pending.reverse()
+                    yield match.group("level"), pending
+                    pending = []
+        except OSError as error:
+            logger.error(f"Не удалось прочитать лог-файл {path}: {error}")
+    if pending:
+        pending.reverse()
+        yield None, pending
+
+
+def read_log_tail(lines: int = 200, level: Optional[str] = None, substring: Optional[str] = None) -> str:
+    """Возвращает последние строки логов, не читая файлы целиком.
+
+    level оставляет записи этого уровня и выше, substring — записи,
+    содержащие подстроку (без учёта регистра).
+    """
+    if not _log_files_newest_first():
+        return "Лог-файл ещё не создан."
+    min_level = logging.getLevelName(level.upper()) if level else None
+    if not isinstance(min_level, int):
+        min_level = None
+    needle = substring.lower() if substring else None
+
+    collected: List[List[str]] = []
+    total_lines = 0
+    total_chars = 0
+    for record_level, record_lines in _iter_log_records_reversed():
+        if min_level is not None:
+            numeric_level = logging.getLevelName(record_level) if record_level else None
+            if not isinstance(numeric_level, int) or numeric_level < min_level:
+                continue
+        if needle and not any(needle in line.lower() for line in record_lines):
+            continue
+        collected.append(record_lines)
+        total_lines += len(record_lines)
+        total_chars += sum(len(line) + 1 for line in record_lines)
+        if total_lines >= lines or total_chars >= LOG_TAIL_MAX_CHARS:
+            break
+
+    text = "\n".join(line for record_lines in reversed(collected) for line in record_lines)
+    if len(text) > LOG_TAIL_MAX_CHARS:
+        text = text[-LOG_TAIL_MAX_CHARS:]
+    if not text:
+        return "Подходящих записей нет." if (min_level is not None or needle) else "Лог пуст."
+    return text
+
+
+def build_logs_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("🔴 Ошибки", callback_data=f"{ADMIN_CALLBACK_PREFIX}view:logs:ERROR"),
+            InlineKeyboardButton("🟠 Предупреждения", callback_data=f"{ADMIN_CALLBACK_PREFIX}view:logs:WARNING"),
+            InlineKeyboardButton("Все", callback_data=f"{ADMIN_CALLBACK_PREFIX}view:logs"),
+        ],
+        [InlineKeyboardButton("⬅️ Назад", callback_data=f"{ADMIN_CALLBACK_PREFIX}back")],
+        [InlineKeyboardButton("📄 Скачать файл", callback_data=f"{ADMIN_CALLBACK_PREFIX}download_logs")],
+        [InlineKeyboardButton("Закрыть", callback_data=f"{ADMIN_CALLBACK_PREFIX}close")],
+    ])
+
+
+async def logs_handler(update: Update, context: CallbackContext) -> None:
+    """/logs [LEVEL] [подстрока] — последние записи логов с фильтром."""
+    user = update.message.from_user
+    if not is_admin(user.id):
+        await safe_reply(update, "Команда доступна только администраторам.")
+        return
+    args = list(context.args or [])
+    level = None
+    if args and args[0].upper() in LOG_LEVEL_FILTERS + ("DEBUG", "CRITICAL"):
+        level = args.pop(0).upper()
+    substring = " ".join(args) or None
+    log_text = await asyncio.to_thread(read_log_tail, 200, level, substring)
+    filters_label = ", ".join(part for part in (level, f"«{substring}»" if substring else None) if part)
+    header = f"📜 Последние строки логов ({filters_label}):\n" if filters_label else "📜 Последние строки логов:\n"
+    await safe_reply(update, header + log_text)
+
+
+BACKUP_CHUNKS_DIR = BACKUP_ROOT / "chunks"
+BACKUP_MANIFESTS_DIR = BACKUP_ROOT / "manifests"
+BACKUP_CHUNK_SIZE: int = 4 * 1024 * 1024
+BACKUP_UPLOAD_LIMIT_BYTES: int = 45 * 1024 * 1024
+BACKUP_MAX_PARTS_PER_RUN: int = 20
+BACKUP_OFFSITE_FILE = BACKUP_ROOT / "offsite.json"
+BACKUP_DATABASE_NAME = "user_data.db"
+
+
+def _backup_relpath(path: Path) -> str:
+    try:
+        return path.resolve().relative_to(Path.cwd().resolve()).as_posix()
+    except ValueError:
+        return path.name
+
+
+def _backup_chunk_path(digest: str) -> Path:
+    return BACKUP_CHUNKS_DIR / digest[:2] / digest
+
+
+def _backup_temp_path(directory: Path, prefix: str) -> Path:
+    """Уникальный временный файл в directory (рядом с целью, чтобы os.replace был атомарным)."""
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(prefix=prefix, suffix=".tmp", dir=directory)
+    os.close(fd)
+    return Path(name)
+
+
+def _replace_backup_file(path: Path, data: bytes) -> None:
+    tmp_path = _backup_temp_path(path.parent, f".{path.name}.")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _store_file_chunks(path: Path, new_chunks: List[str]) -> List[str]:
+    """Режет файл на чанки фиксированного размера и кладёт в хранилище только отсутствующие."""
+    digests: List[str] = []
+    with path.open("rb") as source:
+        while True:
+            block = source.read(BACKUP_CHUNK_SIZE)
+            if not block:
+                break
+            digest = hashlib.sha256(block).hexdigest()
+            chunk_path = _backup_chunk_path(digest)
+            if not chunk_path.exists():
+                _replace_backup_file(chunk_path, block)
+                new_chunks.append(digest)
+            digests.append(digest)
+    return digests
+
+
+def list_backup_manifests() -> List[Path]:
+    if not BACKUP_MANIFESTS_DIR.exists():
+        return []
+    return sorted(BACKUP_MANIFESTS_DIR.glob("backup_*.json"))
+
+
+def _load_backup_manifest(path: Path) -> Dict[str, Any]:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as error:
+        logger.error(f"Не удалось прочитать манифест резервной копии {path}: {error}")
+        return {}
+
+
+def _snapshot_database(target: Path) -> None:
+    """Копирует БД через online backup API SQLite, согласованно с WAL."""
+    source = sqlite3.connect(f"file:{DATABASE_FILE.resolve()}?mode=ro", uri=True)
+    destination = sqlite3.connect(target)
+    try:
+        source.backup(destination)
+    finally:
+        destination.close()
+        source.close()
+
+
+def _collect_backup_sources(staging_dir: Path) -> List[Tuple[str, Path, os.stat_result]]:
+    """Список файлов для снимка: (путь в манифесте, откуда читать, stat оригинала).
+
+    Вызывается под archive_lock, поэтому только перечисляет файлы и копирует
+    индекс архива в staging_dir; чтение и хэширование идут уже без блокировки.
+    """
+    sources: List[Tuple[str, Path, os.stat_result]] = []
+    for source in [EXCEL_FILE, DOCS_DIR, ARCHIVE_DIR, LOG_DIR]:
+        if not source.exists():
+            continue
+        candidates = [source] if source.is_file() else sorted(p for p in source.rglob("*") if p.is_file())
+        for file_path in candidates:
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            read_path = file_path
+            if file_path == ARCHIVE_INDEX_FILE:
+                read_path = staging_dir / file_path.name
+                shutil.copy2(file_path, read_path)
+            sources.append((_backup_relpath(file_path), read_path, stat))
+    return sources
+
+
+def _new_manifest_path(created_at: datetime) -> Path:
+    """Имя манифеста с микросекундами; при совпадении добавляется счётчик."""
+    stem = f"backup_{created_at.strftime('%Y%m%d_%H%M%S_%f')}"
+    manifest_path = BACKUP_MANIFESTS_DIR / f"{stem}.json"
+    counter = 1
+    while manifest_path.exists():
+        manifest_path = BACKUP_MANIFESTS_DIR / f"{stem}_{counter}.json"
+        counter += 1
+    return manifest_path
+
+
+def create_backup_snapshot(
+    sources: Optional[List[Tuple[str, Path, os.stat_result]]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Делает инкрементальный снимок данных в BACKUP_ROOT и возвращает отчёт.
+
+    Файлы с теми же размером и mtime, что в прошлом манифесте, не читаются;
+    остальные режутся на чанки, и в хранилище дописываются только новые.
+    sources — заранее собранный _collect_backup_sources список; без него
+    (офлайн-запуск из CLI) файлы перечисляются здесь же.
+    """
+    started = time.perf_counter()
+    manifests = list_backup_manifests()
+    previous_files: Dict[str, Dict[str, Any]] = {}
+    if manifests:
+        previous_files = _load_backup_manifest(manifests[-1]).get("files", {})
+
+    BACKUP_MANIFESTS_DIR.mkdir(parents=True, exist_ok=True)
+    files: Dict[str, Dict[str, Any]] = {}
+    new_chunks: List[str] = []
+    reused_files = 0
+    staging_dir: Optional[Path] = None
+
+    try:
+        if sources is None:
+            staging_dir = Path(tempfile.mkdtemp(prefix=".staging_", dir=BACKUP_ROOT))
+            sources = _collect_backup_sources(staging_dir)
+
+        if DATABASE_FILE.exists():
+            db_copy = _backup_temp_path(BACKUP_ROOT, f".{BACKUP_DATABASE_NAME}.snapshot.")
+            try:
+                _snapshot_database(db_copy)
+                files[BACKUP_DATABASE_NAME] = {
+                    "size": db_copy.stat().st_size,
+                    "mtime_ns": DATABASE_FILE.stat().st_mtime_ns,
+                    "chunks": _store_file_chunks(db_copy, new_chunks),
+                }
+            finally:
+                if db_copy.exists():
+                    db_copy.unlink()
+
+        for rel_path, read_path, stat in sources:
+            previous = previous_files.get(rel_path)
+            if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+                files[rel_path] = previous
+                reused_files += 1
+                continue
+            try:
+                chunks = _store_file_chunks(read_path, new_chunks)
+            except OSError as error:
+                logger.warning(f"Файл {rel_path} пропущен при резервном копировании: {error}")
+                continue
+            files[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "chunks": chunks}
+    finally:
+        if staging_dir is not None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    if not files:
+        return None
+
+    created_at = datetime.now()
+    manifest_path = _new_manifest_path(created_at)
+    manifest = {
+        "created_at": created_at.isoformat(timespec="microseconds"),
+        "chunk_size": BACKUP_CHUNK_SIZE,
+        "files": files,
+    }
+    _replace_backup_file(manifest_path, json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+
+    new_bytes = sum(_backup_chunk_path(digest).stat().st_size for digest in new_chunks)
+    offsite = _load_offsite_chunks()
+    pending_chunks = sorted({
+        digest
+        for entry in files.values()
+        for digest in entry.get("chunks", [])
+        if digest not in offsite
+    })
+    report = {
+        "manifest": manifest_path,
+        "new_chunks": new_chunks,
+        "new_bytes": new_bytes,
+        "pending_chunks": pending_chunks,
+        "pending_bytes": sum(_backup_chunk_path(digest).stat().st_size for digest in pending_chunks),
+        "total_files": len(files),
+        "reused_files": reused_files,
+        "total_bytes": sum(entry.get("size", 0) for entry in files.values()),
+        "seconds": time.perf_counter() - started,
+    }
+    logger.info(
+        f"Резервная копия {manifest_path.name}: файлов {report['total_files']} "
+        f"(без изменений {reused_files}), новых чанков {len(new_chunks)} ({new_bytes} байт), "
+        f"ещё не отправлено {len(pending_chunks)} за {report['seconds']:.2f} с."
     )
+    return report
 
 
-def read_log_tail(lines: int = 200) -> str:
-    if not LOG_FILE.exists():
-        return "Лог-файл ещё не создан."
+def _load_offsite_chunks() -> Set[str]:
+    """Чанки, уже успешно отправленные в Telegram."""
     try:
-        with LOG_FILE.open("r", encoding="utf-8", errors="ignore") as fh:
-            content = fh.readlines()
-    except OSError as error:
-        logger.error(f"Не удалось прочитать лог-файл: {error}")
-        return "Не удалось прочитать лог-файл."
-    tail = content[-lines:]
-    text = "".join(tail)
-    if len(text) > 3500:
-        text = text[-3500:]
-    return text or "Лог пуст."
-
-
-async def create_backup_archive() -> Optional[Path]:
-    sources: List[Path] = []
-    for path in [DATABASE_FILE, EXCEL_FILE, DOCS_DIR, ARCHIVE_DIR, LOG_DIR]:
-        if path.exists():
-            sources.append(path)
-    if not sources:
-        return None
-
+        with BACKUP_OFFSITE_FILE.open("r", encoding="utf-8") as f:
+            return set(json.load(f))
+    except FileNotFoundError:
+        return set()
+    except (OSError, json.JSONDecodeError, TypeError) as error:
+        logger.error(f"Не удалось прочитать список отправленных чанков: {error}")
+        return set()
+
+
+def mark_backup_chunks_offsite(digests: Iterable[str]) -> None:
+    """Отмечает чанки отправленными; вызывается только после успешной загрузки части."""
+    offsite = _load_offsite_chunks()
+    offsite.update(digests)
+    _replace_backup_file(BACKUP_OFFSITE_FILE, json.dumps(sorted(offsite)).encode("utf-8"))
+
+
+def _build_backup_delta_parts(report: Dict[str, Any]) -> List[Tuple[Path, List[str]]]:
+    """Раскладывает неотправленные чанки по zip-частям не больше BACKUP_UPLOAD_LIMIT_BYTES.
+
+    Каждая часть содержит манифест. Частей не больше BACKUP_MAX_PARTS_PER_RUN:
+    остальные чанки останутся неотправленными и уйдут при следующем запуске.
+    """
+    manifest_path: Path = report["manifest"]
+    budget = BACKUP_UPLOAD_LIMIT_BYTES - manifest_path.stat().st_size
+    groups: List[List[str]] = [[]]
+    group_bytes = 0
+    for digest in report["pending_chunks"]:
+        size = _backup_chunk_path(digest).stat().st_size
+        if groups[-1] and group_bytes + size > budget:
+            if len(groups) >= BACKUP_MAX_PARTS_PER_RUN:
+                break
+            groups.append([])
+            group_bytes = 0
+        groups[-1].append(digest)
+        group_bytes += size
+
+    parts: List[Tuple[Path, List[str]]] = []
+    for number, digests in enumerate(groups, 1):
+        suffix = f"_part{number}" if len(groups) > 1 else ""
+        delta_path = BACKUP_ROOT / f"{manifest_path.stem}_delta{suffix}.zip"
+        with zipfile.ZipFile(delta_path, "w", compression=zipfile.ZIP_STORED) as zf:
+            zf.write(manifest_path, arcname=f"manifests/{manifest_path.name}")
+            for digest in digests:
+                zf.write(_backup_chunk_path(digest), arcname=f"chunks/{digest[:2]}/{digest}")
+        parts.append((delta_path, digests))
+    return parts
+
+
+def restore_backup_snapshot(manifest_path: Path, target_dir: Path) -> int:
+    """Собирает файлы снимка в target_dir; возвращает число восстановленных файлов."""
+    manifest = _load_backup_manifest(manifest_path)
+    restored = 0
+    for rel_path, entry in manifest.get("files", {}).items():
+        destination = target_dir / rel_path
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        with destination.open("wb") as output:
+            for digest in entry.get("chunks", []):
+                output.write(_backup_chunk_path(digest).read_bytes())
+        restored += 1
+    return restored
+
+
+async def send_backup_archive(bot, chat_id: int) -> bool:
+    """Делает снимок и отправляет неотправленные чанки частями; True, если всё дошло.
+
+    Чанк считается вынесенным только после успешной отправки его части, поэтому
+    не дошедшие части будут отправлены при следующем резервном копировании.
+    Весь цикл идёт под backup_lock: кнопка в админ-панели и /backup не пересекаются.
+    """
+    async with backup_lock:
+        return await _send_backup_archive(bot, chat_id)
+
+
+async def _send_backup_archive(bot, chat_id: int) -> bool:
     BACKUP_ROOT.mkdir(parents=True, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_name = sanitize_filename(f"backup_{timestamp}.zip")
-    backup_path = BACKUP_ROOT / backup_name
-
-    def _build_backup() -> Path:
-        with zipfile.ZipFile(backup_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-            for source in sources:
-                if source.is_file():
-                    arcname = source.name if source.parent == Path.cwd() else str(source.relative_to(Path.cwd()))
-                    zf.write(source, arcname=arcname)
-                else:
-                    for file_path in source.rglob("*"):
-                        if file_path.is_file():
-                            try:
-                                arcname = str(file_path.relative_to(Path.cwd()))
-                            except ValueError:
-                                arcname = file_path.name
-                            zf.write(file_path, arcname=arcname)
-        return backup_path
-
+    staging_dir = Path(tempfile.mkdtemp(prefix=".staging_", dir=BACKUP_ROOT))
     try:
-        await asyncio.to_thread(_build_backup)
-        return backup_path
+        # Под блокировкой архива только перечисляем файлы и копируем индекс
+        async with archive_lock:
+            sources = await asyncio.to_thread(_collect_backup_sources, staging_dir)
+        report = await asyncio.to_thread(create_backup_snapshot, sources)
     except Exception as error:
         logger.error(f"Не удалось создать резервную копию: {error}")
-        if backup_path.exists():
+        return False
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    if not report:
+        return False
+
+    try:
+        parts = await asyncio.to_thread(_build_backup_delta_parts, report)
+    except Exception as error:
+        logger.error(f"Не удалось упаковать изменения резервной копии: {error}")
+        return False
+
+    sent_chunks = 0
+    success = True
+    for number, (part_path, digests) in enumerate(parts, 1):
+        caption = (
+            f"📦 Резервная копия {report['manifest'].stem}"
+            + (f" (часть {number}/{len(parts)})" if len(parts) > 1 else "")
+            + f"\nФайлов: {report['total_files']}, без изменений: {report['reused_files']}\n"
+            f"Новых данных: {format_filesize(report['new_bytes'])}, "
+            f"к отправке: {format_filesize(report['pending_bytes'])}"
+        )
+        try:
+            await send_document_from_path(bot, chat_id=chat_id, path=part_path, caption=caption)
+        except Exception as error:
+            logger.error(f"Не удалось отправить часть {number} резервной копии: {error}")
+            success = False
+            break
+        else:
+            await asyncio.to_thread(mark_backup_chunks_offsite, digests)
+            sent_chunks += len(digests)
+        finally:
             try:
-                backup_path.unlink()
+                if part_path.exists():
+                    part_path.unlink()
             except OSError:
                 pass
-        return None
+    for part_path, _digests in parts:
+        try:
+            if part_path.exists():
+                part_path.unlink()
+        except OSError:
+            pass
 
+    remaining = len(report["pending_chunks"]) - sent_chunks
+    if success and remaining:
+        await safe_bot_send_message(
+            bot,
+            chat_id,
+            f"Осталось неотправленных чанков: {remaining}. Они уйдут при следующем резервном копировании.",
+        )
+    return success
 
 async def admin_handler(update: Update, context: CallbackContext) -> None:
     user = update.message.from_user
@@ -5438,15 +6863,13 @@ async def admin_callback_handler(update: Update, context: CallbackContext) -> No
         await _edit_panel("\n".join(lines).strip(), InlineKeyboardMarkup(keyboard_rows))
         return
 
-    if action == "view:logs":
-        log_text = read_log_tail(200)
-        display_text = "📜 Последние строки логов:\n" + log_text
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⬅️ Назад", callback_data=f"{ADMIN_CALLBACK_PREFIX}back")],
-            [InlineKeyboardButton("📄 Скачать файл", callback_data=f"{ADMIN_CALLBACK_PREFIX}download_logs")],
-            [InlineKeyboardButton("Закрыть", callback_data=f"{ADMIN_CALLBACK_PREFIX}close")],
-        ])
-        await _edit_panel(display_text, keyboard)
+    if action == "view:logs" or action.startswith("view:logs:"):
+        level = action.split(":", 2)[2] if action.count(":") == 2 else None
+        if level not in LOG_LEVEL_FILTERS:
+            level = None
+        log_text = await asyncio.to_thread(read_log_tail, 200, level)
+        header = f"📜 Последние строки логов ({level}+):\n" if level else "📜 Последние строки логов:\n"
+        await _edit_panel(header + log_text, build_logs_keyboard())
         context.user_data["admin_panel_view"] = "logs"
         await query.answer()
         return
@@ -5467,19 +6890,10 @@ async def admin_callback_handler(update: Update, context: CallbackContext) -> No
                 ChatAction.UPLOAD_DOCUMENT,
                 message_thread_id=getattr(query.message, "message_thread_id", None),
             )
-        backup_path = await create_backup_archive()
-        if backup_path:
-            try:
-                await send_document_from_path(context.bot, chat_id=query.message.chat_id, path=backup_path, caption="📦 Резервная копия")
-            finally:
-                try:
-                    if backup_path.exists():
-                        backup_path.unlink()
-                except OSError:
-                    pass
+        if await send_backup_archive(context.bot, query.message.chat_id):
             await query.answer("Резервная копия подготовлена.")
         else:
-            await query.answer("Не удалось собрать резервную копию.", show_alert=True)
+            await query.answer("Не удалось собрать или отправить резервную копию.", show_alert=True)
         return
 
     await query.answer()
@@ -5600,11 +7014,13 @@ async def help_admin_handler(update: Update, context: CallbackContext) -> None:
         "• /history — последние 10 записей (по предметам).\n"
         "• /stats — общая статистика.\n"
         "• /download_month ММ.ГГГГ [Регион] — архив DOCX за месяц.\n"
-        "• /void_ticket <номер билета> [дата] [№] — исключить окончательное заключение из отчётов (аналог кнопки в чате).\n"
+        "• /void_ticket <номер билета> [дата] [№] — исключить окончательное заключение из отчётов (аналог кнопки в чате), после подтверждения кнопкой.\n"
+        "• /void_tickets <билет1> <билет2> ... — исключить из отчётов все заключения по списку билетов, после подтверждения кнопкой.\n"
         "• Кнопка «Удалить из отчётов» под сообщением в рабочей группе также доступна администраторам и выполняет /void_ticket.\n"
         "• /stats_period ДД.ММ.ГГГГ ДД.ММ.ГГГГ [Регион] — статистика за период.\n"
         "• /reports — мастер отчётов (архивы, Excel, сводки).\n"
         "• /leaders — рейтинг лидеров.\n"
+        "• /logs [ERROR|WARNING|INFO] [текст] — последние записи логов с фильтром.\n"
         "• /add_admin ID — добавить администратора.\n"
         "• /menu — открыть админское меню, /help — пользовательская инструкция."
     )
@@ -5695,13 +7111,21 @@ async def void_ticket_handler(update: Update, context: CallbackContext) -> None:
         await safe_reply(update, "Ваш доступ к боту ограничен. Обратитесь к администратору.")
         return
     if not context.args:
-        await safe_reply(update, "Использование: /void_ticket <номер билета> [ДД.ММ.ГГГГ] [номер заключения]")
+        await safe_reply(
+            update,
+            "Использование: /void_ticket <номер билета> [ДД.ММ.ГГГГ] [номер заключения]\n"
+            f"Можно указать последние цифры билета (не меньше {TICKET_FRAGMENT_MIN_DIGITS}, например 123456) "
+            "или начало с * (например, 012345*).",
+        )
         return
 
-    ticket_number = context.args[0].strip()
+    ticket_number, ticket_match = parse_ticket_pattern(context.args[0])
     if not ticket_number:
         await safe_reply(update, "❗ Укажите номер билета.")
         return
+    if ticket_match == "short":
+        await safe_reply(update, f"❗ Укажите не меньше {TICKET_FRAGMENT_MIN_DIGITS} цифр билета.")
+        return
 
     date_text: Optional[str] = None
     issue_number: Optional[str] = None
@@ -5714,11 +7138,22 @@ async def void_ticket_handler(update: Update, context: CallbackContext) -> None:
         elif candidate.isdigit():
             issue_number = candidate
 
-    records = await fetch_completions_by_ticket(ticket_number, date_text, issue_number)
+    records = await fetch_completions_by_ticket(ticket_number, date_text, issue_number, match=ticket_match)
     if not records:
         await safe_reply(update, "❗ Записей с таким билетом не найдено.")
         return
 
+    matched_tickets = {rec.get("ticket_number") for rec in records}
+    if len(matched_tickets) > 1:
+        showcase = [f"• {ticket}" for ticket in sorted(t for t in matched_tickets if t)[:10]]
+        message = (
+            "Под этот фрагмент подходят несколько билетов.\n"
+            "Повторите команду с полным номером:\n"
+            + "\n".join(showcase)
+        )
+        await safe_reply(update, message)
+        return
+
     if len(records) > 1 and not (date_text or issue_number):
         showcase = []
         for rec in records[:5]:
@@ -5727,7 +7162,7 @@ async def void_ticket_handler(update: Update, context: CallbackContext) -> None:
             created = (rec.get("completed_at") or "")[:16]
             showcase.append(f"• №{issue_label} от {date_label} (создано {created})")
         message = (
-            "Найдено несколько заключений с таким билетом.\n"
+            f"Найдено несколько заключений с билетом {records[0].get('ticket_number')}.\n"
             "Уточните дату (ДД.ММ.ГГГГ) или номер заключения из списка:\n"
             + "\n".join(showcase)
         )
@@ -5739,52 +7174,50 @@ async def void_ticket_handler(update: Update, context: CallbackContext) -> None:
         await safe_reply(update, "❗ Недостаточно прав для обнуления этого заключения.")
         return
 
-    summary = await soft_delete_completion_record(record, initiator_id=user.id, note="void_ticket command")
-    if summary.get("already_deleted"):
-        await safe_reply(update, "Эта запись уже помечена как удалённая.")
-        return
-    if not summary.get("db_marked"):
-        await safe_reply(update, "Не удалось пометить запись как удалённую. Проверьте журналы ошибок.")
-        return
-
-    status_line = "Статус: помечено как удалённое." if summary.get("db_marked") else "Статус: не изменилось."
-    archive_line = "Архив обновлён." if summary.get("archive_marked") else "Архив: отметка не потребовалась."
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("♻️ Исключить", callback_data=f"{VOID_CONFIRM_PREFIX}{record['id']}"),
+        InlineKeyboardButton("Отмена", callback_data=f"{VOID_CONFIRM_PREFIX}cancel"),
+    ]])
+    total = record.get("total_evaluation") or 0
+    await safe_reply(
+        update,
+        "Исключить из отчётов это заключение?\n"
+        f"Билет: {record.get('ticket_number') or 'не указан'}\n"
+        f"Заключение №{record.get('issue_number') or 'не указано'} от {record.get('date') or 'не указана'}\n"
+        f"Регион: {record.get('region') or 'не указан'}, предметов: {record.get('item_count') or 0}, сумма: {total:.0f} руб.\n"
+        f"Автор: {record.get('username') or record.get('user_id')}, создано {(record.get('completed_at') or '')[:16]}",
+        reply_markup=keyboard,
+    )
 
-    response_lines = [
-        "♻️ Заключение исключено из отчётов.",
-        f"Билет: {record.get('ticket_number') or 'не указан'}, заключение №{record.get('issue_number') or 'не указано'}, дата {record.get('date') or 'не указана'}.",
-        status_line,
-        archive_line,
-        "Для восстановления используйте /admin → «Удалённые записи».",
-    ]
-    await safe_reply(update, "\n".join(response_lines))
 
-    if record.get("user_id") != user.id:
+async def _announce_voided_record(bot, record: Dict[str, Any], initiator) -> None:
+    """Сообщает автору и рабочей группе об исключённом заключении и снимает кнопку с сообщения в группе."""
+    initiator_id = initiator.id if initiator else None
+    if record.get("user_id") != initiator_id:
         await safe_bot_send_message(
-            context.bot,
+            bot,
             record["user_id"],
             "Одно из ваших заключений исключено из отчётов. При необходимости создайте новое.",
             skip_notice_on_retry=True,
         )
 
-    if summary.get("db_marked"):
-        await send_personal_stats(context.bot, record["user_id"])
+    await send_personal_stats(bot, record["user_id"])
 
     if record.get("group_chat_id") and record.get("group_message_id"):
         try:
-            await context.bot.edit_message_reply_markup(
+            await bot.edit_message_reply_markup(
                 chat_id=record["group_chat_id"],
                 message_id=record["group_message_id"],
                 reply_markup=None,
             )
         except TelegramError:
             pass
-        initiator_name = user.full_name if user else "Сотрудник"
+        initiator_name = initiator.full_name if initiator else "Сотрудник"
         group_note = (
             f"♻️ Заключение по билету {record.get('ticket_number') or 'не указано'} исключено из отчётов (инициатор: {initiator_name})."
         )
         await safe_bot_send_message(
-            context.bot,
+            bot,
             record["group_chat_id"],
             group_note,
             skip_notice_on_retry=True,
@@ -5792,6 +7225,160 @@ async def void_ticket_handler(update: Update, context: CallbackContext) -> None:
         )
 
 
+async def void_tickets_handler(update: Update, context: CallbackContext) -> None:
+    """Массово исключает из отчётов все активные заключения по списку билетов."""
+    user = update.effective_user
+    if not user or not is_admin(user.id):
+        await safe_reply(update, "Команда доступна только администраторам.")
+        return
+    ticket_numbers = [
+        ticket.strip()
+        for arg in (context.args or [])
+        for ticket in arg.split(",")
+        if ticket.strip()
+    ]
+    if not ticket_numbers:
+        await safe_reply(update, "Использование: /void_tickets <билет1> <билет2> ... (можно через запятую)")
+        return
+
+    records = await fetch_completions_by_tickets(ticket_numbers)
+    if not records:
+        await safe_reply(update, "❗ Активных записей по указанным билетам не найдено.")
+        return
+
+    found_tickets = {record.get("ticket_number") for record in records}
+    missing = [ticket for ticket in dict.fromkeys(ticket_numbers) if ticket not in found_tickets]
+    context.user_data[VOID_BATCH_KEY] = {
+        "tickets": list(dict.fromkeys(ticket_numbers)),
+        "ids": [record["id"] for record in records],
+        "missing": missing,
+    }
+    showcase = [
+        f"• {record.get('ticket_number')} — №{record.get('issue_number') or '—'} от {record.get('date') or 'не указана'}"
+        for record in records[:20]
+    ]
+    if len(records) > 20:
+        showcase.append("…")
+    response_lines = [f"Исключить из отчётов заключений: {len(records)}?", *showcase]
+    if missing:
+        response_lines.append("Не найдены: " + ", ".join(missing[:20]) + (" …" if len(missing) > 20 else ""))
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("♻️ Исключить все", callback_data=f"{VOID_CONFIRM_PREFIX}batch"),
+        InlineKeyboardButton("Отмена", callback_data=f"{VOID_CONFIRM_PREFIX}cancel"),
+    ]])
+    await safe_reply(update, "\n".join(response_lines), reply_markup=keyboard)
+
+
+async def _void_confirmed_batch(context: CallbackContext, user) -> str:
+    pending = context.user_data.pop(VOID_BATCH_KEY, None)
+    if not pending:
+        return "Список устарел. Повторите /void_tickets."
+    pending_ids = set(pending["ids"])
+    records = [
+        record for record in await fetch_completions_by_tickets(pending["tickets"])
+        if record["id"] in pending_ids
+    ]
+    if not records:
+        return "❗ Эти заключения уже исключены из отчётов."
+
+    marked = await soft_delete_completion_records(records, initiator_id=user.id, note="void_tickets command")
+    if not marked:
+        return "Не удалось пометить записи как удалённые. Проверьте журналы ошибок."
+
+    for record in marked:
+        if record.get("group_chat_id") and record.get("group_message_id"):
+            try:
+                await context.bot.edit_message_reply_markup(
+                    chat_id=record["group_chat_id"],
+                    message_id=record["group_message_id"],
+                    reply_markup=None,
+                )
+            except TelegramError:
+                pass
+
+    removed_per_user: Dict[int, int] = {}
+    for record in marked:
+        owner_id = record.get("user_id")
+        if owner_id and owner_id != user.id:
+            removed_per_user[owner_id] = removed_per_user.get(owner_id, 0) + 1
+    for owner_id, count in removed_per_user.items():
+        await safe_bot_send_message(
+            context.bot,
+            owner_id,
+            f"Из отчётов исключено ваших заключений: {count}. При необходимости создайте новые.",
+            skip_notice_on_retry=True,
+        )
+
+    missing = pending["missing"]
+    response_lines = [
+        f"♻️ Исключено из отчётов заключений: {len(marked)}.",
+        f"Билетов обработано: {len({record.get('ticket_number') for record in marked})}.",
+    ]
+    if missing:
+        response_lines.append("Не найдены: " + ", ".join(missing[:20]) + (" …" if len(missing) > 20 else ""))
+    response_lines.append("Для восстановления используйте /admin → «Удалённые записи».")
+    return "\n".join(response_lines)
+
+
+async def _void_confirmed_record(context: CallbackContext, user, completion_id: int) -> str:
+    record = await fetch_completion_by_id(completion_id)
+    if not record or record.get("is_deleted"):
+        return "Эта запись уже помечена как удалённая."
+    if record.get("user_id") != user.id and not is_admin(user.id):
+        return "❗ Недостаточно прав для обнуления этого заключения."
+
+    summary = await soft_delete_completion_record(record, initiator_id=user.id, note="void_ticket command")
+    if summary.get("already_deleted"):
+        return "Эта запись уже помечена как удалённая."
+    if not summary.get("db_marked"):
+        return "Не удалось пометить запись как удалённую. Проверьте журналы ошибок."
+
+    await _announce_voided_record(context.bot, record, user)
+    archive_line = "Архив обновлён." if summary.get("archive_marked") else "Архив: отметка не потребовалась."
+    return "\n".join([
+        "♻️ Заключение исключено из отчётов.",
+        f"Билет: {record.get('ticket_number') or 'не указан'}, заключение №{record.get('issue_number') or 'не указано'}, дата {record.get('date') or 'не указана'}.",
+        "Статус: помечено как удалённое.",
+        archive_line,
+        "Для восстановления используйте /admin → «Удалённые записи».",
+    ])
+
+
+async def void_confirm_callback_handler(update: Update, context: CallbackContext) -> None:
+    """Подтверждение /void_ticket и /void_tickets: до нажатия кнопки ничего не исключается."""
+    query = update.callback_query
+    if not query or not query.data or not query.data.startswith(VOID_CONFIRM_PREFIX):
+        if query:
+            await query.answer()
+        return
+    if not await ensure_user_not_blocked_query(query, context):
+        return
+
+    payload = query.data[len(VOID_CONFIRM_PREFIX):]
+    user = query.from_user
+    if payload == "cancel":
+        context.user_data.pop(VOID_BATCH_KEY, None)
+        text = "Отменено, заключения остались в отчётах."
+    elif payload == "batch":
+        if not is_admin(user.id):
+            await query.answer("Недостаточно прав.", show_alert=True)
+            return
+        text = await _void_confirmed_batch(context, user)
+    else:
+        try:
+            completion_id = int(payload)
+        except ValueError:
+            await query.answer("Некорректный идентификатор.", show_alert=True)
+            return
+        text = await _void_confirmed_record(context, user, completion_id)
+
+    try:
+        await query.edit_message_text(text)
+    except TelegramError as error:
+        logger.debug(f"Не удалось обновить подтверждение обнуления: {error}")
+    await query.answer()
+
+
 async def void_callback_handler(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     if not query or not query.data:
@@ -5885,13 +7472,13 @@ async def deleted_message_handler(update: Update, context: CallbackContext) -> N
         return
 
     thread_id = getattr(message, "message_thread_id", None)
-    for msg_id in message_ids:
-        record = await fetch_completion_by_message(chat.id, msg_id, thread_id=thread_id)
-        if not record:
-            continue
-        summary = await soft_delete_completion_record(record, initiator_id=None, note="message_deleted")
-        if not summary.get("db_marked"):
-            continue
+    records = await fetch_completions_by_messages(chat.id, message_ids, thread_id=thread_id)
+    if not records:
+        return
+    marked = await soft_delete_completion_records(records, initiator_id=None, note="message_deleted")
+
+    removed_per_user: Dict[int, int] = {}
+    for record in marked:
         if record.get("group_chat_id") and record.get("group_message_id"):
             try:
                 await context.bot.edit_message_reply_markup(
@@ -5901,13 +7488,15 @@ async def deleted_message_handler(update: Update, context: CallbackContext) -> N
                 )
             except TelegramError:
                 pass
-        await send_personal_stats(context.bot, record["user_id"])
-        await safe_bot_send_message(
-            context.bot,
-            record["user_id"],
-            "Одно из ваших заключений удалено из группы и помечено как исключённое.",
-            skip_notice_on_retry=True,
-        )
+        removed_per_user[record["user_id"]] = removed_per_user.get(record["user_id"], 0) + 1
+
+    for user_id, removed_count in removed_per_user.items():
+        await send_personal_stats(context.bot, user_id)
+        if removed_count == 1:
+            notice = "Одно из ваших заключений удалено из группы и помечено как исключённое."
+        else:
+            notice = f"Ваши заключения удалены из группы ({removed_count} шт.) и помечены как исключённые."
+        await safe_bot_send_message(context.bot, user_id, notice, skip_notice_on_retry=True)
 
 
 def _report_data(context: CallbackContext) -> Dict[str, Any]:
@@ -5950,48 +7539,52 @@ async def _reports_finish(update: Update, context: CallbackContext, message: str
 
 
 async def send_month_report(update: Update, context: CallbackContext, month_text: str, start_date: datetime, end_date: datetime, region: Optional[str]) -> None:
-    filtered = await filter_records(start_date=start_date, end_date=end_date, region=region)
-    if not filtered:
-        await safe_reply(update, f"За {month_text} записей не найдено.")
-        return
-
     await safe_chat_action(context.bot, update.effective_chat.id, ChatAction.UPLOAD_DOCUMENT)
 
+    def _build_report() -> Tuple[Any, int]:
+        handle, written = build_excel_stream(iter_completion_item_rows(start_date, end_date, region))
+        if written:
+            return handle, written
+        handle.close()
+        return None, 0
+
+    try:
+        handle, written = await asyncio.to_thread(_build_report)
+    except Exception as error:
+        logger.error(f"Не удалось выгрузить заключения из БД: {error}")
+        handle, written = None, 0
+
+    if not handle:
+        filtered = await filter_records(start_date=start_date, end_date=end_date, region=region)
+        if not filtered:
+            await safe_reply(update, f"За {month_text} записей не найдено.")
+            return
+        handle, written = await asyncio.to_thread(build_excel_stream, filtered)
+
     region_label = region or "Все регионы"
+    timestamp = datetime.now().strftime("%d.%m.%Y_%H-%M-%S")
+    filename = sanitize_filename(f"conclusions_{month_text}_{region_label}_{timestamp}.xlsx")
     try:
-        filepath = await create_excel_snapshot(filtered, f"conclusions_{month_text}_{region_label}")
         caption = f"Заключения за {month_text} ({region_label})"
-        await send_document_from_path(context.bot, chat_id=update.message.chat_id, path=filepath, caption=caption)
+        await safe_send_document(context.bot, chat_id=update.message.chat_id, document=handle, filename=filename, caption=caption)
         await safe_reply(update, "📥 Файл с заключениями отправлен.")
     finally:
-        try:
-            if 'filepath' in locals() and filepath.exists():
-                filepath.unlink()
-        except Exception as cleanup_error:
-            logger.debug(f"Не удалось удалить временный файл {filepath}: {cleanup_error}")
+        handle.close()
 
 
 async def send_period_stats(update: Update, start_date: datetime, end_date: datetime, region: Optional[str]) -> None:
-    filtered = await filter_records(start_date=start_date, end_date=end_date, region=region)
-    if not filtered:
+    await safe_chat_action(update.get_bot(), update.effective_chat.id, ChatAction.TYPING)
+
+    totals = await load_period_totals(start_date, end_date, region)
+    if not totals:
         await safe_reply(update, "За выбранный период записей не найдено.")
         return
 
-    await safe_chat_action(context.bot, update.effective_chat.id, ChatAction.TYPING)
-
-    total_items = len(filtered)
-    total_eval = 0
-    regions: Dict[str, int] = {}
-    for row in filtered:
-        region_name = row[4] or "Не указано"
-        regions[region_name] = regions.get(region_name, 0) + 1
-        try:
-            total_eval += int(row[7] or 0)
-        except (TypeError, ValueError):
-            continue
+    total_items = sum(int(stats["count"]) for stats in totals.values())
+    total_eval = int(sum(stats["total"] for stats in totals.values()))
 
     period_text = f"{start_date.strftime('%d.%m.%Y')} — {end_date.strftime('%d.%m.%Y')}"
-    region_lines = "\n".join([f"  {r_name}: {count}" for r_name, count in sorted(regions.items(), key=lambda x: x[0])])
+    region_lines = "\n".join([f"  {r_name}: {int(stats['count'])}" for r_name, stats in sorted(totals.items(), key=lambda x: x[0])])
     if region:
         region_filter_text = f"Фильтр по региону: {region}\n"
     else:
@@ -6009,23 +7602,13 @@ async def send_period_stats(update: Update, start_date: datetime, end_date: date
 
 
 async def send_region_summary(update: Update, start_date: datetime, end_date: datetime) -> None:
-    filtered = await filter_records(start_date=start_date, end_date=end_date, region=None)
-    if not filtered:
+    await safe_chat_action(update.get_bot(), update.effective_chat.id, ChatAction.TYPING)
+
+    totals = await load_period_totals(start_date, end_date)
+    if not totals:
         await safe_reply(update, "За выбранный период записей не найдено.")
         return
 
-    await safe_chat_action(context.bot, update.effective_chat.id, ChatAction.TYPING)
-
-    totals: Dict[str, Dict[str, float]] = {}
-    for row in filtered:
-        region_name = row[4] or "Не указано"
-        entry = totals.setdefault(region_name, {"count": 0, "total": 0.0})
-        entry["count"] += 1
-        try:
-            entry["total"] += float(row[7] or 0)
-        except (TypeError, ValueError):
-            continue
-
     period_text = f"{start_date.strftime('%d.%m.%Y')} — {end_date.strftime('%d.%m.%Y')}"
     lines = []
     for region_name, stats in sorted(totals.items(), key=lambda item: item[1]["total"], reverse=True):
@@ -6038,7 +7621,7 @@ async def send_region_summary(update: Update, start_date: datetime, end_date: da
         update,
         "📊 Сводка по регионам:\n"
         f"Диапазон: {period_text}\n"
-        f"\n".join(lines)
+        + "\n".join(lines)
     )
 
 
@@ -6712,6 +8295,7 @@ async def photo_handler(update: Update, context: CallbackContext) -> int:
     unique_name = generate_unique_filename()
     original_path = TEMP_PHOTOS_DIR / f"orig_{unique_name}"
     compressed_path = TEMP_PHOTOS_DIR / unique_name
+    thumb_path = TEMP_PHOTOS_DIR / f"thumb_{unique_name}"
     try:
         await file.download_to_drive(original_path)
         if is_image_too_large(original_path, max_size_mb=MAX_PHOTO_SIZE_MB):
@@ -6721,7 +8305,7 @@ async def photo_handler(update: Update, context: CallbackContext) -> int:
                 reply_markup=build_step_inline_keyboard(context=context)
             )
             return DialogState.PHOTO
-        await asyncio.to_thread(compress_image, original_path, compressed_path)
+        await asyncio.to_thread(prepare_photo_files, original_path, compressed_path, thumb_path)
     except Exception as e:
         logger.error(f"Ошибка обработки изображения: {e}", exc_info=True)
         await safe_reply(
@@ -6730,11 +8314,12 @@ async def photo_handler(update: Update, context: CallbackContext) -> int:
             f"{PHOTO_REQUIREMENTS_MESSAGE}",
             reply_markup=build_step_inline_keyboard(context=context)
         )
-        if compressed_path.exists():
-            try:
-                compressed_path.unlink()
-            except OSError as cleanup_error:
-                logger.warning(f"Не удалось удалить временный файл {compressed_path}: {cleanup_error}")
+        for leftover in (compressed_path, thumb_path):
+            if leftover.exists():
+                try:
+                    leftover.unlink()
+                except OSError as cleanup_error:
+                    logger.warning(f"Не удалось удалить временный файл {leftover}: {cleanup_error}")
         return DialogState.PHOTO
     finally:
         if original_path.exists():
@@ -6743,7 +8328,7 @@ async def photo_handler(update: Update, context: CallbackContext) -> int:
             except OSError as cleanup_error:
                 logger.warning(f"Не удалось удалить исходный файл {original_path}: {cleanup_error}")
 
-    data.photo_desc.append({'photo': str(compressed_path), 'description': '', 'evaluation': ''})
+    data.photo_desc.append({'photo': str(compressed_path), 'thumb': str(thumb_path), 'description': '', 'evaluation': ''})
     await save_user_data_to_db(user_id, data)
     metrics_complete_state(context, DialogState.PHOTO)
     await persist_draft(context, user_id, data, DialogState.DESCRIPTION)
@@ -7079,6 +8664,12 @@ async def edit_callback_handler(update: Update, context: CallbackContext) -> int
             return DialogState.CONFIRMATION
 
         removed_item = data.photo_desc.pop()
+        thumb_path = Path(removed_item.get("thumb") or "")
+        if thumb_path.is_file():
+            try:
+                thumb_path.unlink()
+            except OSError as error:
+                logger.warning(f"Не удалось удалить миниатюру {thumb_path}: {error}")
         photo_path = Path(removed_item.get("photo", "") or "")
         if photo_path.is_file():
             try:
@@ -7490,38 +9081,44 @@ async def history_callback_handler(update: Update, context: CallbackContext) ->
         return
 
     payload = query.data[len(HISTORY_CALLBACK_PREFIX):]
-    cache = context.user_data.get("history_cache")
-    if not cache:
-        await query.answer("Исторические данные отсутствуют. Запросите /history заново.", show_alert=True)
-        return
-
-    records: List[List[Any]] = cache.get("records", [])
-    page_size: int = cache.get("page_size", 6)
-    current_page: int = cache.get("page", 1)
 
     if payload == "close":
         try:
             await query.edit_message_text("История закрыта.")
         except TelegramError:
             pass
-        context.user_data.pop("history_cache", None)
         context.user_data.pop("history_message", None)
         await query.answer("История закрыта.")
         return
 
+    parts = payload.split(":", 3)
+    if len(parts) != 4 or parts[0] not in ("n", "p"):
+        await query.answer()
+        return
+    direction, page_text, id_text, completed_at = parts
     try:
-        requested_page = int(payload)
+        page = max(1, int(page_text))
+        anchor = (completed_at, int(id_text))
     except ValueError:
         await query.answer()
         return
 
-    text, keyboard, actual_page = build_history_page(records, requested_page, page_size)
+    records, has_more = await fetch_history_page(anchor, direction)
+    if not records:
+        await query.answer("Записей больше нет. Запросите /history заново.", show_alert=True)
+        return
+    if direction == "n":
+        has_prev, has_next = page > 1, has_more
+    else:
+        has_prev, has_next = has_more, True
+        if not has_more:
+            page = 1
+
+    text, keyboard = build_history_page(records, page, has_prev, has_next)
     try:
         await query.edit_message_text(text, reply_markup=keyboard)
     except TelegramError as error:
         logger.debug(f"Не удалось обновить вывод истории: {error}")
-    else:
-        cache["page"] = actual_page
     finally:
         try:
             await query.answer()
@@ -8144,6 +9741,7 @@ def register_handlers(application: Application) -> None:
 
     application.add_handler(CallbackQueryHandler(back_navigation_decision_handler, pattern=f"^{BACK_NAV_CALLBACK_PREFIX}"))
     application.add_handler(CallbackQueryHandler(void_callback_handler, pattern=f"^{VOID_CALLBACK_PREFIX}"))
+    application.add_handler(CallbackQueryHandler(void_confirm_callback_handler, pattern=f"^{VOID_CONFIRM_PREFIX}"))
     application.add_handler(CommandHandler("menu", menu_handler))
     application.add_handler(CommandHandler("help", help_handler))
     application.add_handler(CommandHandler("webapp", webapp_handler))
@@ -8156,10 +9754,12 @@ def register_handlers(application: Application) -> None:
     application.add_handler(CommandHandler("drafts", drafts_handler))
     application.add_handler(CommandHandler("admin", admin_handler))
     application.add_handler(CommandHandler("backup", backup_handler))
+    application.add_handler(CommandHandler("logs", logs_handler))
     application.add_handler(CommandHandler("search_archive", search_archive_handler))
     application.add_handler(CommandHandler("download_month", download_month_handler))
     application.add_handler(CommandHandler("stats_period", stats_period_handler))
     application.add_handler(CommandHandler("void_ticket", void_ticket_handler))
+    application.add_handler(CommandHandler("void_tickets", void_tickets_handler))
     application.add_handler(CommandHandler("add_admin", add_admin_handler))
     application.add_handler(CallbackQueryHandler(history_callback_handler, pattern=f"^{HISTORY_CALLBACK_PREFIX}"))
     application.add_handler(CallbackQueryHandler(draft_callback_handler, pattern=f"^{DRAFT_CALLBACK_PREFIX}"))
@@ -8167,6 +9767,19 @@ def register_handlers(application: Application) -> None:
     application.add_handler(CallbackQueryHandler(analytics_callback_handler, pattern=f"^{ANALYTICS_CALLBACK_PREFIX}"))
     application.add_handler(CallbackQueryHandler(admin_callback_handler, pattern=f"^{ADMIN_CALLBACK_PREFIX}"))
 
+_first_update_logged = False
+
+
+async def log_first_update(update: object, context: CallbackContext) -> None:
+    """Один раз логирует время от старта процесса до первого полученного обновления."""
+    global _first_update_logged
+    if _first_update_logged:
+        return
+    _first_update_logged = True
+    elapsed = time.perf_counter() - _PROCESS_STARTED_AT
+    logger.info(f"Первое обновление получено через {elapsed:.2f} с после запуска процесса.")
+
+
 async def main() -> None:
     # Создаём папки при старте
     TEMP_PHOTOS_DIR.mkdir(exist_ok=True)
@@ -8179,6 +9792,10 @@ async def main() -> None:
     load_admin_ids()
     
     await init_db()
+    try:
+        await backfill_completions_from_excel()
+    except Exception as error:
+        logger.error(f"Не удалось перенести журнал Excel в БД: {error}")
 
     try:
         bot_token = load_bot_token()
@@ -8198,10 +9815,99 @@ async def main() -> None:
 
     await configure_bot_commands(application.bot)
 
+    application.add_handler(TypeHandler(Update, log_first_update), group=-1)
     register_handlers(application)
 
-    logger.info("Бот запускается...")
-    await application.run_polling()
+    warm_chart_worker()
+
+    logger.info(f"Бот запускается... (подготовка заняла {time.perf_counter() - _PROCESS_STARTED_AT:.2f} с)")
+    try:
+        await application.run_polling()
+    finally:
+        shutdown_chart_worker()
+
+async def _prepare_database_schema() -> None:
+    await init_db()
+    await close_db()
+
+
+def run_cli(argv: List[str]) -> None:
+    """Служебные команды, запускаемые без бота: python <скрипт> ingest --from-archive."""
+    parser = argparse.ArgumentParser(description="Служебные команды бота заключений.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Пакетно загрузить исторические заключения в БД.")
+    source_group = ingest_parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--from-archive", action="store_true", help="Загрузить из индекса архива.")
+    source_group.add_argument(
+        "--from-excel",
+        nargs="?",
+        const=str(EXCEL_FILE),
+        metavar="PATH",
+        help="Загрузить из журнала Excel (по умолчанию основной файл).",
+    )
+    ingest_parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE, help="Размер пачки вставки.")
+    subparsers.add_parser("backup", help="Сделать инкрементальную резервную копию.")
+    subparsers.add_parser("backup-list", help="Показать доступные снимки.")
+    restore_parser = subparsers.add_parser("backup-restore", help="Восстановить снимок в отдельную папку.")
+    restore_parser.add_argument("manifest", help="Имя снимка из backup-list или путь к манифесту.")
+    restore_parser.add_argument("--target", default="restored", help="Папка, куда собрать файлы.")
+    mirror_parser = subparsers.add_parser(
+        "mirror-rebuild",
+        help="Пересобрать Parquet-зеркало журнала из Excel (нужен pyarrow; лучше при остановленном боте).",
+    )
+    mirror_parser.add_argument("--from-excel", default=str(EXCEL_FILE), metavar="PATH", help="Файл журнала Excel.")
+    args = parser.parse_args(argv)
+
+    if args.command == "mirror-rebuild":
+        report = rebuild_history_mirror(Path(args.from_excel))
+        print(f"Зеркало пересобрано: строк {report['rows']}, время: {report['seconds']:.2f} с")
+        return
+
+    if args.command == "backup":
+        report = create_backup_snapshot()
+        if not report:
+            print("Нет данных для резервного копирования.")
+            return
+        print(
+            f"Снимок: {report['manifest'].name}, файлов: {report['total_files']}, "
+            f"без изменений: {report['reused_files']}, новых чанков: {len(report['new_chunks'])} "
+            f"({report['new_bytes']} байт), время: {report['seconds']:.2f} с"
+        )
+        return
+
+    if args.command == "backup-list":
+        for manifest_path in list_backup_manifests():
+            manifest = _load_backup_manifest(manifest_path)
+            print(f"{manifest_path.stem}\t{manifest.get('created_at', '')}\tфайлов: {len(manifest.get('files', {}))}")
+        return
+
+    if args.command == "backup-restore":
+        manifest_path = Path(args.manifest)
+        if not manifest_path.suffix:
+            manifest_path = BACKUP_MANIFESTS_DIR / f"{args.manifest}.json"
+        if not manifest_path.exists():
+            print(f"Снимок не найден: {manifest_path}")
+            return
+        restored = restore_backup_snapshot(manifest_path, Path(args.target))
+        print(f"Восстановлено файлов: {restored} в {args.target}")
+        return
+
+    if args.command == "ingest":
+        asyncio.run(_prepare_database_schema())
+        if args.from_archive:
+            payloads = iter_archive_index_payloads()
+        else:
+            payloads = iter_excel_payloads(Path(args.from_excel))
+        report = bulk_ingest_completions(payloads, chunk_size=args.chunk_size, rebuild_indexes=True)
+        print(
+            f"Добавлено: {report['inserted']}, пропущено: {report['skipped']}, "
+            f"время: {report['seconds']:.2f} с, скорость: {report['rows_per_second']:.0f} строк/с, "
+            f"ачивок выдано: {report['achievements_added']}, снято: {report['achievements_removed']}"
+        )
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if len(sys.argv) > 1:
+        run_cli(sys.argv[1:])
+    else:
+        asyncio.run(main())
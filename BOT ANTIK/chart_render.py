@@ -0,0 +1,64 @@
+"""Отрисовка графиков аналитики в отдельном процессе.
+
+Модуль намеренно не зависит от бота: функции получают готовые ряды данных
+и возвращают PNG в виде байтов, поэтому их можно выполнять в
+ProcessPoolExecutor без передачи соединений, блокировок и прочего состояния.
+"""
+import io
+from datetime import date
+from typing import List, Optional, Sequence
+
+
+def init_worker() -> None:
+    """Прогревает matplotlib в процессе-воркере, чтобы первый график не ждал импорта."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    from matplotlib.dates import DateFormatter  # noqa: F401
+
+
+def ping() -> bool:
+    return True
+
+
+def _figure_to_png(fig) -> bytes:
+    import matplotlib.pyplot as plt
+
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format="png")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def render_trend_chart(dates: Sequence[date], values: Sequence[int], days: int) -> Optional[bytes]:
+    if not dates or not any(values):
+        return None
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
+
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.plot(list(dates), list(values), marker="o", linewidth=2)
+    ax.set_title(f"Заключения за {days} дней")
+    ax.set_ylabel("Количество")
+    ax.set_xlabel("Дата")
+    ax.grid(True, linestyle="--", alpha=0.4)
+    ax.xaxis.set_major_formatter(DateFormatter("%d.%m"))
+    fig.autofmt_xdate()
+    return _figure_to_png(fig)
+
+
+def render_step_duration_chart(labels: List[str], values: List[float]) -> Optional[bytes]:
+    if not labels:
+        return None
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.bar(labels, values, color="#4c8bf5")
+    ax.set_title("Средняя длительность этапов (с)")
+    ax.set_ylabel("Секунды")
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=20, ha="right")
+    ax.grid(True, axis="y", linestyle="--", alpha=0.3)
+    return _figure_to_png(fig)
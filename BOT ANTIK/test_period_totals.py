@@ -0,0 +1,155 @@
+# test_period_totals.py
+
+import asyncio
+import importlib.util
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from openpyxl import Workbook
+
+BOT_PATH = Path(__file__).with_name("botbotbotbo(запуск) 2.py")
+_spec = importlib.util.spec_from_file_location("conclusion_bot", BOT_PATH)
+bot = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bot)
+
+
+JOURNAL_ROWS = [
+    # билет, номер, подразделение, дата, регион, № предмета, описание, оценка
+    ["11111111111", "1", "101", "05.01.2023", "Москва", 1, "Кольцо", 1500],
+    ["11111111111", "1", "101", "05.01.2023", "Москва", 2, "Серьги", 2500],
+    ["22222222222", "2", "102", "17.02.2023", "Казань", 1, "Цепь", 4000],
+    ["33333333333", "3", "101", "03.03.2023", "Москва", 1, "Часы", 12000],
+    ["33333333333", "3", "101", "03.03.2023", "Москва", 2, "Браслет", 3000],
+    ["33333333333", "3", "101", "03.03.2023", "Москва", 3, "Кулон", 700],
+    ["44444444444", "4", "205", "20.12.2023", "Санкт-Петербург", 1, "Монета", 900],
+]
+
+
+class TestPeriodTotalsParity(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self._tmp.name)
+        self._saved = {
+            name: getattr(bot, name)
+            for name in ("DATABASE_FILE", "EXCEL_FILE", "EXCEL_BACKFILL_MARKER", "HISTORY_MIRROR_MARKER")
+        }
+        bot.DATABASE_FILE = tmp / "user_data.db"
+        bot.EXCEL_FILE = tmp / "conclusions.xlsx"
+        bot.EXCEL_BACKFILL_MARKER = tmp / "backfill.json"
+        bot.HISTORY_MIRROR_MARKER = tmp / "history_parquet" / "_READY"
+
+        wb = Workbook()
+        ws = wb.active
+        ws.append(bot.EXCEL_HEADERS)
+        for row in JOURNAL_ROWS:
+            ws.append(row)
+        wb.save(bot.EXCEL_FILE)
+        wb.close()
+
+    def tearDown(self):
+        for name, value in self._saved.items():
+            setattr(bot, name, value)
+        self._tmp.cleanup()
+
+    def _run(self, coro_factory):
+        async def scenario():
+            await bot.init_db()
+            try:
+                await bot.backfill_completions_from_excel()
+                return await coro_factory()
+            finally:
+                await bot.close_db()
+        return asyncio.run(scenario())
+
+    def test_db_totals_match_excel_totals(self):
+        """
+        Отчёт по completions после переноса журнала совпадает с прежним расчётом по Excel.
+        """
+        start, end = datetime(2023, 1, 1), datetime(2023, 12, 31)
+
+        async def both():
+            return (
+                await bot.aggregate_period_by_region(start, end),
+                await bot._aggregate_period_from_excel(start, end),
+            )
+
+        db_totals, excel_totals = self._run(both)
+        self.assertEqual(db_totals, excel_totals)
+        self.assertEqual(db_totals["Москва"], {"count": 5, "total": 19700.0})
+
+    def test_region_and_period_filters_match(self):
+        start, end = datetime(2023, 2, 1), datetime(2023, 3, 31)
+
+        async def both():
+            return (
+                await bot.aggregate_period_by_region(start, end, "Москва"),
+                await bot._aggregate_period_from_excel(start, end, "Москва"),
+            )
+
+        db_totals, excel_totals = self._run(both)
+        self.assertEqual(db_totals, excel_totals)
+        self.assertEqual(db_totals, {"Москва": {"count": 3, "total": 15700.0}})
+
+    def test_backfill_runs_once(self):
+        async def second_run():
+            bot.EXCEL_BACKFILL_MARKER.unlink()
+            await bot.backfill_completions_from_excel()
+            return await bot.aggregate_period_by_region(datetime(2023, 1, 1), datetime(2023, 12, 31))
+
+        totals = self._run(second_run)
+        self.assertEqual(sum(stats["count"] for stats in totals.values()), len(JOURNAL_ROWS))
+        self.assertTrue(bot.EXCEL_BACKFILL_MARKER.exists())
+
+    def test_backfill_skips_known_rows_and_keeps_achievements(self):
+        """
+        «Не указано» из журнала совпадает с пустым полем в БД, а ачивки пользователей не пересчитываются.
+        """
+        wb = Workbook()
+        ws = wb.active
+        ws.append(bot.EXCEL_HEADERS)
+        ws.append(["55555555555", "5", "Не указано", "10.04.2023", "Москва", 1, "Кольцо", 1000])
+        wb.save(bot.EXCEL_FILE)
+        wb.close()
+
+        async def scenario():
+            await bot.init_db()
+            try:
+                bot.bulk_ingest_completions(
+                    [{
+                        "user_id": 42,
+                        "username": "сотрудник",
+                        "ticket_number": "55555555555",
+                        "issue_number": "5",
+                        "department_number": None,
+                        "date": "10.04.2023",
+                        "region": "Москва",
+                        "photo_desc": [{"description": "Кольцо", "evaluation": 1000}],
+                    }],
+                    database_path=bot.DATABASE_FILE,
+                    rebuild_achievements=False,
+                )
+                with sqlite3.connect(bot.DATABASE_FILE) as connection:
+                    connection.execute(
+                        "INSERT INTO achievement_log (user_id, achievement_key, achieved_at) VALUES (?, ?, ?)",
+                        (42, "earned_streak", "2023-04-10T10:00:00"),
+                    )
+                return await bot.backfill_completions_from_excel()
+            finally:
+                await bot.close_db()
+
+        asyncio.run(scenario())
+        with sqlite3.connect(bot.DATABASE_FILE) as connection:
+            completions = connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            achievements = connection.execute(
+                "SELECT achievement_key FROM achievement_log WHERE user_id = 42"
+            ).fetchall()
+        self.assertEqual(completions, 1)
+        self.assertEqual(achievements, [("earned_streak",)])
+
+
+if __name__ == "__main__":
+    unittest.main()
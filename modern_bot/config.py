@@ -36,6 +36,7 @@ ARCHIVE_INDEX_FILE = ARCHIVE_DIR / "index.json"
 ADMIN_FILE = BASE_DIR / "config" / "admins.json"
 DATABASE_FILE = BASE_DIR / "user_data.db"
 EXCEL_FILE = BASE_DIR / "conclusions.xlsx"
+HISTORY_MIRROR_DIR = BASE_DIR / "history_parquet"
 
 # --- CONSTANTS ---
 MAX_PHOTOS: int = 30
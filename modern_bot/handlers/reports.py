@@ -2,7 +2,7 @@ from telegram import Update
 from telegram.ext import CallbackContext
 from modern_bot.handlers.common import safe_reply, send_document_from_path
 from modern_bot.handlers.admin import is_admin
-from modern_bot.services.excel import read_excel_data, create_excel_snapshot
+from modern_bot.services.excel import filter_records, create_excel_snapshot
 from modern_bot.services.archive import get_archive_paths, create_archive_zip
 from modern_bot.utils.validators import get_month_bounds, match_region_name, parse_date_str
 
@@ -10,12 +10,12 @@ async def history_handler(update: Update, context: CallbackContext) -> None:
     if not is_admin(update.message.from_user.id):
         await safe_reply(update, "Доступ запрещен.")
         return
-    records = await read_excel_data()
+    records = await filter_records()
     if not records:
         await safe_reply(update, "История пуста.")
         return
     history_text = "📜 Последние 10 записей:\n\n" + "\n".join([
-        f"Билет: {r[0]}, №: {r[1]}, Подр: {r[2]}, Дата: {r[3]}, Регион: {r[4]}, Оценка: {r[7]}"
+        f"Билет: {r[0]}, №: {r[1]}, Подр: {r[2]}, Дата: {r[3]}, Регион: {r[4]}, Оценка: {r[7] if r[7] is not None else '—'}"
         for r in records[-10:]
     ])
     await safe_reply(update, history_text)
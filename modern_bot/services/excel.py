@@ -1,10 +1,12 @@
 import asyncio
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Iterable, Optional, Sequence
 from openpyxl import Workbook, load_workbook
 from pathlib import Path
 from datetime import datetime
 from modern_bot.config import EXCEL_FILE, EXCEL_HEADERS, DOCS_DIR
 from modern_bot.utils.files import sanitize_filename
+from modern_bot.utils.validators import parse_date_str
+from modern_bot.services import history_mirror
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +26,31 @@ async def read_excel_data() -> List[List[str]]:
     async with excel_lock:
         return await asyncio.to_thread(_read_excel)
 
+async def filter_records(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    region: Optional[str] = None,
+) -> List[List[Any]]:
+    """Returns Excel rows for a period/region, using the Parquet mirror when it is built."""
+    if history_mirror.is_mirror_ready():
+        try:
+            async with excel_lock:
+                return await asyncio.to_thread(history_mirror.read_rows, start_date, end_date, region)
+        except Exception as error:
+            logger.warning(f"Mirror read failed, falling back to Excel: {error}")
+
+    filtered = []
+    for row in await read_excel_data():
+        date_obj = parse_date_str(row[3])
+        if start_date and (not date_obj or date_obj < start_date):
+            continue
+        if end_date and (not date_obj or date_obj > end_date):
+            continue
+        if region and (row[4] or "").strip() != region:
+            continue
+        filtered.append(row)
+    return filtered
+
 async def update_excel(data: Dict[str, Any]) -> None:
     """Updates Excel file with new conclusion data."""
     def _write_excel():
@@ -36,6 +63,7 @@ async def update_excel(data: Dict[str, Any]) -> None:
             ws = wb.active
 
         items = data.get("photo_desc", [])
+        new_rows = []
         for idx, item in enumerate(items, 1):
             row = [
                 data.get("ticket_number", "Не указано"),
@@ -48,28 +76,29 @@ async def update_excel(data: Dict[str, Any]) -> None:
                 item.get("evaluation", "Нет данных")
             ]
             ws.append(row)
+            new_rows.append(row)
         wb.save(EXCEL_FILE)
         wb.close()
+        history_mirror.append_rows(new_rows)
 
     async with excel_lock:
         await asyncio.to_thread(_write_excel)
         logger.info("Excel file updated.")
 
-async def create_excel_snapshot(rows: List[List[Any]], filename_prefix: str) -> Path:
-    """Creates a temporary Excel snapshot."""
+async def create_excel_snapshot(rows: Iterable[Sequence[Any]], filename_prefix: str) -> Path:
+    """Creates a temporary Excel snapshot using a write-only (streaming) workbook."""
     DOCS_DIR.mkdir(parents=True, exist_ok=True)
     timestamp = datetime.now().strftime("%d.%m.%Y_%H-%M-%S")
 
     def _write_snapshot() -> Path:
-        wb = Workbook()
-        ws = wb.active
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
         ws.append(EXCEL_HEADERS)
         for row in rows:
-            ws.append(row)
+            ws.append(list(row))
         raw_name = f"{filename_prefix}_{timestamp}.xlsx"
         filepath = DOCS_DIR / sanitize_filename(raw_name)
         wb.save(filepath)
-        wb.close()
         return filepath
 
     return await asyncio.to_thread(_write_snapshot)
@@ -0,0 +1,292 @@
+"""Columnar (Parquet) mirror of conclusions.xlsx.
+
+Rows are partitioned as month=YYYY-MM/region=<name> so reports can read only
+the months and region they need. The mirror is used only when pyarrow is
+installed and the mirror has been built:
+
+    python -m modern_bot.services.history_mirror [--from-excel PATH]
+
+If an append fails the _READY marker is removed and readers fall back to
+Excel until the next rebuild. Mirrors written by an older format version are
+treated as not built.
+
+HistoryMirror is the single implementation; the legacy bot in BOT ANTIK/
+creates its own instance for its history_parquet/ directory.
+"""
+import argparse
+import logging
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from modern_bot.config import EXCEL_FILE, HISTORY_MIRROR_DIR
+
+logger = logging.getLogger(__name__)
+
+MIRROR_FORMAT = "2"
+MIRROR_BATCH_ROWS = 50000
+# Every append adds one small file per touched partition; once a partition
+# holds more files than this it is rewritten into a single file.
+MIRROR_COMPACT_FILES = 16
+MIRROR_COLUMNS = [
+    "ticket_number", "issue_number", "department_number", "date",
+    "region", "item_number", "description", "evaluation",
+]
+_pyarrow_modules: Any = None
+
+
+def _load_pyarrow() -> Optional[Tuple[Any, Any, Any]]:
+    """Returns (pyarrow, pyarrow.parquet, pyarrow.dataset) or None when pyarrow is not installed."""
+    global _pyarrow_modules
+    if _pyarrow_modules is None:
+        try:
+            import pyarrow
+            import pyarrow.dataset
+            import pyarrow.parquet
+        except ImportError:
+            _pyarrow_modules = False
+        else:
+            _pyarrow_modules = (pyarrow, pyarrow.parquet, pyarrow.dataset)
+    return _pyarrow_modules or None
+
+
+def _text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _parse_date(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(str(value).strip(), "%d.%m.%Y")
+    except (TypeError, ValueError):
+        return None
+
+
+def _number(value: Any) -> Optional[float]:
+    """Evaluation as a float; free text such as "Нет данных" becomes null."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(str(value).replace(" ", "").replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def _excel_number(value: Optional[float]) -> Any:
+    return int(value) if value is not None and value.is_integer() else value
+
+
+def _build_table(rows: Sequence[Sequence[Any]]) -> Any:
+    pa = _load_pyarrow()[0]
+    columns: Dict[str, List[Any]] = {name: [] for name in MIRROR_COLUMNS}
+    columns["date_iso"] = []
+    columns["month"] = []
+    for row in rows:
+        row = list(row) + [None] * (len(MIRROR_COLUMNS) - len(row))
+        date_obj = _parse_date(row[3])
+        for name, value in zip(MIRROR_COLUMNS, row):
+            if name == "item_number":
+                try:
+                    columns[name].append(int(value))
+                except (TypeError, ValueError):
+                    columns[name].append(None)
+            elif name == "evaluation":
+                columns[name].append(_number(value))
+            elif name == "region":
+                columns[name].append((_text(value) or "").strip() or "Не указано")
+            else:
+                columns[name].append(_text(value))
+        columns["date_iso"].append(date_obj.date() if date_obj else None)
+        columns["month"].append(date_obj.strftime("%Y-%m") if date_obj else "undated")
+    types = {"item_number": pa.int64(), "evaluation": pa.float64()}
+    schema = pa.schema(
+        [(name, types.get(name, pa.string())) for name in MIRROR_COLUMNS]
+        + [("date_iso", pa.date32()), ("month", pa.string())]
+    )
+    return pa.table(columns, schema=schema)
+
+
+def _partitioning() -> Any:
+    """Explicit month/region partition schema, so no partition value is type-inferred."""
+    pa, _, ds = _load_pyarrow()
+    return ds.partitioning(pa.schema([("month", pa.string()), ("region", pa.string())]), flavor="hive")
+
+
+class HistoryMirror:
+    """Parquet mirror of one Excel journal rooted at `root`."""
+
+    def __init__(self, root: Path, compact_files: int = MIRROR_COMPACT_FILES):
+        self.root = Path(root)
+        self.marker = self.root / "_READY"
+        self.compact_files = compact_files
+
+    def is_ready(self) -> bool:
+        if _load_pyarrow() is None:
+            return False
+        try:
+            return self.marker.read_text(encoding="utf-8").split()[0] == MIRROR_FORMAT
+        except (OSError, IndexError):
+            return False
+
+    def _write_marker(self, root: Path) -> None:
+        stamp = datetime.now().isoformat(timespec="seconds")
+        (root / self.marker.name).write_text(f"{MIRROR_FORMAT} {stamp}", encoding="utf-8")
+
+    def _write_rows(self, root: Path, rows: Sequence[Sequence[Any]], tag: str) -> Set[Path]:
+        """Writes rows into month/region partitions and returns the partition directories touched."""
+        pq = _load_pyarrow()[1]
+        written: List[str] = []
+        pq.write_to_dataset(
+            _build_table(rows),
+            root_path=str(root),
+            partitioning=_partitioning(),
+            basename_template=f"part-{tag}-{{i}}.parquet",
+            file_visitor=lambda written_file: written.append(written_file.path),
+        )
+        return {Path(path).parent for path in written}
+
+    def append(self, rows: Sequence[Sequence[Any]]) -> None:
+        """Appends Excel rows to the mirror. Call under excel_lock together with the Excel write."""
+        if not rows or not self.is_ready():
+            return
+        try:
+            touched = self._write_rows(self.root, rows, datetime.now().strftime("%Y%m%d%H%M%S%f"))
+            self.compact(touched)
+        except Exception as error:
+            logger.warning(f"Mirror append failed, reports fall back to Excel: {error}")
+            self.marker.unlink(missing_ok=True)
+
+    def compact(self, partitions: Optional[Iterable[Path]] = None) -> int:
+        """Rewrites partitions holding more than compact_files files into one file each.
+
+        Without arguments every partition is checked. The marker is lifted
+        while files are swapped, so a crash mid-way sends readers back to Excel
+        instead of double-counting rows. Returns the number of partitions
+        rewritten.
+        """
+        pa, pq, _ = _load_pyarrow()
+        if partitions is None:
+            partitions = {path.parent for path in self.root.rglob("*.parquet")}
+        crowded = [
+            directory for directory in sorted(partitions)
+            if len(list(directory.glob("*.parquet"))) > self.compact_files
+        ]
+        if not crowded:
+            return 0
+        self.marker.unlink(missing_ok=True)
+        tag = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        for directory in crowded:
+            files = sorted(directory.glob("*.parquet"))
+            table = pa.concat_tables([pq.ParquetFile(str(path)).read() for path in files])
+            staging = directory / f".compact-{tag}.parquet"
+            pq.write_table(table, str(staging))
+            staging.replace(directory / f"part-compact{tag}-0.parquet")
+            for path in files:
+                path.unlink()
+        self._write_marker(self.root)
+        return len(crowded)
+
+    def rebuild(self, excel_path: Path, batch_rows: int = MIRROR_BATCH_ROWS) -> Dict[str, Any]:
+        """Rebuilds the mirror from Excel in a staging directory and swaps it in."""
+        if _load_pyarrow() is None:
+            raise RuntimeError("The history mirror requires pyarrow (pip install pyarrow).")
+        started = time.perf_counter()
+        staging = self.root.with_name(self.root.name + ".tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+
+        total = 0
+        batches = 0
+        if excel_path.exists():
+            from openpyxl import load_workbook
+
+            wb = load_workbook(excel_path, read_only=True)
+            try:
+                batch: List[Sequence[Any]] = []
+                for row in wb.active.iter_rows(min_row=2, values_only=True):
+                    if not row or all(value is None for value in row):
+                        continue
+                    batch.append(row)
+                    if len(batch) >= batch_rows:
+                        self._write_rows(staging, batch, f"rebuild{batches:05d}")
+                        total += len(batch)
+                        batches += 1
+                        batch = []
+                if batch:
+                    self._write_rows(staging, batch, f"rebuild{batches:05d}")
+                    total += len(batch)
+            finally:
+                wb.close()
+
+        self._write_marker(staging)
+        previous = self.root.with_name(self.root.name + ".old")
+        shutil.rmtree(previous, ignore_errors=True)
+        if self.root.exists():
+            self.root.rename(previous)
+        staging.rename(self.root)
+        shutil.rmtree(previous, ignore_errors=True)
+        return {"rows": total, "seconds": time.perf_counter() - started}
+
+    def read(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        region: Optional[str] = None,
+    ) -> List[List[Any]]:
+        """Reads Excel-shaped rows with month/date/region pushdown and memory-mapped files."""
+        pq = _load_pyarrow()[1]
+        filters: List[Tuple[str, str, Any]] = []
+        if start_date:
+            filters.append(("month", ">=", start_date.strftime("%Y-%m")))
+            filters.append(("date_iso", ">=", start_date.date()))
+        if end_date:
+            filters.append(("month", "<=", end_date.strftime("%Y-%m")))
+            filters.append(("date_iso", "<=", end_date.date()))
+        if region:
+            filters.append(("region", "=", region.strip()))
+        table = pq.read_table(
+            str(self.root),
+            columns=MIRROR_COLUMNS + ["date_iso"],
+            filters=filters or None,
+            memory_map=True,
+            partitioning=_partitioning(),
+        )
+        table = table.sort_by([("date_iso", "ascending")])
+        columns = [table.column(name).to_pylist() for name in MIRROR_COLUMNS]
+        evaluation = MIRROR_COLUMNS.index("evaluation")
+        columns[evaluation] = [_excel_number(value) for value in columns[evaluation]]
+        return [list(row) for row in zip(*columns)]
+
+
+mirror = HistoryMirror(HISTORY_MIRROR_DIR)
+
+
+def is_mirror_ready() -> bool:
+    return mirror.is_ready()
+
+
+def append_rows(rows: Sequence[Sequence[Any]]) -> None:
+    mirror.append(rows)
+
+
+def rebuild_mirror(excel_path: Path = EXCEL_FILE, batch_rows: int = MIRROR_BATCH_ROWS) -> Dict[str, Any]:
+    return mirror.rebuild(excel_path, batch_rows)
+
+
+def read_rows(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    region: Optional[str] = None,
+) -> List[List[Any]]:
+    return mirror.read(start_date, end_date, region)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the Parquet mirror of conclusions.xlsx.")
+    parser.add_argument("--from-excel", default=str(EXCEL_FILE), metavar="PATH")
+    args = parser.parse_args()
+    report = rebuild_mirror(Path(args.from_excel))
+    print(f"Mirror rebuilt: {report['rows']} rows in {report['seconds']:.2f} s")
@@ -15,11 +15,31 @@ from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans
 from sklearn.ensemble import RandomForestRegressor
+from joblib import Parallel, delayed
 from prophet import Prophet
 from dash.exceptions import PreventUpdate
-from flask_caching import Cache
+from flask import Response, jsonify, request, stream_with_context
+import diskcache
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
 import logging
 import datetime
+import math
+import operator
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import urlencode
 
 # ------------------------------------------------------------------------------
 # ЛОГИРОВАНИЕ
@@ -34,63 +54,317 @@ external_stylesheets = [
     dbc.themes.LITERA,
     "https://cdnjs.cloudflare.com/ajax/libs/bootstrap-icons/1.10.5/font/bootstrap-icons.min.css"
 ]
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+
+# ------------------------------------------------------------------------------
+# ФОНОВЫЕ ЗАДАЧИ
+# ------------------------------------------------------------------------------
+# Тяжёлые расчёты (Prophet, регрессия с кросс-валидацией, модели ML) выполняются
+# фоновыми колбэками: очередь и результаты хранятся в diskcache на локальном
+# диске, воркер Flask сразу освобождается, а браузер опрашивает статус задачи.
+# Там же лежат обученные модели Prophet, чтобы их видели все процессы.
+JOBS_DIR = Path(os.environ.get('ANALYZER_JOBS_DIR', 'datasets_cache/_jobs'))
+PROPHET_MODEL_TTL = 7 * 24 * 3600
+jobs_cache = diskcache.Cache(str(JOBS_DIR))
+background_callback_manager = dash.DiskcacheManager(jobs_cache)
+
+app = dash.Dash(
+    __name__,
+    external_stylesheets=external_stylesheets,
+    background_callback_manager=background_callback_manager
+)
 app.title = "Быстрый Анализ файлов Excel (.xlsx) от Олега"
 server = app.server
 
 # ------------------------------------------------------------------------------
 # КЭШ
 # ------------------------------------------------------------------------------
-cache = Cache(app.server, config={
-    'CACHE_TYPE': 'SimpleCache',
-    'CACHE_DEFAULT_TIMEOUT': 300
-})
+# Объединённые кадры кэшируются по ключу (идентификатор набора, список листов).
+# Первый уровень — LRU в памяти процесса с лимитом по объёму, второй — файлы на
+# диске, общие для всех воркеров gunicorn. Набор неизменяем (id — хэш файла),
+# поэтому записи на диске не устаревают и не требуют блокировок: запись идёт во
+# временный файл с атомарной подменой. Диск ограничен FRAME_CACHE_DISK_MAX_BYTES:
+# после записи удаляются давно не читавшиеся файлы.
+FRAME_CACHE_MAX_BYTES = int(os.environ.get('ANALYZER_FRAME_CACHE_MB', '512')) * 1024 * 1024
+FRAME_CACHE_DISK_MAX_BYTES = int(os.environ.get('ANALYZER_FRAME_CACHE_DISK_MB', '2048')) * 1024 * 1024
+FRAME_CACHE_DIR = Path(os.environ.get('ANALYZER_FRAME_CACHE_DIR', 'datasets_cache/_frames'))
+
+
+def prune_to_budget(entries, max_bytes):
+    """
+    entries — список (время последнего использования, байты, путь). Удаляем
+    самые старые файлы или каталоги, пока сумма не уложится в max_bytes.
+    Возвращает число удалённых записей.
+    """
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total <= max_bytes:
+            break
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+class FrameCache:
+    """
+    LRU-кэш DataFrame с вытеснением по объёму памяти и дисковым вторым уровнем.
+    Возвращаемые кадры общие для всех вызовов — изменять их на месте нельзя.
+    """
+
+    def __init__(self, max_bytes, disk_dir, disk_max_bytes=FRAME_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+            'memory_seconds': 0.0, 'disk_seconds': 0.0, 'build_seconds': 0.0,
+        }
+
+    @staticmethod
+    def make_key(dataset_id, sheet_names):
+        raw = json.dumps([dataset_id, list(sheet_names)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    def _record(self, kind, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.stats[f'{kind}_hits' if kind != 'build' else 'misses'] += 1
+            self.stats[f'{kind}_seconds'] += elapsed
+
+    def _put_memory(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._frames:
+                self._total_bytes -= self._sizes[key]
+            self._frames[key] = df
+            self._sizes[key] = size
+            self._frames.move_to_end(key)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and self._frames:
+                old_key, _ = self._frames.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(old_key)
+
+    def _disk_paths(self, key):
+        return self.disk_dir / f"{key}.parquet", self.disk_dir / f"{key}.pkl"
+
+    def _read_disk(self, key):
+        parquet_path, pickle_path = self._disk_paths(key)
+        try:
+            if parquet_path.exists():
+                os.utime(parquet_path)
+                return pd.read_parquet(parquet_path)
+            if pickle_path.exists():
+                os.utime(pickle_path)
+                return pd.read_pickle(pickle_path)
+        except Exception as e:
+            logger.warning(f"Повреждённая запись кэша {key}: {e}")
+        return None
+
+    def _write_disk(self, key, df):
+        parquet_path, pickle_path = self._disk_paths(key)
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.disk_dir / f".{key}.{os.getpid()}.tmp"
+        try:
+            try:
+                df.to_parquet(tmp_path, index=False)
+                target = parquet_path
+            except Exception:
+                df.to_pickle(tmp_path)
+                target = pickle_path
+            os.replace(tmp_path, target)
+        except Exception as e:
+            logger.warning(f"Не удалось записать кэш {key} на диск: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        self._prune_disk(keep=target)
+
+    def _prune_disk(self, keep=None):
+        """
+        Вытеснение на диске по тому же принципу, что в памяти: сначала давно не читавшиеся.
+        """
+        entries = []
+        for path in self.disk_dir.iterdir():
+            if path == keep or path.suffix not in ('.parquet', '.pkl'):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        budget = self.disk_max_bytes - (keep.stat().st_size if keep and keep.exists() else 0)
+        removed = prune_to_budget(entries, max(budget, 0))
+        if removed:
+            logger.info(f"Из дискового кэша кадров удалено записей: {removed}")
+
+    def get_or_build(self, key, builder):
+        started = time.perf_counter()
+        with self._lock:
+            df = self._frames.get(key)
+            if df is not None:
+                self._frames.move_to_end(key)
+        if df is not None:
+            self._record('memory', started)
+            return df
+
+        df = self._read_disk(key)
+        if df is not None:
+            self._put_memory(key, df)
+            self._record('disk', started)
+            return df
+
+        df = builder()
+        if df is not None:
+            self._put_memory(key, df)
+            self._write_disk(key, df)
+        self._record('build', started)
+        return df
+
+    def clear_memory(self):
+        with self._lock:
+            self._frames.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def snapshot(self):
+        """
+        Счётчики попаданий и среднее время ответа по каждому уровню.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._frames)
+            stats['memory_bytes'] = self._total_bytes
+        total = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / total if total else 0.0
+        for kind, count_key in (('memory', 'memory_hits'), ('disk', 'disk_hits'), ('build', 'misses')):
+            count = stats[count_key]
+            stats[f'{kind}_avg_ms'] = stats[f'{kind}_seconds'] / count * 1000 if count else 0.0
+        return stats
+
+
+frame_cache = FrameCache(FRAME_CACHE_MAX_BYTES, FRAME_CACHE_DIR)
+
+
+@server.route('/cache-stats')
+def cache_stats_route():
+    return jsonify(frame_cache.snapshot())
 
 # ------------------------------------------------------------------------------
 # ФУНКЦИИ ЧТЕНИЯ И СЕРИАЛИЗАЦИИ ДАННЫХ
 # ------------------------------------------------------------------------------
-def parse_contents(contents, filename):
+# Текстовый столбец становится категорией, если уникальных значений не больше
+# этой доли от числа строк (и не больше CATEGORY_MAX_UNIQUE).
+CATEGORY_MAX_RATIO = 0.5
+CATEGORY_MAX_UNIQUE = 10000
+
+
+def _read_excel_sheets(decoded):
     """
-    Считываем Excel-файл (xls, xlsx), конвертируем datetime-столбцы
-    в текст (формат ДД.ММ.ГГГГ), сериализуем в словарь.
+    Читаем все листы быстрым движком calamine (python-calamine), если он установлен,
+    иначе — стандартным openpyxl.
+    """
+    try:
+        return pd.read_excel(io.BytesIO(decoded), sheet_name=None, engine='calamine')
+    except (ImportError, ValueError) as e:
+        logger.debug(f"Движок calamine недоступен ({e}), читаем через openpyxl.")
+        return pd.read_excel(io.BytesIO(decoded), sheet_name=None)
+
+
+_ID_LIKE_TEXT = re.compile(r'^\s*[+-]?(0\d|\d{16,})')
+
+
+def _looks_like_identifier(as_text):
+    """
+    Номера билетов, телефонов, коды «00123»: ведущий ноль или больше 15 цифр.
+    Как число они потеряли бы нули или точность, поэтому остаются текстом.
+    """
+    return bool(as_text.str.match(_ID_LIKE_TEXT).any())
+
+
+def infer_sheet_schema(df_sheet):
+    """
+    Один раз приводим типы текстовых столбцов листа: числа, даты (ДД.ММ.ГГГГ
+    или ISO), категории. Числа с ведущим нулём или длиннее 15 цифр остаются
+    текстом. Возвращает (DataFrame, {столбец: тип}).
+    """
+    schema = {}
+    for col in df_sheet.columns:
+        series = df_sheet[col]
+        non_null = series.dropna()
+        if series.dtype == object and not non_null.empty and pd.api.types.infer_dtype(non_null) != 'boolean':
+            numeric = pd.to_numeric(non_null, errors='coerce')
+            as_text = non_null.astype(str)
+            if numeric.notna().all() and not _looks_like_identifier(as_text):
+                df_sheet[col] = numeric.reindex(series.index)
+            else:
+                for date_format in ('%d.%m.%Y', 'ISO8601'):
+                    parsed = pd.to_datetime(as_text, format=date_format, errors='coerce')
+                    if parsed.notna().all():
+                        df_sheet[col] = parsed.reindex(series.index)
+                        break
+                else:
+                    unique_count = as_text.nunique()
+                    if unique_count <= CATEGORY_MAX_UNIQUE and unique_count <= len(non_null) * CATEGORY_MAX_RATIO:
+                        df_sheet[col] = series.astype('category')
+        schema[col] = str(df_sheet[col].dtype)
+    return df_sheet, schema
+
+
+def parse_contents(decoded, filename):
+    """
+    Считываем Excel-файл (xls, xlsx) в словарь {лист: DataFrame} с уже
+    приведёнными типами столбцов.
     """
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
     try:
         if 'xls' in filename:
-            df = pd.read_excel(io.BytesIO(decoded), sheet_name=None, parse_dates=True)
+            df = _read_excel_sheets(decoded)
         else:
             return {'error': f'Неподдерживаемый формат файла: {filename}'}
     except Exception as e:
         return {'error': f'Ошибка при обработке файла {filename}: {e}'}
 
-    df_serialized = {}
+    sheets = {}
     for sheet, data in df.items():
         df_sheet = pd.DataFrame(data)
-        # Преобразуем datetime-столбцы в строки (ДД.ММ.ГГГГ)
-        date_cols = df_sheet.select_dtypes(include=['datetime', 'datetimetz']).columns
-        for col in date_cols:
-            df_sheet[col] = df_sheet[col].dt.strftime('%d.%m.%Y')
         # Убедимся, что названия столбцов являются строками
         df_sheet.columns = df_sheet.columns.astype(str)
+        df_sheet, schema = infer_sheet_schema(df_sheet)
         # Преобразуем название листа в строку
         sheet_str = str(sheet)
-        df_serialized[sheet_str] = df_sheet.to_dict('records')
-        logger.debug(f"Sheet '{sheet_str}' has been parsed with {len(df_serialized[sheet_str])} records.")
-    return df_serialized
+        sheets[sheet_str] = df_sheet
+        logger.debug(f"Sheet '{sheet_str}' has been parsed with {len(df_sheet)} records, schema: {schema}.")
+    return sheets
 
-@cache.memoize()
-def combine_data(stored_data, sheet_names):
+def combine_data(dataset_id, sheet_names):
     """
-    Объединяем несколько листов в один DataFrame (конкатенация).
-    Преобразуем '%d.%m.%Y' обратно в datetime.
+    Объединённый DataFrame по набору и списку листов через frame_cache.
     """
-    if not stored_data or not sheet_names:
+    if not dataset_id or not sheet_names:
         return None
+    key = FrameCache.make_key(dataset_id, sheet_names)
+    return frame_cache.get_or_build(key, lambda: _build_combined_frame(dataset_id, sheet_names))
 
-    # List comprehension для сбора DataFrame
+def _build_combined_frame(dataset_id, sheet_names):
+    """
+    Объединяем несколько листов набора из реестра в один DataFrame (конкатенация).
+    Типы уже приведены при загрузке, повторный разбор дат не нужен.
+    """
+    stored_data = get_dataset(dataset_id)
+    if not stored_data:
+        return None
+
+    # List comprehension для сбора DataFrame (копии, чтобы не менять набор в реестре)
     df_list = [
-        pd.DataFrame(stored_data[sheet])
+        stored_data[sheet].copy()
         for sheet in sheet_names
         if sheet in stored_data
     ]
@@ -103,57 +377,319 @@ def combine_data(stored_data, sheet_names):
 
     combined_df = pd.concat(df_list, ignore_index=True)
 
-    # Преобразуем потенциальные даты обратно (ДД.ММ.ГГГГ -> datetime)
-    date_cols = combined_df.select_dtypes(include=['object']).columns
-    for col in date_cols:
-        try:
-            combined_df[col] = pd.to_datetime(combined_df[col], format='%d.%m.%Y', dayfirst=True, errors='ignore')
-        except:
-            continue
+    # Категории с разным набором значений на листах concat превращает в object — возвращаем
+    category_cols = {
+        col for df_ in df_list for col in df_.columns
+        if isinstance(df_[col].dtype, pd.CategoricalDtype)
+    }
+    for col in category_cols:
+        if combined_df[col].dtype == object:
+            combined_df[col] = combined_df[col].astype('category')
 
     logger.info(f"Объединённый DataFrame: {combined_df.shape[0]} строк, {combined_df.shape[1]} столбцов.")
     return combined_df
 
+# ------------------------------------------------------------------------------
+# РЕЕСТР НАБОРОВ ДАННЫХ
+# ------------------------------------------------------------------------------
+# Загруженные файлы хранятся на сервере: в браузер уходит только идентификатор
+# набора (хэш содержимого файла), а коллбэки достают DataFrame по нему.
+# Последние наборы держим в памяти, все — на диске в Parquet (pickle, если
+# pyarrow не смог записать столбец со смешанными типами).
+# Диск ограничен DATASET_DISK_MAX_BYTES: давно не открывавшиеся наборы удаляются.
+DATASET_DIR = Path(os.environ.get('ANALYZER_DATASET_DIR', 'datasets_cache'))
+DATASET_MEMORY_LIMIT = 4
+DATASET_DISK_MAX_BYTES = int(os.environ.get('ANALYZER_DATASET_DISK_MB', '2048')) * 1024 * 1024
+DATASET_TOUCH_INTERVAL = 600
+DATASET_STALE_TMP_SECONDS = 3600
+
+_datasets = OrderedDict()
+_datasets_lock = threading.Lock()
+_dataset_touched = {}
+
+
+def _remember_dataset(dataset_id, sheets):
+    with _datasets_lock:
+        _datasets[dataset_id] = sheets
+        _datasets.move_to_end(dataset_id)
+        while len(_datasets) > DATASET_MEMORY_LIMIT:
+            _datasets.popitem(last=False)
+
+
+def _touch_dataset(dataset_id):
+    """
+    Отмечаем использование набора (mtime manifest.json) не чаще раза в DATASET_TOUCH_INTERVAL.
+    """
+    now = time.time()
+    if now - _dataset_touched.get(dataset_id, 0) < DATASET_TOUCH_INTERVAL:
+        return
+    _dataset_touched[dataset_id] = now
+    try:
+        os.utime(DATASET_DIR / dataset_id / 'manifest.json')
+    except OSError:
+        pass
+
+
+def prune_dataset_dir(keep=None):
+    """
+    Удаляем давно не использованные наборы сверх DATASET_DISK_MAX_BYTES и
+    брошенные временные каталоги. Набор keep не трогаем.
+    """
+    if not DATASET_DIR.exists():
+        return 0
+    now = time.time()
+    entries = []
+    for folder in DATASET_DIR.iterdir():
+        if not folder.is_dir():
+            continue
+        try:
+            if folder.name.startswith('.') and folder.name.endswith('.tmp'):
+                if now - folder.stat().st_mtime > DATASET_STALE_TMP_SECONDS:
+                    shutil.rmtree(folder, ignore_errors=True)
+                continue
+            manifest_path = folder / 'manifest.json'
+            if folder.name == keep or not re.fullmatch(r'[0-9a-f]{16,64}', folder.name) or not manifest_path.exists():
+                continue
+            size = sum(path.stat().st_size for path in folder.iterdir() if path.is_file())
+            entries.append((manifest_path.stat().st_mtime, size, folder))
+        except OSError:
+            # Каталог одновременно удаляет другой воркер
+            continue
+    removed = prune_to_budget(entries, DATASET_DISK_MAX_BYTES)
+    if removed:
+        logger.info(f"Удалено старых наборов с диска: {removed}")
+    return removed
+
+
+def _spill_dataset(dataset_id, sheets, filename):
+    """
+    Сохраняем листы набора на диск: один файл на лист + manifest.json с именами листов.
+    id — хэш содержимого, поэтому уже сохранённый набор не переписываем. Каждый
+    процесс пишет в свой временный каталог; проигравший гонку просто удаляет его.
+    """
+    target = DATASET_DIR / dataset_id
+    if (target / 'manifest.json').exists():
+        return
+    DATASET_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{dataset_id}.", suffix='.tmp', dir=DATASET_DIR))
+    manifest = {'filename': filename, 'sheets': []}
+    for idx, (sheet, df_sheet) in enumerate(sheets.items()):
+        try:
+            path = tmp_dir / f"{idx}.parquet"
+            df_sheet.to_parquet(path, index=False)
+        except Exception as e:
+            logger.debug(f"Лист '{sheet}' не записан в Parquet ({e}), сохраняем в pickle.")
+            path = tmp_dir / f"{idx}.pkl"
+            df_sheet.to_pickle(path)
+        manifest['sheets'].append({'name': sheet, 'file': path.name})
+    with open(tmp_dir / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    if target.exists() and not (target / 'manifest.json').exists():
+        # Недописанный каталог от старой версии без атомарной подмены
+        shutil.rmtree(target, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, target)
+    except OSError:
+        # Другой воркер успел сохранить тот же набор
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _load_spilled_dataset(dataset_id):
+    folder = DATASET_DIR / dataset_id
+    manifest_path = folder / 'manifest.json'
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    sheets = {}
+    for entry in manifest['sheets']:
+        path = folder / entry['file']
+        if path.suffix == '.parquet':
+            sheets[entry['name']] = pd.read_parquet(path)
+        else:
+            sheets[entry['name']] = pd.read_pickle(path)
+    return sheets
+
+
+def get_dataset(dataset_id):
+    """
+    Возвращает {лист: DataFrame} по идентификатору набора или None, если набор неизвестен.
+    """
+    if not dataset_id or not re.fullmatch(r'[0-9a-f]{16,64}', str(dataset_id)):
+        return None
+    with _datasets_lock:
+        sheets = _datasets.get(dataset_id)
+        if sheets is not None:
+            _datasets.move_to_end(dataset_id)
+    if sheets is not None:
+        _touch_dataset(dataset_id)
+        return sheets
+    try:
+        sheets = _load_spilled_dataset(dataset_id)
+    except Exception as e:
+        logger.error(f"Не удалось прочитать набор {dataset_id} с диска: {e}")
+        return None
+    if sheets is not None:
+        _dataset_touched.pop(dataset_id, None)
+        _touch_dataset(dataset_id)
+        _remember_dataset(dataset_id, sheets)
+    return sheets
+
+
+def register_dataset(decoded, filename):
+    """
+    Регистрирует файл в реестре. Повторная загрузка того же файла не парсит его заново.
+    Возвращает (dataset_id, список листов) или (None, текст ошибки).
+    """
+    dataset_id = hashlib.sha256(decoded).hexdigest()[:32]
+    sheets = get_dataset(dataset_id)
+    if sheets is not None:
+        logger.info(f"Набор {dataset_id} уже загружен, повторный разбор не нужен.")
+        return dataset_id, list(sheets.keys())
+
+    parsed = parse_contents(decoded, filename)
+    if 'error' in parsed:
+        return None, parsed['error']
+    try:
+        _spill_dataset(dataset_id, parsed, filename)
+        prune_dataset_dir(keep=dataset_id)
+    except Exception as e:
+        logger.error(f"Не удалось сохранить набор {dataset_id} на диск: {e}")
+    _remember_dataset(dataset_id, parsed)
+    return dataset_id, list(parsed.keys())
+
 # ------------------------------------------------------------------------------
 # ФУНКЦИИ ФИЛЬТРАЦИИ
 # ------------------------------------------------------------------------------
+# По ключу (набор, листы, фильтры) кэшируются только номера отобранных строк:
+# 4–8 байт на строку вместо копии кадра. Графики, статистика, ML и поиск
+# собирают выборку через df.iloc, не пересчитывая маску.
+FILTER_INDEX_MAX_BYTES = 64 * 1024 * 1024
+
+_filtered_positions = OrderedDict()
+_filtered_positions_bytes = 0
+_filtered_positions_lock = threading.Lock()
+
+
+def _filter_conditions(df, filters):
+    """
+    Условия фильтров в виде списка (столбец, оператор, значение).
+    """
+    conditions = []
+    for col_key, min_key, max_key in (('x_col', 'x_min', 'x_max'), ('y_col', 'y_min', 'y_max')):
+        col = filters.get(col_key)
+        if col and col in df.columns:
+            if filters.get(min_key) is not None:
+                conditions.append((col, '>=', filters[min_key]))
+            if filters.get(max_key) is not None:
+                conditions.append((col, '<=', filters[max_key]))
+
+    # Доп. фильтр (adv_col > adv_val)
+    adv_col = filters.get('adv_col')
+    adv_val = filters.get('adv_val')
+    if adv_col and adv_col in df.columns and adv_val is not None and pd.api.types.is_numeric_dtype(df[adv_col]):
+        conditions.append((adv_col, '>', adv_val))
+    return conditions
+
+
+def sidebar_filters_mask(df, filters):
+    """
+    Все условия фильтров одной векторной маской. Для числовых столбцов выражение
+    считает numexpr (если установлен), иначе — numpy. None, если фильтров нет.
+    """
+    conditions = _filter_conditions(df, filters)
+    if not conditions:
+        return None
+
+    numeric_only = all(
+        pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+        for col, _, _ in conditions
+    )
+    if numexpr is not None and numeric_only:
+        local_dict = {}
+        parts = []
+        for i, (col, op, value) in enumerate(conditions):
+            local_dict[f'c{i}'] = df[col].to_numpy(dtype=float, na_value=np.nan)
+            local_dict[f'v{i}'] = float(value)
+            parts.append(f'(c{i} {op} v{i})')
+        return numexpr.evaluate(' & '.join(parts), local_dict=local_dict)
+
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in conditions:
+        try:
+            mask &= _FILTER_COMPARISONS[op](df[col], value).fillna(False).to_numpy(dtype=bool)
+        except TypeError as e:
+            logger.warning(f"Фильтр {col} {op} {value} пропущен: {e}")
+    return mask
+
+
 def apply_all_filters(df, filters):
     """
-    Набор фильтров (x_min, x_max, y_min, y_max, adv_col>adv_val).
+    Набор фильтров (x_min, x_max, y_min, y_max, adv_col>adv_val) одной маской.
     """
     if df is None or df.empty:
         return df
-    
-    x_col = filters.get('x_col')
-    x_min = filters.get('x_min')
-    x_max = filters.get('x_max')
-    y_col = filters.get('y_col')
-    y_min = filters.get('y_min')
-    y_max = filters.get('y_max')
-    adv_col = filters.get('adv_col')
-    adv_val = filters.get('adv_val')
 
-    # Фильтр по X
-    if x_col and x_col in df.columns:
-        if x_min is not None:
-            df = df[df[x_col] >= x_min]
-        if x_max is not None:
-            df = df[df[x_col] <= x_max]
-
-    # Фильтр по Y
-    if y_col and y_col in df.columns:
-        if y_min is not None:
-            df = df[df[y_col] >= y_min]
-        if y_max is not None:
-            df = df[df[y_col] <= y_max]
-
-    # Доп. фильтр (adv_col > adv_val) - объединено условие
-    if adv_col and adv_col in df.columns and adv_val is not None and pd.api.types.is_numeric_dtype(df[adv_col]):
-        df = df[df[adv_col] > adv_val]
+    mask = sidebar_filters_mask(df, filters)
+    if mask is not None and not mask.all():
+        df = df[mask]
 
     logger.info(f"После фильтров: {df.shape[0]} строк, {df.shape[1]} столбцов.")
     return df
 
+
+def _store_filtered_positions(key, df, positions):
+    global _filtered_positions_bytes
+    size = 0 if positions is None else positions.nbytes
+    if size > FILTER_INDEX_MAX_BYTES:
+        return
+    with _filtered_positions_lock:
+        previous = _filtered_positions.pop(key, None)
+        if previous is not None:
+            _filtered_positions_bytes -= previous[2]
+        _filtered_positions[key] = (weakref.ref(df), positions, size)
+        _filtered_positions_bytes += size
+        while _filtered_positions_bytes > FILTER_INDEX_MAX_BYTES and _filtered_positions:
+            _, (_, _, old_size) = _filtered_positions.popitem(last=False)
+            _filtered_positions_bytes -= old_size
+
+
+def clear_filtered_positions():
+    global _filtered_positions_bytes
+    with _filtered_positions_lock:
+        _filtered_positions.clear()
+        _filtered_positions_bytes = 0
+
+
+def get_filtered_data(dataset_id, sheet_names, filters):
+    """
+    Объединённый и отфильтрованный кадр по (набор, листы, фильтры).
+    Кэш хранит номера строк, а не кадр, поэтому выборка собирается заново
+    через df.iloc; без фильтров возвращается сам объединённый кадр, без копии.
+    """
+    df = combine_data(dataset_id, sheet_names)
+    if df is None or df.empty:
+        return df
+    key = (
+        FrameCache.make_key(dataset_id, sheet_names),
+        json.dumps(filters or {}, sort_keys=True, default=str),
+    )
+    with _filtered_positions_lock:
+        cached = _filtered_positions.get(key)
+        if cached is not None and cached[0]() is df:
+            _filtered_positions.move_to_end(key)
+    if cached is None or cached[0]() is not df:
+        mask = sidebar_filters_mask(df, filters or {})
+        if mask is None or mask.all():
+            positions = None
+        else:
+            positions = np.flatnonzero(mask).astype(np.int32 if len(df) < 2 ** 31 else np.int64)
+        _store_filtered_positions(key, df, positions)
+        logger.info(f"После фильтров: {len(df) if positions is None else len(positions)} строк, {df.shape[1]} столбцов.")
+    else:
+        positions = cached[1]
+    return df if positions is None else df.iloc[positions]
+
 # ------------------------------------------------------------------------------
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ, ВЫНЕСЕННЫЕ ПО СОВЕТУ SOURCERY
 # ------------------------------------------------------------------------------
@@ -223,16 +759,23 @@ def _perform_rf_regression(df, x_col, y_col, test_size):
         html.P(f"R²: {r2:.2f}")
     ])
 
-def _perform_pca_analysis(numeric_df, n_components):
+def _perform_pca_analysis(numeric_df, n_components, large_mode='sample'):
     """
     Вспомогательный метод для PCA-анализа (стандартизация, построение графиков).
+    Выше ML_LARGE_ROWS строк — масштабируемый режим (fit_scalable_pca).
     """
-    from sklearn.preprocessing import StandardScaler
-    scaler = StandardScaler()
-    numeric_scaled = scaler.fit_transform(numeric_df)
-    pca = PCA(n_components=n_components)
-    pcs = pca.fit_transform(numeric_scaled)
-    explained_variance = pca.explained_variance_ratio_
+    note = None
+    if len(numeric_df) > ML_LARGE_ROWS:
+        pcs, explained_variance, fitted_rows = fit_scalable_pca(numeric_df, n_components, large_mode)
+        method = 'IncrementalPCA' if large_mode == 'full' else 'рандомизированный PCA'
+        note = f"Большой набор: {method}, обучение на {fitted_rows} из {len(numeric_df)} строк."
+    else:
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler()
+        numeric_scaled = scaler.fit_transform(numeric_df)
+        pca = PCA(n_components=n_components)
+        pcs = pca.fit_transform(numeric_scaled)
+        explained_variance = pca.explained_variance_ratio_
     pc_cols = [f'ПК{i+1}' for i in range(n_components)]
     df_pca = pd.DataFrame(data=pcs, columns=pc_cols)
 
@@ -242,8 +785,12 @@ def _perform_pca_analysis(numeric_df, n_components):
         title="Объяснённая дисперсия (PCA)",
         color_discrete_sequence=['#636EFA']
     )
-    fig_scatter = (
-        px.scatter(
+    if n_components < 2:
+        fig_scatter = go.Figure().update_layout(title="Недостаточно компонентов для 2D-графика")
+    elif len(df_pca) > CHART_POINT_THRESHOLD:
+        fig_scatter = create_density_figure(df_pca, 'ПК1', 'ПК2', "PCA: ПК1 vs ПК2")
+    else:
+        fig_scatter = px.scatter(
             df_pca,
             x='ПК1',
             y='ПК2',
@@ -251,45 +798,352 @@ def _perform_pca_analysis(numeric_df, n_components):
             labels={'ПК1': 'ПК1', 'ПК2': 'ПК2'},
             color_discrete_sequence=['#EF553B'],
         )
-        if n_components >= 2
-        else go.Figure().update_layout(title="Недостаточно компонентов для 2D-графика")
-    )
     return html.Div([
         html.H4("Анализ главных компонентов (PCA)", className="text-warning"),
+        html.P(note, className="text-muted") if note else html.Div(),
         dcc.Graph(figure=fig_variance),
         dcc.Graph(figure=fig_scatter)
     ])
 
-def _perform_kmeans_clustering(num_clusters, numeric_df, selected_columns):
+def _perform_kmeans_clustering(num_clusters, numeric_df, selected_columns, large_mode='sample'):
     """
     Вспомогательный метод для K-Means-кластеризации.
+    Выше ML_LARGE_ROWS строк — MiniBatchKMeans (fit_scalable_kmeans).
     """
-    kmeans = KMeans(n_clusters=num_clusters, random_state=42)
-    clusters = kmeans.fit_predict(numeric_df)
+    note = None
+    if len(numeric_df) > ML_LARGE_ROWS:
+        clusters, _, fitted_rows = fit_scalable_kmeans(numeric_df, num_clusters, large_mode)
+        note = f"Большой набор: MiniBatchKMeans, обучение на {fitted_rows} из {len(numeric_df)} строк."
+    else:
+        kmeans = KMeans(n_clusters=num_clusters, random_state=42)
+        clusters = kmeans.fit_predict(numeric_df)
     df_clustered = numeric_df.copy()
     df_clustered["Кластер"] = clusters.astype(str)
+    df_plot = cluster_plot_frame(df_clustered)
+    title = f"K-Means: {num_clusters} кластеров"
+    if len(df_plot) < len(df_clustered):
+        title += f" (показано {len(df_plot)} из {len(df_clustered)} точек)"
     fig = px.scatter(
-        df_clustered,
+        df_plot,
         x=selected_columns[0],
         y=selected_columns[1],
         color="Кластер",
-        title=f"K-Means: {num_clusters} кластеров"
+        title=title
     )
+    counts = df_clustered["Кластер"].value_counts().sort_index()
     return html.Div([
         html.H4(f"Результаты K-Means (Кластеров: {num_clusters})", className="text-secondary"),
+        html.P(note, className="text-muted") if note else html.Div(),
+        html.P("Размеры кластеров: " + ", ".join(f"{k}: {v}" for k, v in counts.items())),
         dcc.Graph(figure=fig)
     ])
 
+# ------------------------------------------------------------------------------
+# ПРОРЕЖИВАНИЕ БОЛЬШИХ ГРАФИКОВ
+# ------------------------------------------------------------------------------
+# Выше CHART_POINT_THRESHOLD точек линии и области прореживаются алгоритмом LTTB,
+# а scatter/bubble заменяются тепловой картой плотности (2D-гистограмма считается
+# на сервере). При приближении коллбэк zoom_graph_callback перестраивает график
+# по видимому диапазону — там точек меньше, и показываются исходные данные.
+CHART_POINT_THRESHOLD = 20000
+LTTB_TARGET_POINTS = 4000
+DENSITY_BINS = 200
+
+
+def _axis_values(series):
+    """
+    Числовое представление оси (datetime -> int64 нс) или None для нечисловых столбцов.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype('int64').to_numpy(dtype=float)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=float)
+    return None
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: индексы n_out точек, сохраняющих форму ряда.
+    x должен быть отсортирован по возрастанию.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return np.unique(selected)
+
+
+def downsample_lines(df, x_col, y_col, color_col=None, target=LTTB_TARGET_POINTS):
+    """
+    Прореживаем линию (или каждую линию группы color_col) до ~target точек.
+    Для нечисловой оси X берём каждую k-ю строку.
+    """
+    df = df.dropna(subset=[x_col, y_col]).sort_values(x_col, kind='stable')
+    groups = df.groupby(color_col, observed=True, sort=False) if color_col else [(None, df)]
+    parts = []
+    for _, group in groups:
+        share = max(3, int(target * len(group) / max(len(df), 1)))
+        x = _axis_values(group[x_col])
+        y = _axis_values(group[y_col])
+        if x is None or y is None:
+            step = max(1, len(group) // share)
+            parts.append(group.iloc[::step])
+        else:
+            parts.append(group.iloc[lttb_indices(x, y, share)])
+    return pd.concat(parts) if parts else df
+
+
+def create_density_figure(df, x_col, y_col, title):
+    """
+    Тепловая карта плотности точек вместо scatter; None, если оси нечисловые.
+    """
+    data = df[[x_col, y_col]].dropna()
+    x = _axis_values(data[x_col])
+    y = _axis_values(data[y_col])
+    if x is None or y is None or not len(data):
+        return None
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=DENSITY_BINS)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    if pd.api.types.is_datetime64_any_dtype(data[x_col]):
+        x_centers = pd.to_datetime(x_centers.astype('int64'))
+    if pd.api.types.is_datetime64_any_dtype(data[y_col]):
+        y_centers = pd.to_datetime(y_centers.astype('int64'))
+    fig = go.Figure(data=go.Heatmap(
+        z=np.where(counts.T > 0, counts.T, np.nan),
+        x=x_centers,
+        y=y_centers,
+        colorscale='Viridis',
+        colorbar=dict(title="Точек"),
+        hovertemplate='X: %{x}<br>Y: %{y}<br>Точек: %{z}<extra></extra>'
+    ))
+    fig.update_layout(title=f"{title} — плотность {len(data)} точек (приблизьте для деталей)")
+    return fig
+
+
+def clip_to_ranges(df, x_col, y_col, x_range=None, y_range=None):
+    """
+    Оставляем строки в видимом диапазоне осей (из relayoutData графика).
+    """
+    for col, axis_range in ((x_col, x_range), (y_col, y_range)):
+        if not col or not axis_range or col not in df.columns:
+            continue
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            low, high = pd.to_datetime(axis_range[0]), pd.to_datetime(axis_range[1])
+        elif pd.api.types.is_numeric_dtype(series):
+            low, high = float(axis_range[0]), float(axis_range[1])
+        else:
+            continue
+        df = df[(series >= low) & (series <= high)]
+    return df
+
+
+def relayout_range(relayout_data, axis):
+    """
+    Диапазон оси из relayoutData: [min, max] или None.
+    """
+    if f'{axis}.range' in relayout_data:
+        return list(relayout_data[f'{axis}.range'])
+    if f'{axis}.range[0]' in relayout_data and f'{axis}.range[1]' in relayout_data:
+        return [relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]']]
+    return None
+
+# ------------------------------------------------------------------------------
+# PCA И КЛАСТЕРИЗАЦИЯ НА БОЛЬШИХ ДАННЫХ
+# ------------------------------------------------------------------------------
+# Выше ML_LARGE_ROWS строк точные PCA и KMeans заменяются масштабируемыми:
+#   'sample' — обучение на стратифицированной выборке ML_SAMPLE_ROWS строк
+#              (рандомизированный PCA, MiniBatchKMeans);
+#   'full'   — обучение на всех строках порциями (IncrementalPCA, partial_fit).
+# В обоих режимах остальные строки преобразуются/размечаются порциями по
+# ML_CHUNK_ROWS, а графики идут через слой прореживания.
+ML_LARGE_ROWS = 50000
+ML_SAMPLE_ROWS = 20000
+ML_CHUNK_ROWS = 50000
+ML_STRATA_BINS = 4
+CLUSTER_SWEEP_K = list(range(2, 11))
+SILHOUETTE_SAMPLE_ROWS = 5000
+
+
+def _iter_chunks(values, chunk_rows=ML_CHUNK_ROWS):
+    for start in range(0, len(values), chunk_rows):
+        yield values[start:start + chunk_rows]
+
+
+def stratified_sample(df, n_rows, strata_cols=None, bins=ML_STRATA_BINS, random_state=42):
+    """
+    Выборка ~n_rows строк с сохранением долей по квантильным корзинам strata_cols
+    (по умолчанию — первые два столбца). Маленький кадр возвращается целиком.
+    """
+    if len(df) <= n_rows:
+        return df
+    strata_cols = list(strata_cols or df.columns[:2])
+    codes = np.zeros(len(df), dtype='int64')
+    for col in strata_cols:
+        binned = pd.qcut(df[col].rank(method='first'), q=bins, labels=False)
+        codes = codes * bins + binned.to_numpy(dtype='int64')
+    frac = n_rows / len(df)
+    return (
+        df.groupby(codes, sort=False, group_keys=False)
+        .sample(frac=frac, random_state=random_state)
+    )
+
+
+def _chunked_apply(func, values, chunk_rows=ML_CHUNK_ROWS):
+    """func(порция) по всем строкам values, результаты склеиваются по строкам."""
+    return np.concatenate([func(chunk) for chunk in _iter_chunks(values, chunk_rows)])
+
+
+def fit_scalable_pca(numeric_df, n_components, mode='sample'):
+    """
+    (ПК всех строк, доля дисперсии, число строк обучения) для большого кадра.
+    """
+    from sklearn.decomposition import IncrementalPCA
+    from sklearn.preprocessing import StandardScaler
+
+    values = numeric_df.to_numpy(dtype=float)
+    scaler = StandardScaler()
+    if mode == 'full':
+        for chunk in _iter_chunks(values):
+            scaler.partial_fit(chunk)
+        pca = IncrementalPCA(n_components=n_components)
+        for chunk in _iter_chunks(values):
+            if len(chunk) >= n_components:
+                pca.partial_fit(scaler.transform(chunk))
+        fitted_rows = len(values)
+    else:
+        sample = stratified_sample(numeric_df, ML_SAMPLE_ROWS).to_numpy(dtype=float)
+        scaler.fit(sample)
+        pca = PCA(n_components=n_components, svd_solver='randomized', random_state=42)
+        pca.fit(scaler.transform(sample))
+        fitted_rows = len(sample)
+    pcs = _chunked_apply(lambda chunk: pca.transform(scaler.transform(chunk)), values)
+    return pcs, pca.explained_variance_ratio_, fitted_rows
+
+
+def fit_scalable_kmeans(numeric_df, num_clusters, mode='sample'):
+    """
+    (метки всех строк, центры, число строк обучения) через MiniBatchKMeans.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    values = numeric_df.to_numpy(dtype=float)
+    kmeans = MiniBatchKMeans(n_clusters=num_clusters, random_state=42, n_init=3, batch_size=4096)
+    if mode == 'full':
+        for chunk in _iter_chunks(values):
+            if len(chunk) >= num_clusters:
+                kmeans.partial_fit(chunk)
+        fitted_rows = len(values)
+    else:
+        sample = stratified_sample(numeric_df, ML_SAMPLE_ROWS).to_numpy(dtype=float)
+        kmeans.fit(sample)
+        fitted_rows = len(sample)
+    labels = _chunked_apply(kmeans.predict, values)
+    return labels, kmeans.cluster_centers_, fitted_rows
+
+
+def cluster_plot_frame(df_clustered, label_col="Кластер", limit=CHART_POINT_THRESHOLD):
+    """
+    Точки для scatter кластеров: выше limit — выборка с сохранением долей кластеров.
+    """
+    if len(df_clustered) <= limit:
+        return df_clustered
+    frac = limit / len(df_clustered)
+    return (
+        df_clustered.groupby(label_col, sort=False, group_keys=False, observed=True)
+        .sample(frac=frac, random_state=42)
+    )
+
+
+def _score_k(values, k, silhouette_rows):
+    """Инерция и силуэт для одного k (выполняется в воркере joblib)."""
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+
+    model = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3, batch_size=4096)
+    labels = model.fit_predict(values)
+    silhouette = float('nan')
+    if len(set(labels)) > 1:
+        silhouette = silhouette_score(
+            values, labels,
+            sample_size=min(silhouette_rows, len(values)), random_state=42
+        )
+    return k, float(model.inertia_), float(silhouette)
+
+
+def cluster_k_sweep(numeric_df, k_values=CLUSTER_SWEEP_K, n_jobs=-1):
+    """
+    Метод локтя и силуэт для k_values; k считаются параллельно через joblib.
+    Большой кадр заменяется стратифицированной выборкой.
+    """
+    values = stratified_sample(numeric_df, ML_SAMPLE_ROWS).to_numpy(dtype=float)
+    k_values = [k for k in k_values if k < len(values)]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_score_k)(values, k, SILHOUETTE_SAMPLE_ROWS) for k in k_values
+    )
+    return pd.DataFrame(results, columns=['k', 'Инерция', 'Силуэт']).sort_values('k')
+
+
+def create_sweep_figure(sweep_df):
+    """Инерция (локоть) и силуэт на одном графике с двумя осями Y."""
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=sweep_df['k'], y=sweep_df['Инерция'], mode='lines+markers', name='Инерция'))
+    fig.add_trace(go.Scatter(
+        x=sweep_df['k'], y=sweep_df['Силуэт'], mode='lines+markers', name='Силуэт', yaxis='y2'
+    ))
+    fig.update_layout(
+        title="Подбор числа кластеров: локоть и силуэт",
+        xaxis=dict(title='k', dtick=1),
+        yaxis=dict(title='Инерция'),
+        yaxis2=dict(title='Силуэт', overlaying='y', side='right')
+    )
+    return fig
+
 # ------------------------------------------------------------------------------
 # ФУНКЦИИ АНАЛИТИКИ И ВИЗУАЛИЗАЦИИ
 # ------------------------------------------------------------------------------
-def create_figure(df, x_col, y_col, chart_type, color_col, symbol_col):
+def create_figure(df, x_col, y_col, chart_type, color_col, symbol_col, x_range=None, y_range=None):
     """
     Строим различные типы графиков: scatter, histogram, line, bar, box, heatmap, pie, violin, area, bubble.
+    Большие line/area прореживаются, scatter/bubble показываются плотностью;
+    x_range/y_range — видимый диапазон при приближении.
     """
     if df is None or x_col not in df.columns or (y_col and y_col not in df.columns):
         return go.Figure().update_layout(title="Выберите корректные столбцы для графика")
 
+    df = clip_to_ranges(df, x_col, y_col, x_range, y_range)
+    total_points = len(df)
+    reduced_note = ""
+    if total_points > CHART_POINT_THRESHOLD and y_col:
+        if chart_type in ('line', 'area'):
+            df = downsample_lines(df, x_col, y_col, color_col)
+            reduced_note = f" (LTTB: {len(df)} из {total_points} точек)"
+        elif chart_type in ('scatter', 'bubble'):
+            density_fig = create_density_figure(df, x_col, y_col, f"{y_col} от {x_col}")
+            if density_fig is not None:
+                density_fig.update_layout(
+                    xaxis_title=f"Ось X: {x_col}",
+                    yaxis_title=f"Ось Y: {y_col}",
+                    uirevision='data-graph'
+                )
+                return density_fig
+            df = df.sample(CHART_POINT_THRESHOLD, random_state=42)
+            reduced_note = f" (выборка {len(df)} из {total_points} точек)"
+
     try:
         if chart_type == 'scatter' and y_col:
             fig = px.scatter(
@@ -388,19 +1242,20 @@ def create_figure(df, x_col, y_col, chart_type, color_col, symbol_col):
         xaxis_title=f"Ось X: {x_col}",
         yaxis_title=f"Ось Y: {y_col}" if y_col else "",
         legend_title="Легенда",
-        hovermode="closest"
+        hovermode="closest",
+        uirevision='data-graph'
     )
+    if reduced_note:
+        fig.update_layout(title=(fig.layout.title.text or "") + reduced_note)
     return fig
 
 def create_data_table(df):
     """
-    Преобразуем DataFrame -> (columns, data) для dash_table
+    Столбцы DataFrame для dash_table; строки таблица запрашивает постранично (table_page).
     """
     if df is None or df.empty:
-        return [], []
-    columns = [{"name": str(i), "id": str(i)} for i in df.columns]
-    data = df.to_dict('records')
-    return columns, data
+        return []
+    return [{"name": str(i), "id": str(i)} for i in df.columns]
 
 def perform_statistical_analysis(df):
     """
@@ -439,6 +1294,24 @@ def perform_statistical_analysis(df):
     except Exception as e:
         return dbc.Alert(f"Ошибка статистического анализа: {e}", color="danger")
 
+def create_correlation_figure(df):
+    """
+    Тепловая карта корреляции числовых столбцов.
+    """
+    numeric_df = df.select_dtypes(include=['number']) if df is not None else pd.DataFrame()
+    if numeric_df.shape[1] < 2:
+        return go.Figure().update_layout(title="Недостаточно числовых данных для корреляции.")
+    corr = numeric_df.corr()
+    corr_fig = go.Figure(data=go.Heatmap(
+        z=corr.values,
+        x=corr.columns,
+        y=corr.columns,
+        colorscale='Viridis',
+        colorbar=dict(title="Корр.")
+    ))
+    corr_fig.update_layout(title="Корреляционная матрица")
+    return corr_fig
+
 def perform_regression_analysis(df, x_col, y_col, chart_type):
     """
     Линейная регрессия + cross_val_score (cv=5).
@@ -457,9 +1330,46 @@ def perform_regression_analysis(df, x_col, y_col, chart_type):
     except Exception as e:
         return dbc.Alert(f"Ошибка регрессии: {e}", color="danger")
 
-def perform_forecast(df, date_col, y_col, forecast_period, freq):
+def prophet_model_key(dataset_id, sheet_names, filters, date_col, y_col, freq):
+    """
+    Ключ обученной модели: (отпечаток набора и листов, фильтры, столбцы, частота).
+    Горизонт прогноза в ключ не входит — он не влияет на обучение.
+    """
+    raw = json.dumps([
+        FrameCache.make_key(dataset_id, sheet_names),
+        filters or {}, date_col, y_col, freq,
+    ], sort_keys=True, ensure_ascii=False, default=str)
+    return 'prophet:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+def _load_prophet_model(model_key):
+    """Обученная модель из дискового кэша или None."""
+    if not model_key:
+        return None
+    payload = jobs_cache.get(model_key)
+    if payload is None:
+        return None
+    try:
+        from prophet.serialize import model_from_json
+        return model_from_json(payload)
+    except Exception as e:
+        logger.warning(f"Не удалось восстановить модель Prophet {model_key}: {e}")
+        jobs_cache.delete(model_key)
+        return None
+
+def _save_prophet_model(model_key, model):
+    if not model_key:
+        return
+    try:
+        from prophet.serialize import model_to_json
+        jobs_cache.set(model_key, model_to_json(model), expire=PROPHET_MODEL_TTL)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить модель Prophet {model_key}: {e}")
+
+def perform_forecast(df, date_col, y_col, forecast_period, freq, model_key=None):
     """
     Прогноз Prophet. date_col -> ds, y_col -> y.
+    При заданном model_key обученная модель берётся из кэша, и смена горизонта
+    не приводит к повторному обучению.
     """
     if df is None or not date_col or not y_col or not pd.api.types.is_numeric_dtype(df[y_col]):
         return html.Div("Для прогноза укажите корректные столбцы (Дата, Y).")
@@ -471,8 +1381,13 @@ def perform_forecast(df, date_col, y_col, forecast_period, freq):
         if df_prophet.empty:
             return dbc.Alert("Все даты некорректны или отсутствуют.", color="danger")
 
-        model = Prophet()
-        model.fit(df_prophet)
+        model = _load_prophet_model(model_key)
+        if model is None:
+            model = Prophet()
+            model.fit(df_prophet)
+            _save_prophet_model(model_key, model)
+        else:
+            logger.info(f"Модель Prophet {model_key} взята из кэша.")
 
         future = model.make_future_dataframe(periods=forecast_period, freq=freq)
         forecast = model.predict(future)
@@ -524,7 +1439,7 @@ def perform_random_forest_regression(df, x_col, y_col, test_size=0.2):
     except Exception as e:
         return dbc.Alert(f"Ошибка Random Forest: {e}", color="danger")
 
-def perform_pca(df, n_components):
+def perform_pca(df, n_components, large_mode='sample'):
     """
     PCA: Преобразование числовых столбцов, вывод bar-графика дисперсии и scatter (PC1 vs PC2).
     """
@@ -535,11 +1450,11 @@ def perform_pca(df, n_components):
         return dbc.Alert("Недостаточно числовых столбцов для PCA.", color="danger")
     try:
         # Логику выносим во вспомогательную функцию:
-        return _perform_pca_analysis(numeric_df, n_components)
+        return _perform_pca_analysis(numeric_df, n_components, large_mode)
     except Exception as e:
         return dbc.Alert(f"Ошибка PCA: {e}", color="danger")
 
-def perform_clustering(df, selected_columns, num_clusters):
+def perform_clustering(df, selected_columns, num_clusters, large_mode='sample'):
     """
     K-Means кластеризация. Нужно >= 2 числовых столбца.
     """
@@ -550,23 +1465,150 @@ def perform_clustering(df, selected_columns, num_clusters):
         return dbc.Alert("Нет числовых данных для кластеризации.", color="danger")
     try:
         # Логику выносим во вспомогательную функцию:
-        return _perform_kmeans_clustering(num_clusters, numeric_df, selected_columns)
+        return _perform_kmeans_clustering(num_clusters, numeric_df, selected_columns, large_mode)
     except Exception as e:
         return dbc.Alert(f"Ошибка кластеризации: {e}", color="danger")
 
+def perform_cluster_sweep(df, selected_columns):
+    """
+    Подбор k: метод локтя и силуэт по выбранным числовым столбцам.
+    """
+    if df is None or not selected_columns or len(selected_columns) < 2:
+        return dbc.Alert("Выберите >=2 столбца для подбора числа кластеров.", color="danger")
+    numeric_df = df[selected_columns].select_dtypes(include=['number']).dropna()
+    if len(numeric_df) <= min(CLUSTER_SWEEP_K):
+        return dbc.Alert("Недостаточно числовых данных для подбора k.", color="danger")
+    try:
+        sweep_df = cluster_k_sweep(numeric_df)
+        best = sweep_df.loc[sweep_df['Силуэт'].idxmax()] if sweep_df['Силуэт'].notna().any() else None
+        return html.Div([
+            html.H5("Подбор числа кластеров", className="text-secondary"),
+            html.P(f"Лучший силуэт: k = {int(best['k'])} ({best['Силуэт']:.3f})") if best is not None else html.Div(),
+            dcc.Graph(figure=create_sweep_figure(sweep_df))
+        ])
+    except Exception as e:
+        return dbc.Alert(f"Ошибка подбора k: {e}", color="danger")
+
 # ------------------------------------------------------------------------------
 # ПОИСК ПО СЛОВУ
 # ------------------------------------------------------------------------------
-def perform_search_by_word(df, search_word, search_cols, sum_cols, condition_col, condition_op, condition_val):
+# Для каждого объединённого кадра (набор, листы) держим текстовый индекс. Столбец
+# индексируется лениво при первом поиске по нему: значения приводятся к строкам в
+# нижнем регистре, повторы схлопываются (factorize), а по уникальным строкам
+# строится инвертированный индекс триграмм. Поиск подстроки — пересечение
+# списков триграмм запроса, проверка кандидатов и сбор номеров строк.
+TEXT_INDEX_LIMIT = 4
+TRIGRAM_SIZE = 3
+
+_text_indexes = OrderedDict()
+_text_indexes_lock = threading.Lock()
+
+
+def normalize_text(value):
+    """Строка для поиска: нижний регистр, ё -> е, схлопнутые пробелы."""
+    return ' '.join(str(value).casefold().replace('ё', 'е').split())
+
+
+def _trigrams(text):
+    return {text[i:i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+
+class TextIndex:
     """
-    Ищем search_word в search_cols, выводим таблицу + опционально суммируем sum_cols.
-    Применяем дополнительные условия, если они заданы.
+    Триграммный индекс столбцов одного кадра. Номера строк в индексе —
+    позиции в кадре (у объединённого кадра RangeIndex, они же метки).
     """
+
+    def __init__(self, df):
+        self.frame = df
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def _build_column(self, col):
+        series = self.frame[col]
+        texts = series.astype(str).where(series.notna(), '')
+        # Нормализуем только уникальные значения, затем схлопываем совпавшие после нормализации
+        raw_codes, raw_uniques = pd.factorize(texts, sort=False)
+        norm_codes, uniques = pd.factorize(
+            np.asarray([normalize_text(v) for v in raw_uniques], dtype=object), sort=False
+        )
+        codes = norm_codes[raw_codes]
+        uniques = np.asarray(uniques, dtype=object)
+        postings = {}
+        for uid, text in enumerate(uniques):
+            for gram in _trigrams(text):
+                postings.setdefault(gram, []).append(uid)
+        postings = {gram: np.asarray(ids, dtype=np.int64) for gram, ids in postings.items()}
+        return {'codes': codes, 'uniques': uniques, 'postings': postings}
+
+    def _column(self, col):
+        with self._lock:
+            entry = self._columns.get(col)
+        if entry is None:
+            started = time.perf_counter()
+            entry = self._build_column(col)
+            logger.info(f"Текстовый индекс столбца {col!r}: {len(entry['uniques'])} уникальных значений за {time.perf_counter() - started:.2f} с")
+            with self._lock:
+                entry = self._columns.setdefault(col, entry)
+        return entry
+
+    def _matching_values(self, entry, query):
+        uniques = entry['uniques']
+        grams = _trigrams(query)
+        if grams:
+            lists = []
+            for gram in grams:
+                ids = entry['postings'].get(gram)
+                if ids is None:
+                    return np.empty(0, dtype=np.int64)
+                lists.append(ids)
+            lists.sort(key=len)
+            candidates = lists[0]
+            for ids in lists[1:]:
+                candidates = np.intersect1d(candidates, ids, assume_unique=True)
+                if not len(candidates):
+                    return candidates
+        else:
+            candidates = np.arange(len(uniques))
+        # Триграммы — необходимое условие; подстроку проверяем на кандидатах
+        return np.asarray([uid for uid in candidates if query in uniques[uid]], dtype=np.int64)
+
+    def search(self, query, columns):
+        """Отсортированные позиции строк, где query содержится хотя бы в одном из columns."""
+        query = normalize_text(query)
+        hits = np.zeros(len(self.frame), dtype=bool)
+        for col in columns:
+            entry = self._column(col)
+            matched = self._matching_values(entry, query)
+            if len(matched):
+                hits |= np.isin(entry['codes'], matched)
+        return np.flatnonzero(hits)
+
+
+def get_text_index(dataset_id, sheet_names):
+    """Текстовый индекс объединённого кадра (набор, листы) из небольшого LRU."""
+    df = combine_data(dataset_id, sheet_names)
     if df is None or df.empty:
-        return dbc.Alert("Нет данных для поиска.", color="danger")
-    if not search_word or not search_cols:
-        return dbc.Alert("Укажите слово и выберите столбцы для поиска.", color="warning")
-    
+        return None
+    key = FrameCache.make_key(dataset_id, sheet_names)
+    with _text_indexes_lock:
+        index = _text_indexes.get(key)
+        if index is not None and index.frame is df:
+            _text_indexes.move_to_end(key)
+            return index
+        index = TextIndex(df)
+        _text_indexes[key] = index
+        while len(_text_indexes) > TEXT_INDEX_LIMIT:
+            _text_indexes.popitem(last=False)
+    return index
+
+def search_rows(df, search_word, search_cols, condition_col=None, condition_op=None, condition_val=None,
+                text_index=None):
+    """
+    Строки df, где search_word содержится в search_cols, с учётом доп. условия.
+    text_index — индекс объединённого кадра, подмножеством которого является df.
+    Ошибку в условии поднимаем как ValueError.
+    """
     # Фильтрация по условию, если задано
     if condition_col and condition_op and condition_val:
         try:
@@ -580,54 +1622,413 @@ def perform_search_by_word(df, search_word, search_cols, sum_cols, condition_col
                 query_str = f"`{condition_col}` {condition_op} @condition_val"
                 df = df.query(query_str)
         except Exception as e:
-            return dbc.Alert(f"Ошибка при применении условия: {e}", color="danger")
-    
+            raise ValueError(e) from e
+
     # Поиск слова в выбранных столбцах
-    mask = pd.Series([False]*len(df))
-    for col in search_cols:
-        mask = mask | df[col].astype(str).str.contains(search_word, case=False, na=False)
-    found_df = df[mask]
+    if text_index is None:
+        text_index = TextIndex(df)
+    positions = text_index.search(search_word, search_cols)
+    if df is text_index.frame:
+        return df.iloc[positions]
+    return df[df.index.isin(text_index.frame.index[positions])]
+
+def perform_search_by_word(df, search_word, search_cols, sum_cols, condition_col, condition_op, condition_val,
+                           text_index=None):
+    """
+    Ищем search_word в search_cols, выводим сводку + опционально суммируем sum_cols.
+    Применяем дополнительные условия, если они заданы. Сами строки показывает
+    таблица search-table постранично с сервера.
+    Возвращает (разметка, число найденных строк).
+    """
+    if df is None or df.empty:
+        return dbc.Alert("Нет данных для поиска.", color="danger"), 0
+    if not search_word or not search_cols:
+        return dbc.Alert("Укажите слово и выберите столбцы для поиска.", color="warning"), 0
+
+    try:
+        found_df = search_rows(df, search_word, search_cols, condition_col, condition_op, condition_val, text_index)
+    except ValueError as e:
+        return dbc.Alert(f"Ошибка при применении условия: {e}", color="danger"), 0
     rows_found = found_df.shape[0]
-    
+
     sum_results = {}
     if sum_cols:
         for col in sum_cols:
             if pd.api.types.is_numeric_dtype(df[col]):
-                sum_results[col] = found_df[col].sum()
+                total = np.nansum(found_df[col].to_numpy(dtype='float64', na_value=np.nan))
+                sum_results[col] = int(total) if pd.api.types.is_integer_dtype(df[col]) else total
             else:
                 sum_results[col] = "Не числовой столбец"
-    
-    columns, data = create_data_table(found_df)
+
     layout_parts = [
         html.H5("Результаты Поиска", className="mt-3"),
         html.P(f"Найдено строк: {rows_found}, где '{search_word}' содержится в столбцах {', '.join(search_cols)}.")
     ]
-    
+
     if sum_cols:
         sum_text = "Суммы по выбранным столбцам:"
         for col, summ in sum_results.items():
             sum_text += f" **{col}**: {summ};"
         layout_parts.append(html.P(sum_text))
-    
+
     if rows_found > 0:
-        table_component = dash_table.DataTable(
-            columns=columns,
-            data=data,
-            style_table={'overflowX': 'auto', 'maxHeight': '400px', 'overflowY': 'scroll'},
-            style_cell={
-                'minWidth': '100px', 'width': '150px', 'maxWidth': '300px',
-                'whiteSpace': 'normal'
-            },
-            filter_action='native',
-            sort_action='native',
-            sort_mode='multi'
-        )
-        layout_parts.append(html.Div([
-            html.H6("Таблица найденных строк:"),
-            table_component
-        ]))
-    
-    return html.Div(layout_parts)
+        layout_parts.append(html.H6("Таблица найденных строк:"))
+
+    return html.Div(layout_parts), rows_found
+
+# ------------------------------------------------------------------------------
+# СЕРВЕРНАЯ ТАБЛИЦА (ПАГИНАЦИЯ, СОРТИРОВКА, ФИЛЬТР)
+# ------------------------------------------------------------------------------
+# Таблицы получают с сервера только текущую страницу. Источник таблицы (набор,
+# листы, фильтры, параметры поиска) лежит в dcc.Store; по нему строится «вид» —
+# DataFrame с кэшем перестановок сортировки и масок фильтра. Страница — срез
+# уже отсортированного индекса. Вид держит тот же кадр, что и кэш отфильтрованных
+# данных (без копии), а перестановки и маски — позиции строк, а не метки индекса.
+TABLE_PAGE_SIZE = 50
+TABLE_VIEW_LIMIT = 8
+TABLE_VIEW_CACHE_LIMIT = 8
+
+_table_views = OrderedDict()
+_table_views_lock = threading.Lock()
+
+_FILTER_PART_RE = re.compile(
+    r'^\s*\{(?P<col>.+?)\}\s+(?P<op>[si]?(?:>=|<=|!=|<|>|=|ge|le|lt|gt|ne|eq|contains|datestartswith))\s+(?P<value>.+?)\s*$'
+)
+_FILTER_COMPARISONS = {
+    '>=': operator.ge, 'ge': operator.ge,
+    '<=': operator.le, 'le': operator.le,
+    '<': operator.lt, 'lt': operator.lt,
+    '>': operator.gt, 'gt': operator.gt,
+    '!=': operator.ne, 'ne': operator.ne,
+    '=': operator.eq, 'eq': operator.eq,
+}
+
+
+def _parse_filter_value(raw):
+    if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in ("'", '"', '`'):
+        return raw[1:-1].replace('\\' + raw[0], raw[0])
+    try:
+        return float(raw)
+    except ValueError:
+        return raw
+
+
+def _filter_part_mask(series, op, value):
+    """
+    Векторная маска для одного условия filter_query DataTable.
+    """
+    case_insensitive = op.startswith('i')
+    op = op[1:] if op[:1] in ('s', 'i') else op
+    if op == 'contains':
+        return series.astype(str).str.contains(str(value), case=not case_insensitive, regex=False, na=False).to_numpy()
+    if op == 'datestartswith':
+        if pd.api.types.is_datetime64_any_dtype(series):
+            text = series.dt.strftime('%Y-%m-%d')
+        else:
+            text = series.astype(str)
+        return text.str.startswith(str(value), na=False).to_numpy()
+
+    compare = _FILTER_COMPARISONS[op]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        value = pd.to_datetime(str(value), dayfirst=True, errors='coerce')
+    elif pd.api.types.is_numeric_dtype(series) and isinstance(value, str):
+        value = pd.to_numeric(value, errors='coerce')
+    try:
+        result = compare(series, value)
+    except TypeError:
+        result = compare(series.astype(str), str(value))
+    return result.fillna(False).to_numpy(dtype=bool)
+
+
+def table_query_mask(df, filter_query):
+    """
+    Переводим filter_query DataTable ('{a} > 5 && {b} contains x') в булеву маску.
+    Нераспознанные части и неизвестные столбцы пропускаем.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for part in (filter_query or '').split(' && '):
+        match = _FILTER_PART_RE.match(part)
+        if not match or match['col'] not in df.columns:
+            continue
+        mask &= _filter_part_mask(df[match['col']], match['op'], _parse_filter_value(match['value']))
+    return mask
+
+
+def _get_table_view(source):
+    """
+    Вид для источника таблицы: DataFrame и кэши перестановок/масок. Строится один
+    раз на источник и держится в небольшом LRU; кадр не копируется.
+    """
+    view_key = hashlib.sha256(json.dumps(source, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    with _table_views_lock:
+        view = _table_views.get(view_key)
+        if view is not None:
+            _table_views.move_to_end(view_key)
+            return view
+
+    df = get_filtered_data(source.get('dataset_id'), source.get('sheets'), source.get('filters') or {})
+    search = source.get('search')
+    if df is not None and search:
+        try:
+            text_index = get_text_index(source.get('dataset_id'), source.get('sheets'))
+            df = search_rows(df, **search, text_index=text_index)
+        except ValueError:
+            return None
+    if df is None:
+        return None
+    view = {'df': df, 'orders': OrderedDict(), 'masks': OrderedDict()}
+    with _table_views_lock:
+        _table_views[view_key] = view
+        while len(_table_views) > TABLE_VIEW_LIMIT:
+            _table_views.popitem(last=False)
+    return view
+
+
+def _view_cached(view, kind, key, build):
+    """
+    Значение из кэша вида kind ('orders' или 'masks'); хранится не больше
+    TABLE_VIEW_CACHE_LIMIT последних значений.
+    """
+    cache = view[kind]
+    with _table_views_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            return value
+    value = build()
+    with _table_views_lock:
+        cache[key] = value
+        while len(cache) > TABLE_VIEW_CACHE_LIMIT:
+            cache.popitem(last=False)
+    return value
+
+
+def _sort_positions(df, sort_key):
+    """Позиции строк df в порядке сортировки sort_key (пары столбец, направление)."""
+    if not sort_key:
+        return np.arange(len(df))
+    columns = [col for col, _ in sort_key]
+    keys = df[list(dict.fromkeys(columns))]
+    keys.index = pd.RangeIndex(len(keys))
+    return keys.sort_values(
+        columns,
+        ascending=[direction == 'asc' for _, direction in sort_key],
+        kind='stable',
+        na_position='last',
+    ).index.to_numpy()
+
+
+def _view_order(view, sort_by):
+    """
+    Перестановка строк для сортировки sort_by; кэшируется по набору столбцов и направлений.
+    """
+    df = view['df']
+    sort_key = tuple((item['column_id'], item['direction']) for item in sort_by or [] if item['column_id'] in df.columns)
+    return _view_cached(view, 'orders', sort_key, lambda: _sort_positions(df, sort_key))
+
+
+def table_page(source, page_current, page_size, sort_by, filter_query):
+    """
+    Возвращает (записи страницы, число страниц, всего строк после фильтра).
+    """
+    view = _get_table_view(source) if source else None
+    if view is None:
+        return [], 1, 0
+    mask = _view_cached(view, 'masks', filter_query or '', lambda: table_query_mask(view['df'], filter_query))
+    order = _view_order(view, sort_by)
+    rows = order[mask[order]]
+    page_size = page_size or TABLE_PAGE_SIZE
+    page_count = max(1, math.ceil(len(rows) / page_size))
+    start = (page_current or 0) * page_size
+    page_df = view['df'].iloc[rows[start:start + page_size]]
+    return page_df.to_dict('records'), page_count, len(rows)
+
+# ------------------------------------------------------------------------------
+# ВЫГРУЗКА ДАННЫХ
+# ------------------------------------------------------------------------------
+# Ссылки «Скачать» ведут на маршрут /export: спецификация (набор, листы, фильтры)
+# передаётся в URL, а файл формируется только при переходе по ссылке и отдаётся
+# потоком порциями по EXPORT_CHUNK_ROWS строк. XLSX нельзя писать в сеть по частям,
+# поэтому он собирается во временный файл (openpyxl write_only) и отдаётся порциями.
+EXPORT_CHUNK_ROWS = 50000
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'filtered_data.csv'),
+    'parquet': ('application/vnd.apache.parquet', 'filtered_data.parquet'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'filtered_data.xlsx'),
+}
+XLSX_MAX_ROWS = 1048575
+
+
+def export_url(dataset_id, sheet_names, filters, fmt='csv'):
+    """URL выгрузки отфильтрованных данных в формате fmt."""
+    spec = json.dumps(
+        {'dataset_id': dataset_id, 'sheets': list(sheet_names), 'filters': filters or {}},
+        ensure_ascii=False, sort_keys=True, default=str, separators=(',', ':')
+    )
+    token = base64.urlsafe_b64encode(spec.encode('utf-8')).decode('ascii').rstrip('=')
+    return f"/export?{urlencode({'spec': token, 'format': fmt})}"
+
+
+def _parse_export_spec(token):
+    """Спецификация выгрузки из URL или None, если она повреждена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        spec = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(spec, dict) or not isinstance(spec.get('sheets'), list) or not isinstance(spec.get('filters', {}), dict):
+        return None
+    return spec
+
+
+def _export_chunks(df):
+    """Порции кадра с датами в формате дд.мм.гггг, как в интерфейсе."""
+    date_columns = df.select_dtypes(include=['datetime', 'datetimetz']).columns
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXPORT_CHUNK_ROWS]
+        if len(date_columns):
+            chunk = chunk.copy()
+            for c in date_columns:
+                chunk[c] = chunk[c].dt.strftime('%d.%m.%Y')
+        yield chunk
+
+
+def _stream_csv(df):
+    yield df.iloc[:0].to_csv(index=False)
+    for chunk in _export_chunks(df):
+        yield chunk.to_csv(index=False, header=False)
+
+
+class _StreamSink(io.RawIOBase):
+    """Файлоподобный приёмник для ParquetWriter: копит байты и помнит позицию."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _is_text_export_column(series):
+    if series.dtype == object:
+        return True
+    return isinstance(series.dtype, pd.CategoricalDtype) and not all(
+        isinstance(v, str) for v in series.cat.categories
+    )
+
+
+def parquet_export_plan(df):
+    """
+    (схема Parquet, столбцы, которые пишутся текстом). Считается в маршруте до
+    отправки заголовков, чтобы ошибка схемы вернулась кодом ответа, а не
+    оборванным файлом. Object-столбцы (смешанные типы, пустые в начале) и
+    категории с нестроковыми значениями всегда пишутся как string.
+    """
+    import pyarrow as pa
+
+    text_cols = [c for c in df.columns if _is_text_export_column(df[c])]
+    typed = pa.Schema.from_pandas(df.iloc[:0].drop(columns=text_cols), preserve_index=False)
+    schema = pa.schema([
+        pa.field(c, pa.string()) if c in text_cols else typed.field(c)
+        for c in df.columns
+    ])
+    return schema, text_cols
+
+
+def _as_export_text(chunk, text_cols):
+    if not text_cols:
+        return chunk
+    chunk = chunk.copy()
+    for c in text_cols:
+        column = chunk[c]
+        chunk[c] = column.astype(str).where(column.notna(), None)
+    return chunk
+
+
+def _stream_parquet(df, plan):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema, text_cols = plan
+    sink = _StreamSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema) as writer:
+        for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+            chunk = _as_export_text(df.iloc[start:start + EXPORT_CHUNK_ROWS], text_cols)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _stream_xlsx(df):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Данные')
+    sheet.append([str(c) for c in df.columns])
+    for chunk in _export_chunks(df):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append(row)
+    tmp = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+    tmp.close()
+    try:
+        workbook.save(tmp.name)
+        with open(tmp.name, 'rb') as f:
+            while True:
+                data = f.read(1024 * 1024)
+                if not data:
+                    break
+                yield data
+    finally:
+        os.remove(tmp.name)
+
+
+@server.route('/export')
+def export_route():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Неизвестный формат: {fmt}'}), 400
+    spec = _parse_export_spec(request.args.get('spec', ''))
+    if spec is None:
+        return jsonify({'error': 'Некорректная спецификация выгрузки'}), 400
+    df = get_filtered_data(spec.get('dataset_id'), spec['sheets'], spec.get('filters') or {})
+    if df is None:
+        return jsonify({'error': 'Набор данных не найден'}), 404
+    if fmt == 'xlsx' and len(df) > XLSX_MAX_ROWS:
+        return jsonify({'error': f'Для XLSX слишком много строк ({len(df)}), выберите CSV или Parquet'}), 413
+
+    if fmt == 'parquet':
+        try:
+            plan = parquet_export_plan(df)
+        except Exception as e:
+            logger.warning(f"Выгрузка Parquet невозможна: {e}")
+            return jsonify({'error': f'Не удалось подготовить Parquet, выберите CSV: {e}'}), 422
+        stream = _stream_parquet(df, plan)
+    else:
+        stream = {'csv': _stream_csv, 'xlsx': _stream_xlsx}[fmt](df)
+
+    mimetype, filename = EXPORT_FORMATS[fmt]
+    logger.info(f"Выгрузка {fmt}: набор {spec.get('dataset_id')}, {len(df)} строк")
+    return Response(
+        stream_with_context(stream),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 # ------------------------------------------------------------------------------
 # ДОКУМЕНТАЦИЯ
@@ -840,12 +2241,19 @@ app.layout = dbc.Container([
                 html.I(className="bi bi-arrow-clockwise me-1"),
                 "Обновить Визуализацию"
             ], id='update-button', color='success', className='my-3'),
+            dbc.Button([
+                html.I(className="bi bi-x-circle me-1"),
+                "Отменить анализ"
+            ], id='cancel-analysis-button', color='outline-danger', className='my-3 ms-2', disabled=True),
+            dbc.Progress(id='analysis-progress', value=0, label="", className='mb-2', style={"height": "1.2rem"}),
 
             html.Div(id='data-info', className='text-info mb-2', style={"fontSize": "0.9rem"}),
 
             dcc.Graph(id='data-graph'),
+            dcc.Store(id='graph-source'),
 
             html.H5("Таблица данных:", className='mt-3 text-primary'),
+            dcc.Store(id='table-source'),
             dash_table.DataTable(
                 id='data-table',
                 columns=[],
@@ -855,9 +2263,14 @@ app.layout = dbc.Container([
                     'minWidth': '100px', 'width': '150px', 'maxWidth': '300px',
                     'whiteSpace': 'normal'
                 },
-                filter_action='native',
-                sort_action='native',
-                sort_mode='multi'
+                page_action='custom',
+                page_current=0,
+                page_size=TABLE_PAGE_SIZE,
+                filter_action='custom',
+                filter_query='',
+                sort_action='custom',
+                sort_mode='multi',
+                sort_by=[]
             ),
             html.A(
                 'Скачать CSV',
@@ -866,6 +2279,22 @@ app.layout = dbc.Container([
                 href="",
                 target="_blank",
                 className='btn btn-secondary my-2'
+            ),
+            html.A(
+                'Parquet',
+                id='download-parquet-link',
+                download="filtered_data.parquet",
+                href="",
+                target="_blank",
+                className='btn btn-outline-secondary my-2 ms-2'
+            ),
+            html.A(
+                'XLSX',
+                id='download-xlsx-link',
+                download="filtered_data.xlsx",
+                href="",
+                target="_blank",
+                className='btn btn-outline-secondary my-2 ms-2'
             )
         ])
     ], style={"marginBottom": "30px"}),
@@ -945,7 +2374,30 @@ app.layout = dbc.Container([
                 html.I(className="bi bi-search me-1"),
                 "Выполнить Поиск"
             ], id='search-button', color='info'),
-            html.Div(id='search-output', className='mt-3')
+            html.Div(id='search-output', className='mt-3'),
+            dcc.Store(id='search-table-source'),
+            html.Div(
+                dash_table.DataTable(
+                    id='search-table',
+                    columns=[],
+                    data=[],
+                    style_table={'overflowX': 'auto', 'maxHeight': '400px', 'overflowY': 'scroll'},
+                    style_cell={
+                        'minWidth': '100px', 'width': '150px', 'maxWidth': '300px',
+                        'whiteSpace': 'normal'
+                    },
+                    page_action='custom',
+                    page_current=0,
+                    page_size=TABLE_PAGE_SIZE,
+                    filter_action='custom',
+                    filter_query='',
+                    sort_action='custom',
+                    sort_mode='multi',
+                    sort_by=[]
+                ),
+                id='search-table-container',
+                style={'display': 'none'}
+            )
         ])
     ], style={"marginBottom": "30px"}),
 
@@ -1011,6 +2463,21 @@ app.layout = dbc.Container([
     dbc.Card([
         dbc.CardHeader(html.H4("PCA и Кластеризация", className="text-white"), className="bg-dark"),
         dbc.CardBody([
+            html.Label("Режим для больших наборов:", className="fw-bold"),
+            dbc.RadioItems(
+                id='ml-large-mode',
+                options=[
+                    {'label': 'Обучение на стратифицированной выборке', 'value': 'sample'},
+                    {'label': 'Обучение на всех строках порциями', 'value': 'full'},
+                ],
+                value='sample',
+                inline=True,
+                className='mb-3'
+            ),
+            dbc.Tooltip(
+                f"Действует, если строк больше {ML_LARGE_ROWS}: MiniBatchKMeans и рандомизированный/инкрементальный PCA",
+                target='ml-large-mode'
+            ),
             dbc.Row([
                 dbc.Col([
                     html.H5("PCA (Главные Компоненты)", className="text-warning"),
@@ -1039,7 +2506,10 @@ app.layout = dbc.Container([
                     dbc.Input(id='num-clusters', type='number', value=3, min=2, step=1, style={'width': '100px'}),
                     dbc.Tooltip("Укажите количество кластеров для алгоритма K-Means", target='num-clusters'),
                     dbc.Button('Выполнить', id='cluster-button', color='secondary', className='mt-2'),
-                    html.Div(id='cluster-output', className='mt-3')
+                    dbc.Button('Подобрать k', id='cluster-sweep-button', color='outline-secondary', className='mt-2 ms-2'),
+                    dbc.Tooltip("Метод локтя и силуэт для k от 2 до 10", target='cluster-sweep-button'),
+                    html.Div(id='cluster-output', className='mt-3'),
+                    html.Div(id='cluster-sweep-output', className='mt-3')
                 ], width=6),
             ])
         ])
@@ -1066,15 +2536,15 @@ app.layout = dbc.Container([
 def handle_upload(contents, filename):
     if contents is None:
         raise PreventUpdate
-    parsed = parse_contents(contents, filename)
-    logger.debug(f"Parsed data: {parsed}")
-    if 'error' in parsed:
-        return {}, [], None, dbc.Alert(parsed['error'], color='danger')
+    content_type, content_string = contents.split(',')
+    dataset_id, result = register_dataset(base64.b64decode(content_string), filename)
+    if dataset_id is None:
+        return None, [], None, dbc.Alert(result, color='danger')
 
-    sheets = list(parsed.keys())
+    sheets = result
     opts = [{'label': s, 'value': s} for s in sheets]
     default_sheet = sheets[0] if sheets else None
-    return parsed, opts, default_sheet, dbc.Alert("Файл успешно загружен!", color='success')
+    return dataset_id, opts, default_sheet, dbc.Alert("Файл успешно загружен!", color='success')
 
 # Обновление опций для осей X, Y, дополнительных фильтров и столбца дат
 @app.callback(
@@ -1089,10 +2559,10 @@ def handle_upload(contents, filename):
     Input('sheet-dropdown', 'value'),
     State('stored-data', 'data')
 )
-def update_xy_options(sheet_names, stored_data):
-    if not stored_data or not sheet_names:
+def update_xy_options(sheet_names, dataset_id):
+    if not dataset_id or not sheet_names:
         return [], None, [], None, [], None, [], None
-    df = combine_data(stored_data, sheet_names)
+    df = combine_data(dataset_id, sheet_names)
     if df is None or df.empty:
         return [], None, [], None, [], None, [], None
 
@@ -1132,10 +2602,10 @@ def update_xy_options(sheet_names, stored_data):
     Input('sheet-dropdown', 'value'),
     State('stored-data', 'data')
 )
-def update_color_symbol(sheet_names, stored_data):
-    if not stored_data or not sheet_names:
+def update_color_symbol(sheet_names, dataset_id):
+    if not dataset_id or not sheet_names:
         return [], None, [], None
-    df = combine_data(stored_data, sheet_names)
+    df = combine_data(dataset_id, sheet_names)
     if df is None or df.empty:
         return [], None, [], None
 
@@ -1150,10 +2620,10 @@ def update_color_symbol(sheet_names, stored_data):
     Input('sheet-dropdown', 'value'),
     State('stored-data', 'data')
 )
-def update_cluster_columns(sheet_names, stored_data):
-    if not stored_data or not sheet_names:
+def update_cluster_columns(sheet_names, dataset_id):
+    if not dataset_id or not sheet_names:
         return [], None
-    df = combine_data(stored_data, sheet_names)
+    df = combine_data(dataset_id, sheet_names)
     if df is None or df.empty:
         return [], None
 
@@ -1173,10 +2643,10 @@ def update_cluster_columns(sheet_names, stored_data):
     Input('sheet-dropdown', 'value'),
     State('stored-data', 'data')
 )
-def update_search_sum_condition_columns(sheet_names, stored_data):
-    if not stored_data or not sheet_names:
+def update_search_sum_condition_columns(sheet_names, dataset_id):
+    if not dataset_id or not sheet_names:
         return [], None, [], None, [], None
-    df = combine_data(stored_data, sheet_names)
+    df = combine_data(dataset_id, sheet_names)
     if df is None or df.empty:
         return [], None, [], None, [], None
 
@@ -1236,21 +2706,24 @@ def apply_filters_callback(n_clicks, x_col, x_min, x_max, y_col, y_min, y_max, a
 )
 def reset_filters_callback(n_clicks):
     if n_clicks:
-        cache.clear()
-        logger.info("Сброс фильтров и кэша.")
+        frame_cache.clear_memory()
+        clear_filtered_positions()
+        with _text_indexes_lock:
+            _text_indexes.clear()
+        logger.info(f"Сброс фильтров и кэша. Статистика кэша: {frame_cache.snapshot()}")
         return {}
     raise PreventUpdate
 
 # Обновление графика, таблицы, статистики и прочего
 @app.callback(
     Output('data-graph', 'figure'),
+    Output('graph-source', 'data'),
     Output('data-table', 'columns'),
-    Output('data-table', 'data'),
-    Output('stats-output', 'children'),
-    Output('correlation-heatmap', 'figure'),
-    Output('regression-output', 'children'),
-    Output('forecast-output', 'children'),
+    Output('table-source', 'data'),
+    Output('data-table', 'page_current'),
     Output('download-link', 'href'),
+    Output('download-parquet-link', 'href'),
+    Output('download-xlsx-link', 'href'),
     Output('data-info', 'children'),
     Input('update-button', 'n_clicks'),
     State('stored-data', 'data'),
@@ -1259,83 +2732,125 @@ def reset_filters_callback(n_clicks):
     State('x-axis-dropdown', 'value'),
     State('y-axis-dropdown', 'value'),
     State('chart-type-dropdown', 'value'),
-    State('forecast-period', 'value'),
     State('color-dropdown', 'value'),
-    State('symbol-dropdown', 'value'),
-    State('date-column-dropdown', 'value'),
-    State('forecast-freq', 'value')
+    State('symbol-dropdown', 'value')
 )
-def update_graph(n_clicks, stored_data, sheet_names, filters, 
-                 x_col, y_col, chart_type, forecast_period,
-                 color_col, symbol_col, date_col, freq):
-    if not stored_data or not sheet_names:
+def update_graph(n_clicks, dataset_id, sheet_names, filters,
+                 x_col, y_col, chart_type, color_col, symbol_col):
+    if not dataset_id or not sheet_names:
         raise PreventUpdate
 
-    df = combine_data(stored_data, sheet_names)
+    df = combine_data(dataset_id, sheet_names)
     if df is None or df.empty:
         return (
             go.Figure().update_layout(title='Нет данных'),
-            [], [],
-            dbc.Alert('Нет данных.', color='danger'),
-            go.Figure(),
-            html.Div(),
-            html.Div(),
-            "",
+            None,
+            [], None, 0,
+            "", "", "",
             "Нет данных для отображения."
         )
 
     before_shape = df.shape
-    df = apply_all_filters(df, filters or {})
+    df = get_filtered_data(dataset_id, sheet_names, filters or {})
     after_shape = df.shape
     data_info_text = f"До фильтров: {before_shape[0]} строк, {before_shape[1]} столбцов. После фильтров: {after_shape[0]} строк, {after_shape[1]} столбцов."
 
     fig = create_figure(df, x_col, y_col, chart_type, color_col, symbol_col)
-    table_cols, table_data = create_data_table(df)
-    stats_out = perform_statistical_analysis(df)
-
-    # Если тип графика heatmap, corr_fig = fig
-    if chart_type == 'heatmap':
-        corr_fig = fig
-    else:
-        numeric_df = df.select_dtypes(include=['number'])
-        if numeric_df.shape[1] >= 2:
-            corr = numeric_df.corr()
-            corr_fig = go.Figure(data=go.Heatmap(
-                z=corr.values,
-                x=corr.columns,
-                y=corr.columns,
-                colorscale='Viridis',
-                colorbar=dict(title="Корр.")
-            ))
-            corr_fig.update_layout(title="Корреляционная матрица")
-        else:
-            corr_fig = go.Figure().update_layout(title="Недостаточно числовых данных для корреляции.")
-
-    reg_out = perform_regression_analysis(df, x_col, y_col, chart_type)
-    forecast_out = perform_forecast(df, date_col, y_col, forecast_period, freq)
+    graph_source = {
+        'dataset_id': dataset_id, 'sheets': sheet_names, 'filters': filters or {},
+        'x_col': x_col, 'y_col': y_col, 'chart_type': chart_type,
+        'color_col': color_col, 'symbol_col': symbol_col,
+        'reduced': len(df) > CHART_POINT_THRESHOLD,
+    }
+    table_cols = create_data_table(df)
+    table_source = {'dataset_id': dataset_id, 'sheets': sheet_names, 'filters': filters or {}}
 
-    # Скачивание CSV
-    if df.empty:
-        csv_str = ""
-    else:
-        df_download = df.copy()
-        date_columns = df_download.select_dtypes(include=['datetime', 'datetimetz']).columns
-        for c in date_columns:
-            df_download[c] = df_download[c].dt.strftime('%d.%m.%Y')
-        csv_data = df_download.to_csv(index=False, encoding='utf-8')
-        csv_str = "data:text/csv;charset=utf-8," + base64.b64encode(csv_data.encode()).decode()
+    # Ссылки на выгрузку: файл собирается маршрутом /export только при скачивании
+    download_hrefs = ["", "", ""] if df.empty else [
+        export_url(dataset_id, sheet_names, filters, fmt) for fmt in ('csv', 'parquet', 'xlsx')
+    ]
 
     return (
         fig,
-        table_cols, table_data,
-        stats_out,
-        corr_fig,
-        reg_out,
-        forecast_out,
-        csv_str,
+        graph_source,
+        table_cols, table_source, 0,
+        *download_hrefs,
         data_info_text
     )
 
+# Статистика, корреляция, регрессия и прогноз — фоновой задачей
+@app.callback(
+    Output('stats-output', 'children'),
+    Output('correlation-heatmap', 'figure'),
+    Output('regression-output', 'children'),
+    Output('forecast-output', 'children'),
+    Input('update-button', 'n_clicks'),
+    State('stored-data', 'data'),
+    State('sheet-dropdown', 'value'),
+    State('filters-store', 'data'),
+    State('x-axis-dropdown', 'value'),
+    State('y-axis-dropdown', 'value'),
+    State('chart-type-dropdown', 'value'),
+    State('forecast-period', 'value'),
+    State('date-column-dropdown', 'value'),
+    State('forecast-freq', 'value'),
+    background=True,
+    running=[
+        (Output('update-button', 'disabled'), True, False),
+        (Output('cancel-analysis-button', 'disabled'), False, True),
+    ],
+    cancel=[Input('cancel-analysis-button', 'n_clicks')],
+    progress=[Output('analysis-progress', 'value'), Output('analysis-progress', 'label')],
+    prevent_initial_call=True
+)
+def analysis_callback(set_progress, n_clicks, dataset_id, sheet_names, filters,
+                      x_col, y_col, chart_type, forecast_period, date_col, freq):
+    if not n_clicks or not dataset_id or not sheet_names:
+        raise PreventUpdate
+    set_progress((5, "Подготовка данных"))
+    df = get_filtered_data(dataset_id, sheet_names, filters or {})
+    if df is None or df.empty:
+        set_progress((100, "Нет данных"))
+        return dbc.Alert('Нет данных.', color='danger'), go.Figure(), html.Div(), html.Div()
+
+    set_progress((20, "Статистика"))
+    stats_out = perform_statistical_analysis(df)
+    set_progress((35, "Корреляция"))
+    corr_fig = create_correlation_figure(df)
+    set_progress((50, "Регрессия"))
+    reg_out = perform_regression_analysis(df, x_col, y_col, chart_type)
+    set_progress((70, "Прогноз"))
+    model_key = prophet_model_key(dataset_id, sheet_names, filters, date_col, y_col, freq)
+    forecast_out = perform_forecast(df, date_col, y_col, forecast_period, freq, model_key=model_key)
+    set_progress((100, "Готово"))
+    return stats_out, corr_fig, reg_out, forecast_out
+
+# Приближение на большом графике: перестраиваем по видимому диапазону
+@app.callback(
+    Output('data-graph', 'figure', allow_duplicate=True),
+    Input('data-graph', 'relayoutData'),
+    State('graph-source', 'data'),
+    prevent_initial_call=True
+)
+def zoom_graph_callback(relayout_data, source):
+    if not relayout_data or not source or not source.get('reduced'):
+        raise PreventUpdate
+    x_range = relayout_range(relayout_data, 'xaxis')
+    y_range = relayout_range(relayout_data, 'yaxis')
+    if x_range is None and y_range is None and not relayout_data.get('xaxis.autorange'):
+        raise PreventUpdate
+    df = get_filtered_data(source['dataset_id'], source['sheets'], source.get('filters') or {})
+    fig = create_figure(
+        df, source['x_col'], source['y_col'], source['chart_type'],
+        source['color_col'], source['symbol_col'],
+        x_range=x_range, y_range=y_range
+    )
+    if x_range:
+        fig.update_xaxes(range=x_range)
+    if y_range:
+        fig.update_yaxes(range=y_range)
+    return fig
+
 # Машинное обучение: простая линейная регрессия
 @app.callback(
     Output('ml-output', 'children'),
@@ -1345,15 +2860,17 @@ def update_graph(n_clicks, stored_data, sheet_names, filters,
     State('sheet-dropdown', 'value'),
     State('filters-store', 'data'),
     State('x-axis-dropdown', 'value'),
-    State('y-axis-dropdown', 'value')
+    State('y-axis-dropdown', 'value'),
+    background=True,
+    running=[(Output('ml-button', 'disabled'), True, False)],
+    prevent_initial_call=True
 )
-def ml_callback(n_clicks, test_size, stored_data, sheet_names, filters, x_col, y_col):
+def ml_callback(n_clicks, test_size, dataset_id, sheet_names, filters, x_col, y_col):
     if not n_clicks:
         raise PreventUpdate
-    if not stored_data or not sheet_names:
+    if not dataset_id or not sheet_names:
         return dbc.Alert("Загрузите файл и выберите листы.", color="warning")
-    df = combine_data(stored_data, sheet_names)
-    df = apply_all_filters(df, filters or {})
+    df = get_filtered_data(dataset_id, sheet_names, filters or {})
     return perform_machine_learning(df, x_col, y_col, test_size)
 
 # Машинное обучение: Random Forest
@@ -1365,15 +2882,17 @@ def ml_callback(n_clicks, test_size, stored_data, sheet_names, filters, x_col, y
     State('sheet-dropdown', 'value'),
     State('filters-store', 'data'),
     State('x-axis-dropdown', 'value'),
-    State('y-axis-dropdown', 'value')
+    State('y-axis-dropdown', 'value'),
+    background=True,
+    running=[(Output('rf-button', 'disabled'), True, False)],
+    prevent_initial_call=True
 )
-def rf_callback(n_clicks, test_size, stored_data, sheet_names, filters, x_col, y_col):
+def rf_callback(n_clicks, test_size, dataset_id, sheet_names, filters, x_col, y_col):
     if not n_clicks:
         raise PreventUpdate
-    if not stored_data or not sheet_names:
+    if not dataset_id or not sheet_names:
         return dbc.Alert("Сначала загрузите файл и выберите листы.", color="warning")
-    df = combine_data(stored_data, sheet_names)
-    df = apply_all_filters(df, filters or {})
+    df = get_filtered_data(dataset_id, sheet_names, filters or {})
     return perform_random_forest_regression(df, x_col, y_col, test_size)
 
 # Кластеризация
@@ -1384,16 +2903,39 @@ def rf_callback(n_clicks, test_size, stored_data, sheet_names, filters, x_col, y
     State('sheet-dropdown', 'value'),
     State('filters-store', 'data'),
     State('cluster-columns-dropdown', 'value'),
-    State('num-clusters', 'value')
+    State('num-clusters', 'value'),
+    State('ml-large-mode', 'value'),
+    background=True,
+    running=[(Output('cluster-button', 'disabled'), True, False)],
+    prevent_initial_call=True
 )
-def cluster_callback(n_clicks, stored_data, sheet_names, filters, selected_cols, n_clusters):
+def cluster_callback(n_clicks, dataset_id, sheet_names, filters, selected_cols, n_clusters, large_mode):
     if not n_clicks:
         raise PreventUpdate
-    if not stored_data or not sheet_names:
+    if not dataset_id or not sheet_names:
         return dbc.Alert("Нет данных для кластеризации.", color="warning")
-    df = combine_data(stored_data, sheet_names)
-    df = apply_all_filters(df, filters or {})
-    return perform_clustering(df, selected_cols, n_clusters)
+    df = get_filtered_data(dataset_id, sheet_names, filters or {})
+    return perform_clustering(df, selected_cols, n_clusters, large_mode)
+
+# Подбор числа кластеров (локоть и силуэт)
+@app.callback(
+    Output('cluster-sweep-output', 'children'),
+    Input('cluster-sweep-button', 'n_clicks'),
+    State('stored-data', 'data'),
+    State('sheet-dropdown', 'value'),
+    State('filters-store', 'data'),
+    State('cluster-columns-dropdown', 'value'),
+    background=True,
+    running=[(Output('cluster-sweep-button', 'disabled'), True, False)],
+    prevent_initial_call=True
+)
+def cluster_sweep_callback(n_clicks, dataset_id, sheet_names, filters, selected_cols):
+    if not n_clicks:
+        raise PreventUpdate
+    if not dataset_id or not sheet_names:
+        return dbc.Alert("Нет данных для подбора числа кластеров.", color="warning")
+    df = get_filtered_data(dataset_id, sheet_names, filters or {})
+    return perform_cluster_sweep(df, selected_cols)
 
 # PCA
 @app.callback(
@@ -1402,20 +2944,27 @@ def cluster_callback(n_clicks, stored_data, sheet_names, filters, selected_cols,
     State('stored-data', 'data'),
     State('sheet-dropdown', 'value'),
     State('filters-store', 'data'),
-    State('pca-components', 'value')
+    State('pca-components', 'value'),
+    State('ml-large-mode', 'value'),
+    background=True,
+    running=[(Output('pca-button', 'disabled'), True, False)],
+    prevent_initial_call=True
 )
-def pca_callback(n_clicks, stored_data, sheet_names, filters, n_components):
+def pca_callback(n_clicks, dataset_id, sheet_names, filters, n_components, large_mode):
     if not n_clicks:
         raise PreventUpdate
-    if not stored_data or not sheet_names:
+    if not dataset_id or not sheet_names:
         return dbc.Alert("Нет данных для PCA.", color="warning")
-    df = combine_data(stored_data, sheet_names)
-    df = apply_all_filters(df, filters or {})
-    return perform_pca(df, n_components)
+    df = get_filtered_data(dataset_id, sheet_names, filters or {})
+    return perform_pca(df, n_components, large_mode)
 
 # Расширенный поиск по слову
 @app.callback(
     Output('search-output', 'children'),
+    Output('search-table', 'columns'),
+    Output('search-table-source', 'data'),
+    Output('search-table', 'page_current'),
+    Output('search-table-container', 'style'),
     Input('search-button', 'n_clicks'),
     State('stored-data', 'data'),
     State('sheet-dropdown', 'value'),
@@ -1427,18 +2976,64 @@ def pca_callback(n_clicks, stored_data, sheet_names, filters, n_components):
     State('condition-operator-dropdown', 'value'),
     State('condition-value-input', 'value')
 )
-def search_word_callback(n_clicks, stored_data, sheet_names, filters, search_word, search_cols, sum_cols, condition_col, condition_op, condition_val):
+def search_word_callback(n_clicks, dataset_id, sheet_names, filters, search_word, search_cols, sum_cols, condition_col, condition_op, condition_val):
     if not n_clicks:
         raise PreventUpdate
-    if not stored_data or not sheet_names:
-        return dbc.Alert("Сначала загрузите Excel-файл и выберите листы.", color="warning")
+    hidden = {'display': 'none'}
+    if not dataset_id or not sheet_names:
+        return dbc.Alert("Сначала загрузите Excel-файл и выберите листы.", color="warning"), [], None, 0, hidden
     
-    df = combine_data(stored_data, sheet_names)
-    df = apply_all_filters(df, filters or {})
+    df = get_filtered_data(dataset_id, sheet_names, filters or {})
     if df is None or df.empty:
-        return dbc.Alert("Нет данных после фильтрации — поиск невозможен.", color="danger")
+        return dbc.Alert("Нет данных после фильтрации — поиск невозможен.", color="danger"), [], None, 0, hidden
     
-    return perform_search_by_word(df, search_word, search_cols, sum_cols, condition_col, condition_op, condition_val)
+    text_index = get_text_index(dataset_id, sheet_names)
+    summary, rows_found = perform_search_by_word(
+        df, search_word, search_cols, sum_cols, condition_col, condition_op, condition_val, text_index
+    )
+    if not rows_found:
+        return summary, [], None, 0, hidden
+    source = {
+        'dataset_id': dataset_id,
+        'sheets': sheet_names,
+        'filters': filters or {},
+        'search': {
+            'search_word': search_word,
+            'search_cols': search_cols,
+            'condition_col': condition_col,
+            'condition_op': condition_op,
+            'condition_val': condition_val,
+        },
+    }
+    return summary, create_data_table(df), source, 0, {}
+
+# Страница основной таблицы: сортировка, фильтр и пагинация на сервере
+@app.callback(
+    Output('data-table', 'data'),
+    Output('data-table', 'page_count'),
+    Input('table-source', 'data'),
+    Input('data-table', 'page_current'),
+    Input('data-table', 'page_size'),
+    Input('data-table', 'sort_by'),
+    Input('data-table', 'filter_query')
+)
+def data_table_page_callback(source, page_current, page_size, sort_by, filter_query):
+    data, page_count, _ = table_page(source, page_current, page_size, sort_by, filter_query)
+    return data, page_count
+
+# Страница таблицы результатов поиска
+@app.callback(
+    Output('search-table', 'data'),
+    Output('search-table', 'page_count'),
+    Input('search-table-source', 'data'),
+    Input('search-table', 'page_current'),
+    Input('search-table', 'page_size'),
+    Input('search-table', 'sort_by'),
+    Input('search-table', 'filter_query')
+)
+def search_table_page_callback(source, page_current, page_size, sort_by, filter_query):
+    data, page_count, _ = table_page(source, page_current, page_size, sort_by, filter_query)
+    return data, page_count
 
 # ------------------------------------------------------------------------------
 # ЗАПУСК
@@ -0,0 +1,340 @@
+# test_app.py
+
+import io
+import os
+import tempfile
+import unittest
+from collections import OrderedDict
+from pathlib import Path
+from unittest import mock
+import numpy as np
+import pandas as pd
+from app import (
+    FrameCache,
+    infer_sheet_schema,
+    sidebar_filters_mask,
+    lttb_indices,
+    stratified_sample,
+    normalize_text,
+    TextIndex,
+    search_rows,
+    parquet_export_plan,
+    _stream_csv,
+    _stream_parquet,
+    table_query_mask,
+    table_page,
+    _get_table_view,
+)
+
+
+class TestInferSheetSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'num': ['1', '2.5', None, '4'],
+            'ru_date': ['01.02.2023', '15.03.2023', None, '31.12.2023'],
+            'iso_date': ['2023-02-01', '2023-03-15', '2023-12-31', None],
+            'kind': ['a', 'b', 'a', 'b'],
+            'text': ['x', 'y', 'z', 'w'],
+            'flag': [True, False, True, None],
+            'ready': [1, 2, 3, 4],
+            'code': ['00123', '045', '7', '8'],
+            'phone': ['79991234567', '89001234567', None, '8800123456789012'],
+        })
+
+    def test_numeric_text_becomes_number(self):
+        """
+        Числа, записанные текстом, приводятся к float; пропуски остаются NaN.
+        """
+        df, schema = infer_sheet_schema(self.df)
+        self.assertEqual(schema['num'], 'float64')
+        np.testing.assert_array_equal(df['num'].to_numpy(), [1.0, 2.5, np.nan, 4.0])
+
+    def test_dates_day_first_and_iso(self):
+        """
+        ДД.ММ.ГГГГ читается с днём впереди, ISO — как есть.
+        """
+        df, schema = infer_sheet_schema(self.df)
+        self.assertTrue(schema['ru_date'].startswith('datetime64'))
+        self.assertTrue(schema['iso_date'].startswith('datetime64'))
+        self.assertEqual(df['ru_date'][0], pd.Timestamp(2023, 2, 1))
+        self.assertEqual(df['iso_date'][1], pd.Timestamp(2023, 3, 15))
+        self.assertTrue(pd.isna(df['ru_date'][2]))
+
+    def test_identifiers_stay_text(self):
+        """
+        Коды с ведущим нулём и номера длиннее 15 цифр не превращаются в числа.
+        """
+        df, schema = infer_sheet_schema(self.df)
+        self.assertNotEqual(schema['code'], 'float64')
+        self.assertEqual(list(df['code'].astype(str)), ['00123', '045', '7', '8'])
+        self.assertEqual(schema['phone'], 'object')
+        self.assertEqual(df['phone'][3], '8800123456789012')
+
+    def test_repeated_text_becomes_category(self):
+        df, schema = infer_sheet_schema(self.df)
+        self.assertEqual(schema['kind'], 'category')
+        self.assertEqual(schema['text'], 'object')
+
+    def test_bool_and_typed_columns_untouched(self):
+        """
+        Логические значения не превращаются в числа, готовые типы не меняются.
+        """
+        df, schema = infer_sheet_schema(self.df)
+        self.assertEqual(schema['flag'], 'object')
+        self.assertEqual(schema['ready'], 'int64')
+        self.assertEqual(list(df['flag'][:3]), [True, False, True])
+
+
+class TestSidebarFiltersMask(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'a': [1.0, 2.0, 3.0, np.nan, 5.0],
+            'b': [10, 20, 5, 30, 40],
+            'name': ['x', 'y', 'z', 'x', 'y'],
+            'day': pd.to_datetime(['2023-01-01', '2023-01-02', '2023-01-03', '2023-01-04', '2023-01-05']),
+        })
+
+    def test_no_filters(self):
+        self.assertIsNone(sidebar_filters_mask(self.df, {}))
+        self.assertIsNone(sidebar_filters_mask(self.df, {'x_col': 'a'}))
+
+    def test_range_and_advanced_filter(self):
+        """
+        Диапазоны по X/Y и доп. условие adv_col > adv_val объединяются через И; NaN не проходит.
+        """
+        filters = {'x_col': 'a', 'x_min': 2, 'x_max': 5, 'adv_col': 'b', 'adv_val': 15}
+        expected = [False, True, False, False, True]
+        np.testing.assert_array_equal(sidebar_filters_mask(self.df, filters), expected)
+        with mock.patch('app.numexpr', None):
+            np.testing.assert_array_equal(sidebar_filters_mask(self.df, filters), expected)
+
+    def test_advanced_filter_ignores_text_column(self):
+        self.assertIsNone(sidebar_filters_mask(self.df, {'adv_col': 'name', 'adv_val': 1}))
+
+    def test_date_range(self):
+        filters = {'y_col': 'day', 'y_min': '2023-01-02', 'y_max': '2023-01-04'}
+        np.testing.assert_array_equal(
+            sidebar_filters_mask(self.df, filters), [False, True, True, True, False]
+        )
+
+
+class TestTableQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame(
+            {
+                'b': [10, 20, 5, 30, 40],
+                'name': ['x', 'Yy', 'x', 'x', 'yY'],
+                'day': pd.to_datetime(['2023-01-01', '2023-02-02', '2023-01-03', '2023-03-04', '2023-01-05']),
+            },
+            index=[7, 7, 3, 1, 0],
+        )
+        self.source = {'dataset_id': 'ds', 'sheets': ['Лист1'], 'filters': {}}
+        patcher = mock.patch('app._table_views', OrderedDict())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_filter_query_parts(self):
+        """
+        Сравнения, contains без учёта регистра, datestartswith и кавычки; условия объединяются через И.
+        """
+        np.testing.assert_array_equal(table_query_mask(self.df, '{b} > 15'), [False, True, False, True, True])
+        np.testing.assert_array_equal(table_query_mask(self.df, '{name} icontains yy'), [False, True, False, False, True])
+        np.testing.assert_array_equal(table_query_mask(self.df, '{day} datestartswith 2023-01'), [True, False, True, False, True])
+        np.testing.assert_array_equal(
+            table_query_mask(self.df, '{name} = "x" && {b} >= 10'), [True, False, False, True, False]
+        )
+
+    def test_unknown_parts_ignored(self):
+        np.testing.assert_array_equal(table_query_mask(self.df, '{nope} > 1 && мусор'), [True] * 5)
+        np.testing.assert_array_equal(table_query_mask(self.df, None), [True] * 5)
+
+    def test_page_sorted_and_filtered(self):
+        """
+        Фильтр и сортировка работают по позициям строк: повторяющиеся метки индекса не мешают.
+        """
+        with mock.patch('app.get_filtered_data', return_value=self.df):
+            sort_by = [{'column_id': 'b', 'direction': 'desc'}]
+            rows, page_count, total = table_page(self.source, 0, 2, sort_by, '{name} = x')
+            self.assertEqual([row['b'] for row in rows], [30, 10])
+            self.assertEqual((page_count, total), (2, 3))
+            rows, _, _ = table_page(self.source, 1, 2, sort_by, '{name} = x')
+            self.assertEqual([row['b'] for row in rows], [5])
+
+    def test_view_shares_frame_and_bounds_caches(self):
+        """
+        Вид держит сам отфильтрованный кадр, а маски и перестановки — в ограниченном LRU.
+        """
+        with mock.patch('app.get_filtered_data', return_value=self.df), mock.patch('app.TABLE_VIEW_CACHE_LIMIT', 2):
+            for value in (5, 10, 20, 30):
+                table_page(self.source, 0, 10, None, f'{{b}} > {value}')
+            view = _get_table_view(self.source)
+        self.assertIs(view['df'], self.df)
+        self.assertEqual(list(view['masks']), ['{b} > 20', '{b} > 30'])
+        self.assertLessEqual(len(view['orders']), 2)
+
+
+class TestLttbIndices(unittest.TestCase):
+
+    def test_short_series_returned_whole(self):
+        x = np.arange(10, dtype=float)
+        np.testing.assert_array_equal(lttb_indices(x, x, 10), np.arange(10))
+        np.testing.assert_array_equal(lttb_indices(x, x, 50), np.arange(10))
+        np.testing.assert_array_equal(lttb_indices(x, x, 2), np.arange(10))
+
+    def test_keeps_ends_and_spike(self):
+        """
+        Прореженный ряд сохраняет первую и последнюю точки и одиночный выброс.
+        """
+        x = np.arange(1000, dtype=float)
+        y = np.zeros(1000)
+        y[500] = 100.0
+        idx = lttb_indices(x, y, 50)
+        self.assertLessEqual(len(idx), 50)
+        self.assertEqual(idx[0], 0)
+        self.assertEqual(idx[-1], 999)
+        self.assertIn(500, idx)
+        self.assertTrue(np.all(np.diff(idx) > 0))
+
+
+class TestStratifiedSample(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame({
+            'a': rng.random(10000),
+            'b': rng.normal(size=10000),
+            'c': rng.integers(0, 5, size=10000),
+        })
+
+    def test_small_frame_returned_whole(self):
+        small = self.df.head(100)
+        self.assertIs(stratified_sample(small, 1000), small)
+
+    def test_size_and_quartile_shares(self):
+        """
+        Выборка около n_rows строк без повторов, доли квартилей столбцов страт сохраняются.
+        """
+        sample = stratified_sample(self.df, 1000)
+        self.assertAlmostEqual(len(sample), 1000, delta=20)
+        self.assertTrue(sample.index.is_unique)
+        self.assertTrue(sample.index.isin(self.df.index).all())
+        for col in ('a', 'b'):
+            quartiles = pd.qcut(self.df[col].rank(method='first'), q=4, labels=False)
+            shares = quartiles.loc[sample.index].value_counts(normalize=True)
+            for share in shares:
+                self.assertAlmostEqual(share, 0.25, delta=0.01)
+
+    def test_reproducible(self):
+        first = stratified_sample(self.df, 500, strata_cols=['c'])
+        second = stratified_sample(self.df, 500, strata_cols=['c'])
+        self.assertTrue(first.index.equals(second.index))
+
+
+class TestTextIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'item': ['Золотое кольцо', 'серебро', None, 'кольцо  ЗОЛОТОЕ', 'Ёлочная игрушка'],
+            'note': ['', 'лом золота', 'nan', None, 'ель'],
+        })
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text('  Ёлка   ЗЕЛЁНАЯ '), 'елка зеленая')
+
+    def test_search_case_and_yo_insensitive(self):
+        index = TextIndex(self.df)
+        np.testing.assert_array_equal(index.search('ЗОЛОТ', ['item']), [0, 3])
+        np.testing.assert_array_equal(index.search('елочн', ['item']), [4])
+
+    def test_search_several_columns_and_short_query(self):
+        """
+        Совпадение в любом из столбцов; запрос короче триграммы ищется полным просмотром.
+        """
+        index = TextIndex(self.df)
+        np.testing.assert_array_equal(index.search('золот', ['item', 'note']), [0, 1, 3])
+        np.testing.assert_array_equal(index.search('ел', ['note']), [4])
+        self.assertEqual(len(index.search('платина', ['item'])), 0)
+
+    def test_missing_values_do_not_match(self):
+        index = TextIndex(self.df)
+        np.testing.assert_array_equal(index.search('nan', ['item', 'note']), [2])
+
+    def test_matches_substring_scan(self):
+        rng = np.random.default_rng(1)
+        words = np.array(['кольцо', 'серьги', 'Цепь', 'часы', 'браслет', 'ЦЕПОЧКА', 'монета'])
+        df = pd.DataFrame({'desc': [' '.join(rng.choice(words, size=2)) for _ in range(500)]})
+        index = TextIndex(df)
+        for query in ('цеп', 'сы бр', 'ет', 'кольцо часы'):
+            expected = np.flatnonzero(df['desc'].map(normalize_text).str.contains(query, regex=False))
+            np.testing.assert_array_equal(index.search(query, ['desc']), expected)
+
+    def test_search_rows_on_filtered_subset(self):
+        """
+        Индекс объединённого кадра годится для его подмножества: лишние строки не попадают.
+        """
+        index = TextIndex(self.df)
+        subset = self.df.iloc[[1, 3, 4]]
+        found = search_rows(subset, 'золот', ['item', 'note'], text_index=index)
+        self.assertEqual(list(found.index), [1, 3])
+
+
+class TestExportStreams(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'mixed': ['a', 1, 2.5, None, 'b'],
+            'late_text': [None, None, None, None, 'x'],
+            'value': [1.0, 2.0, np.nan, 4.0, 5.0],
+            'day': pd.to_datetime(['2023-01-01', '2023-01-02', '2023-01-03', '2023-01-04', '2023-01-05']),
+        })
+
+    def test_csv_mixed_types(self):
+        with mock.patch('app.EXPORT_CHUNK_ROWS', 2):
+            text = ''.join(_stream_csv(self.df))
+        exported = pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
+        self.assertEqual(len(exported), 5)
+        self.assertEqual(list(exported['mixed']), ['a', '1', '2.5', '', 'b'])
+        self.assertEqual(exported['day'][0], '01.01.2023')
+
+    def test_parquet_mixed_types_and_late_text(self):
+        """
+        Смешанный object-столбец и столбец, пустой в первой порции, пишутся текстом без обрыва файла.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        plan = parquet_export_plan(self.df)
+        schema, text_cols = plan
+        self.assertEqual(text_cols, ['mixed', 'late_text'])
+        self.assertEqual(schema.field('late_text').type, pa.string())
+        with mock.patch('app.EXPORT_CHUNK_ROWS', 2):
+            data = b''.join(_stream_parquet(self.df, plan))
+        table = pq.read_table(io.BytesIO(data))
+        self.assertEqual(table.column('mixed').to_pylist(), ['a', '1', '2.5', None, 'b'])
+        self.assertEqual(table.column('late_text').to_pylist(), [None, None, None, None, 'x'])
+        self.assertEqual(table.num_rows, 5)
+
+
+class TestFrameCacheDisk(unittest.TestCase):
+
+    def test_disk_tier_keeps_budget(self):
+        """
+        Дисковый уровень удаляет давно не читавшиеся записи сверх бюджета, свежую запись оставляет.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            disk_dir = Path(tmp)
+            frame = pd.DataFrame({'a': np.arange(1000, dtype=float)})
+            cache = FrameCache(0, disk_dir, disk_max_bytes=1)
+            cache.get_or_build('old', lambda: frame)
+            old_files = list(disk_dir.iterdir())
+            self.assertEqual(len(old_files), 1)
+            os.utime(old_files[0], (1, 1))
+            cache.get_or_build('new', lambda: frame)
+            self.assertEqual([path.stem for path in disk_dir.iterdir()], ['new'])
+
+
+if __name__ == "__main__":
+    unittest.main()